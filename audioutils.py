@@ -0,0 +1,336 @@
+# -*- coding: utf8 -*-
+
+import io
+import os
+import mmap
+import wave
+import struct
+import threading
+import subprocess
+from shutil import copy, copyfileobj, which
+
+# ffmpeg muxer names for file extensions that differ from them
+FFMPEG_FORMATS = {
+        "aac": "adts",
+        "m4a": "ipod",
+        "wma": "asf"
+        }
+
+# Number of PCM frames copied at a time while joining WAV files
+BLOCK_FRAMES = 65536
+
+# Bytes handed to ffmpeg's stdin at a time when the source is held in memory
+PIPE_BLOCK_SIZE = 256*1024
+
+# MP3 frame header tables, indexed by the header's version bits (3 = MPEG 1, 2 = MPEG 2, 0 = MPEG 2.5)
+MP3_SAMPLE_RATES = {
+        3: (44100, 48000, 32000),
+        2: (22050, 24000, 16000),
+        0: (11025, 12000, 8000)
+        }
+
+# Bitrates in kbps, keyed by (MPEG 1?, layer)
+MP3_BITRATES = {
+        (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+        (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+        (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+        (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+        (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+        (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+        }
+
+
+def id3v2_size(header: bytes):
+    # Size of a leading ID3v2 tag (header included), 0 if there is none
+    if (len(header) < 10 or not header.startswith(b"ID3")):
+        return 0
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | (byte & 0x7f)
+    return size+10
+
+
+def open_audio(source):
+    # Audio is handed around either as a file path or as the encoded bytes themselves
+    if (isinstance(source, (bytes, bytearray, memoryview))):
+        return io.BytesIO(source)
+    return open(source, 'rb')
+
+
+def read_wav_header(wavfile):
+    # Walks the RIFF chunks instead of trusting the header sizes, which streaming writers leave as placeholders
+    file_size = wavfile.seek(0, 2)
+    wavfile.seek(0)
+    riff = wavfile.read(12)
+    if (len(riff) < 12 or riff[0:4] != b"RIFF" or riff[8:12] != b"WAVE"):
+        raise ValueError("Not a WAV file")
+    header = {}
+    while (True):
+        chunk = wavfile.read(8)
+        if (len(chunk) < 8):
+            raise ValueError("WAV file has no data chunk")
+        chunk_id, chunk_size = struct.unpack("<4sI", chunk)
+        if (chunk_id == b"fmt "):
+            channels, sample_rate, byte_rate, block_align, bits = struct.unpack("<HIIHH", wavfile.read(16)[2:16])
+            header.update(channels=channels, sample_rate=sample_rate, block_align=block_align, sample_width=bits//8)
+            wavfile.seek(chunk_size-16+(chunk_size & 1), 1)
+        elif (chunk_id == b"data"):
+            header["data_offset"] = wavfile.tell()
+            header["data_size"] = min(chunk_size, file_size-header["data_offset"])
+            if ("sample_rate" not in header):
+                raise ValueError("WAV file has no fmt chunk")
+            return header
+        else:
+            wavfile.seek(chunk_size+(chunk_size & 1), 1)
+
+
+def parse_mp3_frame_header(data, offset):
+    # (frame length, samples per frame, sample rate) of the frame starting at offset, None if there is no valid frame there
+    if (offset+4 > len(data) or data[offset] != 0xFF or (data[offset+1] & 0xE0) != 0xE0):
+        return None
+    version = (data[offset+1] >> 3) & 3
+    layer = 4-((data[offset+1] >> 1) & 3)
+    bitrate_index = data[offset+2] >> 4
+    sample_rate_index = (data[offset+2] >> 2) & 3
+    padding = (data[offset+2] >> 1) & 1
+    if (version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3):
+        return None
+    mpeg1 = (version == 3)
+    bitrate = MP3_BITRATES[(mpeg1, layer)][bitrate_index]*1000
+    sample_rate = MP3_SAMPLE_RATES[version][sample_rate_index]
+    if (layer == 1):
+        return ((12*bitrate//sample_rate+padding)*4, 384, sample_rate)
+    samples = 1152 if (layer == 2 or mpeg1) else 576
+    return (samples//8*bitrate//sample_rate+padding, samples, sample_rate)
+
+
+def read_mp3_vbr_frames(data, offset, frame_length):
+    # Frame count of a Xing/Info or VBRI header in the first frame, None when missing or not describing this whole file
+    mono = ((data[offset+3] >> 6) == 3)
+    if ((data[offset+1] >> 3) & 3 == 3):
+        side_info = 17 if mono else 32
+    else:
+        side_info = 9 if mono else 17
+    xing = offset+4+side_info
+    if (data[xing:xing+4] in (b"Xing", b"Info")):
+        flags = struct.unpack(">I", data[xing+4:xing+8])[0]
+        if (not flags & 1):
+            return None
+        frames = struct.unpack(">I", data[xing+8:xing+12])[0]
+        if (flags & 2):
+            stream_bytes = struct.unpack(">I", data[xing+12:xing+16])[0]
+            # Joined segments keep the first segment's header, which then only covers a fraction of the file
+            if (abs(stream_bytes-(len(data)-offset)) > frame_length*2):
+                return None
+        return frames
+    vbri = offset+36
+    if (data[vbri:vbri+4] == b"VBRI"):
+        return struct.unpack(">I", data[vbri+14:vbri+18])[0]
+    return None
+
+
+def iterate_mp3_frames(data):
+    # Yields (offset, frame length, samples, sample rate) of every audio frame, skipping tags and junk
+    offset = id3v2_size(data[0:10])
+    while (offset+4 <= len(data)):
+        frame = parse_mp3_frame_header(data, offset)
+        if (frame is None):
+            offset += 1
+            continue
+        yield (offset,)+frame
+        offset += frame[0]
+
+
+def get_mp3_duration(data):
+    frames = iterate_mp3_frames(data)
+    try:
+        offset, frame_length, samples, sample_rate = next(frames)
+    except StopIteration:
+        raise ValueError("No MP3 frames found")
+    vbr_frames = read_mp3_vbr_frames(data, offset, frame_length)
+    if (vbr_frames is not None):
+        return vbr_frames*samples*1000//sample_rate
+    total_samples = samples
+    for offset, frame_length, samples, sample_rate in frames:
+        total_samples += samples
+    return total_samples*1000//sample_rate
+
+
+def get_duration(source, audio_format=None):
+    # Length of WAV or MP3 audio in milliseconds, read from its headers without decoding it
+    if (audio_format is None):
+        audio_format = get_format(source)
+    with open_audio(source) as audiofile:
+        if (audio_format == "wav"):
+            header = read_wav_header(audiofile)
+            return header["data_size"]//header["block_align"]*1000//header["sample_rate"]
+        if (isinstance(source, str)):
+            # Mapped rather than read, so that long files are paged in and out instead of loaded whole
+            with mmap.mmap(audiofile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return get_mp3_duration(data)
+        return get_mp3_duration(audiofile.read())
+
+
+def write_joined_audio(segments, audio_format, output, block_frames=BLOCK_FRAMES):
+    # Copies the segments into output a block at a time, so that only one block of audio is in memory at once
+    if (audio_format == "wav"):
+        with wave.open(output, 'wb') as wavfile:
+            for i in range(len(segments)):
+                with wave.open(open_audio(segments[i]), 'rb') as segment:
+                    if (i == 0):
+                        wavfile.setparams(segment.getparams())
+                    while (True):
+                        frames = segment.readframes(block_frames)
+                        if (not frames):
+                            break
+                        wavfile.writeframes(frames)
+    else:
+        # MP3 streams are self-framing, so segments can be joined byte-wise once tags are dropped
+        for i in range(len(segments)):
+            with open_audio(segments[i]) as segment:
+                if (i != 0):
+                    segment.seek(id3v2_size(segment.read(10)))
+                copyfileobj(segment, output, block_frames*4)
+
+
+def join_audio(segments, audio_format):
+    # Joins the encoded segments into the encoded audio of the whole, in memory
+    output = io.BytesIO()
+    write_joined_audio(segments, audio_format, output)
+    return output.getvalue()
+
+
+def join_audio_file(segments, audio_format, output_path, block_frames=BLOCK_FRAMES):
+    # Joins the segments straight into output_path, for audio too long to be held in memory
+    root, extension = os.path.splitext(output_path)
+    temp_path = "%s.tmp%s"%(root, extension)
+    try:
+        with open(temp_path, 'wb') as audiofile:
+            write_joined_audio(segments, audio_format, audiofile, block_frames)
+        os.replace(temp_path, output_path)
+    except (OSError, EOFError, wave.Error):
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return output_path
+
+
+def get_block_frames(memory_budget, block_align=4):
+    # PCM frames per copied block: a small share of the memory budget, since the pipe and encoder buffers come on top of it
+    return max(memory_budget//(16*block_align), 1024)
+
+
+def write_audio(audio, output_path):
+    # Written under a temporary name first, so that output_path appears complete or not at all
+    root, extension = os.path.splitext(output_path)
+    temp_path = "%s.tmp%s"%(root, extension)
+    try:
+        with open(temp_path, 'wb') as audiofile:
+            audiofile.write(audio)
+        os.replace(temp_path, output_path)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return output_path
+
+
+def get_format(path):
+    return os.path.splitext(path)[1][1::].lower()
+
+
+def get_ffmpeg():
+    return which("ffmpeg") or which("avconv") or "ffmpeg"
+
+
+def feed_pipe(source, pipe):
+    try:
+        with open_audio(source) as audiofile:
+            while (True):
+                block = audiofile.read(PIPE_BLOCK_SIZE)
+                if (not block):
+                    break
+                pipe.write(block)
+    except (BrokenPipeError, ValueError):
+        # ffmpeg stopped reading: it failed or was cancelled, which the caller finds out from its exit status
+        pass
+    finally:
+        try:
+            pipe.close()
+        except BrokenPipeError:
+            pass
+
+
+def transcode_audio(source, output_path, output_format, input_format, progress=None, cancelled=None):
+    # ffmpeg reads the source a block at a time and encodes as it goes, so the decoded audio is never held in memory whole.
+    # progress(done, total) is called with milliseconds of audio encoded so far, cancelled() is checked on every report
+    try:
+        total = get_duration(source, input_format)
+    except (OSError, ValueError, struct.error):
+        total = None
+    root, extension = os.path.splitext(output_path)
+    temp_path = "%s.tmp%s"%(root, extension)
+    command = [get_ffmpeg(), "-hide_banner", "-loglevel", "error", "-y",
+               "-f", input_format, "-i", source if isinstance(source, str) else "pipe:0",
+               "-vn", "-f", FFMPEG_FORMATS.get(output_format, output_format),
+               "-progress", "pipe:1", "-nostats", temp_path]
+    process = subprocess.Popen(command, stdin=(subprocess.DEVNULL if isinstance(source, str) else subprocess.PIPE),
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    feeder = None
+    if (process.stdin is not None):
+        feeder = threading.Thread(target=feed_pipe, args=(source, process.stdin), daemon=True)
+        feeder.start()
+    try:
+        for line in process.stdout:
+            if (cancelled is not None and cancelled()):
+                process.kill()
+                break
+            # out_time_ms holds microseconds despite its name
+            if (line.startswith((b"out_time_us=", b"out_time_ms=")) and progress is not None and total is not None):
+                try:
+                    progress(min(int(line[line.index(b"=")+1::])//1000, total), total)
+                except ValueError:
+                    pass
+        errors = process.stderr.read().decode("UTF-8", "replace").strip()
+        process.wait()
+        if (feeder is not None):
+            feeder.join()
+        if (cancelled is not None and cancelled()):
+            return None
+        if (process.returncode != 0):
+            raise RuntimeError("ffmpeg could not export %s: %s"%(output_path, errors.splitlines()[-1] if errors else process.returncode))
+        os.replace(temp_path, output_path)
+    finally:
+        if (process.poll() is None):
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+    if (progress is not None and total is not None):
+        progress(total, total)
+    return output_path
+
+
+def export_audio(source, output_path, output_format=None, input_format=None, progress=None, cancelled=None):
+    # source is either a file path or the encoded audio itself, whose format must then be given
+    if (output_format is None):
+        output_format = get_format(output_path)
+    if (output_format == ""):
+        output_format = "mp3"
+    if (input_format is None):
+        input_format = get_format(source)
+    if (output_format == input_format):
+        if (isinstance(source, str)):
+            copy(source, output_path)
+        else:
+            write_audio(source, output_path)
+        return output_path
+    return transcode_audio(source, output_path, output_format, input_format, progress, cancelled)
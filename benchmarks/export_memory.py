@@ -0,0 +1,136 @@
+# -*- coding: utf8 -*-
+
+# Peak memory of synthesizing, joining and exporting speech of growing length:
+#
+#   python benchmarks/export_memory.py --minutes 5,15,30,60 --budget 16 --format ogg
+#
+# Every run happens in a fresh process, so that its peak RSS is its own. A tone stands in for the
+# TTS engine, one second of 22050 Hz mono audio per 15 characters of text, like pyttsx3's output.
+# Each length is run once with the given memory budget and once with the budget at its maximum,
+# which keeps the whole speech in memory the way it was before budgets existed. Without ffmpeg on
+# PATH the export is skipped and only synthesis and joining are measured. With --streaming the
+# segments are posted as the GUI receives them, and every message is held until the end like the
+# GUI holds the segments it plays.
+
+import os
+import sys
+import json
+import math
+import time
+import wave
+import struct
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SAMPLE_RATE = 22050
+CHARS_PER_SECOND = 15
+UNBOUNDED_BUDGET_MB = 4096
+
+
+def get_peak_rss_mb(who):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    if (sys.platform == "darwin"):
+        return peak/(1024*1024)
+    return peak/1024
+
+
+def make_tone_second():
+    samples = [int(8000*math.sin(2*math.pi*440*i/SAMPLE_RATE)) for i in range(SAMPLE_RATE)]
+    return struct.pack("<%dh"%SAMPLE_RATE, *samples)
+
+
+def run_child(minutes, budget, output_format, workdir, streaming=False):
+    from ttsworker import TTSWorker
+    from audioutils import export_audio
+
+    tone_second = make_tone_second()
+
+    class ToneWorker(TTSWorker):
+
+        def synthesize(self, text, index):
+            seconds = len(text)/CHARS_PER_SECOND
+            frames = tone_second*int(seconds)+tone_second[:int(seconds%1*SAMPLE_RATE)*2]
+            buffer = tempfile.SpooledTemporaryFile()
+            with wave.open(buffer, 'wb') as wavfile:
+                wavfile.setparams((1, 2, SAMPLE_RATE, 0, "NONE", "not compressed"))
+                wavfile.writeframes(frames)
+            buffer.seek(0)
+            return buffer.read()
+
+    sentence = "This sentence stands in for one line of a very long manual. "
+    text = sentence*(minutes*60*CHARS_PER_SECOND//len(sentence))
+    config = {
+                "APIInUse": "Pyttsx3",
+                "StreamingSynthesis": "1" if streaming else "0",
+                "MemoryBudgetMB": str(budget),
+                "Pyttsx3Speed": "150",
+                "Pyttsx3Volume": "67",
+                "Pyttsx3VoiceID": "0"
+             }
+
+    start_time = time.perf_counter()
+    worker = ToneWorker(text, config, os.path.join(workdir, "speech.wav"), None)
+    worker.run()
+    messages = worker.poll()
+    for message in messages:
+        if (message[0] == "error"):
+            raise message[1]
+    del messages
+    synthesis_time = time.perf_counter()-start_time
+
+    exported = False
+    if (shutil.which("ffmpeg") is not None):
+        export_audio(worker.output_path, os.path.join(workdir, "speech."+output_format), output_format)
+        exported = True
+
+    return {
+                "minutes": minutes,
+                "budget_mb": budget,
+                "streaming": streaming,
+                "speech_mb": round(os.path.getsize(worker.output_path)/(1024*1024), 1),
+                "peak_rss_mb": round(get_peak_rss_mb(resource.RUSAGE_SELF), 1),
+                "encoder_peak_rss_mb": round(get_peak_rss_mb(resource.RUSAGE_CHILDREN), 1) if exported else None,
+                "seconds": round(time.perf_counter()-start_time, 2),
+                "synthesis_seconds": round(synthesis_time, 2)
+           }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Peak memory of long speech synthesis and export.")
+    parser.add_argument("--minutes", default="5,15,30,60", help="comma separated speech lengths (default: 5,15,30,60)")
+    parser.add_argument("--budget", type=int, default=16, help="MemoryBudgetMB for the bounded runs (default: 16)")
+    parser.add_argument("--format", default="ogg", help="export format (default: ogg)")
+    parser.add_argument("--streaming", action="store_true", help="stream the segments to a stand-in for the GUI")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON lines")
+    parser.add_argument("--child", nargs=3, metavar=("MINUTES", "BUDGET", "DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if (args.child is not None):
+        print (json.dumps(run_child(int(args.child[0]), int(args.child[1]), args.format, args.child[2], args.streaming)))
+        return 0
+
+    results = []
+    for minutes in [int(value) for value in args.minutes.split(",")]:
+        for budget in (args.budget, UNBOUNDED_BUDGET_MB):
+            with tempfile.TemporaryDirectory() as workdir:
+                command = [sys.executable, os.path.abspath(__file__), "--format", args.format, "--child", str(minutes), str(budget), workdir]
+                if (args.streaming):
+                    command.append("--streaming")
+                output = subprocess.run(command, check=True, stdout=subprocess.PIPE).stdout
+            result = json.loads(output)
+            results.append(result)
+            if (args.json):
+                print (json.dumps(result))
+            else:
+                print ("%4d min  budget %4d MB  speech %7.1f MB  peak RSS %7.1f MB  %6.2f s"%(result["minutes"], result["budget_mb"], result["speech_mb"], result["peak_rss_mb"], result["seconds"]))
+    return 0
+
+
+if (__name__ == "__main__"):
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,77 @@
+# -*- coding: utf8 -*-
+
+# Throughput and failure handling of the GTTS client against the local stand-in API:
+#
+#   python benchmarks/gtts_throughput.py --concurrency 1,2,4,8 --latency 0.2 --failure-rate 0.1
+#
+# Every concurrency level synthesizes the same texts through a fresh client. Concurrency 1 without
+# retries is how the GTTS backend fetched segments before, one after another with a single failure
+# ending the text. A text counts as failed when one of its segments still fails after every retry.
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from gttsstandin import StandInServer
+from gttsclient import GTTSClient, GTTSClientError
+
+SENTENCE = "Toice reads this sentence aloud to measure how fast speech comes back from the API. "
+
+
+def run_client(server, text, texts, concurrency, rate, retries):
+    client = GTTSClient(concurrency, rate, retries, backoff=0.05, url=server.url)
+    failed = 0
+    start_time = time.perf_counter()
+    for i in range(texts):
+        try:
+            client.synthesize(text)
+        except GTTSClientError:
+            failed += 1
+    seconds = time.perf_counter()-start_time
+    client.close()
+    return {
+                "concurrency": concurrency,
+                "retries": retries,
+                "seconds": round(seconds, 3),
+                "segments_per_second": round(client.requests_sent/seconds, 1),
+                "requests": client.requests_sent,
+                "retried": client.retries_made,
+                "failed_texts": failed
+           }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Measure the GTTS client against a local stand-in of the API.")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="comma separated concurrency levels (default: 1,2,4,8)")
+    parser.add_argument("--rate", type=int, default=100, help="requests per second allowed by the token bucket (default: 100)")
+    parser.add_argument("--retries", type=int, default=3, help="retries per segment (default: 3)")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds the stand-in takes per request (default: 0.2)")
+    parser.add_argument("--failure-rate", type=float, default=0.1, help="share of requests the stand-in fails with 503 (default: 0.1)")
+    parser.add_argument("--max-inflight", type=int, default=0, help="requests at once before the stand-in answers 429 (default: no limit)")
+    parser.add_argument("--sentences", type=int, default=20, help="sentences per text (default: 20)")
+    parser.add_argument("--texts", type=int, default=3, help="texts synthesized per run (default: 3)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON lines")
+    args = parser.parse_args(argv)
+
+    server = StandInServer(latency=args.latency, failure_rate=args.failure_rate, max_inflight=args.max_inflight).start()
+    text = SENTENCE*args.sentences
+    runs = [(1, 0)]+[(int(value), args.retries) for value in args.concurrency.split(",")]
+    try:
+        for concurrency, retries in runs:
+            result = run_client(server, text, args.texts, concurrency, args.rate, retries)
+            if (args.json):
+                print (json.dumps(result))
+            else:
+                print ("concurrency %2d  retries %d  %7.2f s  %6.1f segments/s  %4d requests  %3d retried  %d/%d texts failed"%(result["concurrency"], result["retries"], result["seconds"], result["segments_per_second"], result["requests"], result["retried"], result["failed_texts"], args.texts))
+    finally:
+        server.stop()
+    return 0
+
+
+if (__name__ == "__main__"):
+    sys.exit(main(sys.argv[1:]))
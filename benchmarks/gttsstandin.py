@@ -0,0 +1,144 @@
+# -*- coding: utf8 -*-
+
+# A local stand-in for the GTTS API, so that the GTTS client can be measured and broken on purpose offline:
+#
+#   python benchmarks/gttsstandin.py --port 8765 --latency 0.2 --failure-rate 0.1
+#
+# It answers the batchexecute requests gtts makes with silent MP3 frames, one second per 15 characters
+# of text, after --latency seconds. --failure-rate of the requests get a 503, and requests beyond
+# --max-inflight at once get a 429, like the real API does when it is asked too much.
+
+import sys
+import json
+import time
+import random
+import base64
+import argparse
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARS_PER_SECOND = 15
+
+# A silent MPEG 1 layer III frame at 128 kbps and 44.1 kHz, 38.28 of them per second
+MP3_FRAME = b"\xff\xfb\x90\x00"+b"\x00"*413
+FRAMES_PER_SECOND = 44100/1152
+
+
+def get_text(body):
+    # The text gtts packs into f.req=[[["jQ1olc","[text, lang, speed, null]",null,"generic"]]]
+    rpc = json.loads(urllib.parse.parse_qs(body)["f.req"][0])
+    return json.loads(rpc[0][0][1])[0]
+
+
+def make_response(audio):
+    payload = json.dumps([["wrb.fr", "jQ1olc", json.dumps([base64.b64encode(audio).decode("ascii")]), None, None, None, "generic"]],
+                         separators=(",", ":"))
+    return (")]}'\n\n%d\n%s\n"%(len(payload), payload)).encode("UTF-8")
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+
+    def reply(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", "0"))).decode("UTF-8")
+        with server.lock:
+            server.requests += 1
+            server.inflight += 1
+            overloaded = (server.max_inflight > 0 and server.inflight > server.max_inflight)
+            failing = (random.random() < server.failure_rate)
+        try:
+            if (overloaded):
+                server.count("rate_limited")
+                self.reply(429, headers={"Retry-After": "0"})
+                return
+            time.sleep(server.latency)
+            if (failing):
+                server.count("failed")
+                self.reply(503)
+                return
+            try:
+                text = get_text(body)
+            except (KeyError, IndexError, ValueError):
+                self.reply(400)
+                return
+            server.count("answered")
+            self.reply(200, make_response(MP3_FRAME*max(int(len(text)/CHARS_PER_SECOND*FRAMES_PER_SECOND), 1)),
+                       {"Content-Type": "application/json; charset=utf-8"})
+        finally:
+            with server.lock:
+                server.inflight -= 1
+
+
+class StandInServer(ThreadingHTTPServer):
+
+    # Serves on a thread of its own from start() to stop(); url is what GTTSClient should post to
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, failure_rate=0.0, max_inflight=0):
+
+        super().__init__(("127.0.0.1", port), StandInHandler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.max_inflight = max_inflight
+        self.url = "http://127.0.0.1:%d/_/TranslateWebserverUi/data/batchexecute"%self.server_address[1]
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.inflight = 0
+        self.counts = {"answered": 0, "failed": 0, "rate_limited": 0}
+        self.thread = None
+
+
+    def count(self, outcome):
+        with self.lock:
+            self.counts[outcome] += 1
+
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the GTTS API.")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before every answer (default: 0.2)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of requests answered with 503 (default: 0)")
+    parser.add_argument("--max-inflight", type=int, default=0, help="requests at once before answering 429, 0 for no limit (default: 0)")
+    args = parser.parse_args(argv)
+
+    server = StandInServer(args.port, args.latency, args.failure_rate, args.max_inflight)
+    print ("Serving the GTTS stand-in at %s"%server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    return 0
+
+
+if (__name__ == "__main__"):
+    sys.exit(main(sys.argv[1:]))
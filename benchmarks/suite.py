@@ -0,0 +1,210 @@
+# -*- coding: utf8 -*-
+
+# Timings of Toice's core paths against the offline tone engine, so that they can run on a headless box:
+#
+#   python benchmarks/suite.py --output results.json
+#   python benchmarks/suite.py --compare baseline.json --threshold 0.15
+#
+# generation_*     the worker behind playpause_cb: time to the first playable segment and to the saved cache entry
+# cache_hit/miss   CachedSynthesizer for a text it has and has not synthesized before
+# probe_*          the duration probes and seek index play_audio relies on, for WAV and MP3
+# export_*         export_audio from a cache entry to every format save_cb offers (skipped without ffmpeg)
+#
+# Every case reports the median of --repeat runs in seconds. --compare exits with status 1 when a case is
+# slower than the baseline by more than --threshold and by more than --min-delta seconds.
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from toneengine import ToneEngine, write_tone
+from toiceconfig import DEFAULT_CONFIG, EXPORT_FORMATS
+from ttsworker import TTSWorker, CachedSynthesizer
+from ttscache import TTSCache
+from ttsengine import Pyttsx3Backend
+from audioutils import export_audio, get_duration
+from seekindex import build_seek_index
+
+SENTENCE = "Toice reads this sentence aloud to measure how long speech takes to come out. "
+
+# A silent MPEG 1 layer III frame at 128 kbps and 44.1 kHz
+MP3_FRAME = b"\xff\xfb\x90\x00"+b"\x00"*413
+
+
+class TimedWorker(TTSWorker):
+
+    # Records when the first segment and the finished speech were posted
+
+    def post(self, *message):
+        if (message[0] == "segment" and not hasattr(self, "first_segment_time")):
+            self.first_segment_time = time.perf_counter()
+        elif (message[0] == "saved"):
+            self.saved_time = time.perf_counter()
+        super().post(*message)
+
+
+def get_config(streaming):
+    config = DEFAULT_CONFIG.copy()
+    config["APIInUse"] = "Pyttsx3"
+    config["StreamingSynthesis"] = "1" if streaming else "0"
+    return config
+
+
+def run_generation(workdir, sentences, streaming):
+    cache = TTSCache(os.path.join(workdir, "cache"), 1024*1024*1024)
+    config = get_config(streaming)
+    text = SENTENCE*sentences
+    cache_key = cache.make_key(text, config)
+    start_time = time.perf_counter()
+    worker = TimedWorker(text, config, cache.new_path(cache_key, ".wav"), ToneEngine(), cache=cache, cache_key=cache_key)
+    worker.run()
+    for message in worker.poll():
+        if (message[0] == "error"):
+            raise message[1]
+    return {"first_segment": worker.first_segment_time-start_time, "total": worker.saved_time-start_time}
+
+
+def run_cache(workdir, sentences):
+    synthesizer = CachedSynthesizer(TTSCache(os.path.join(workdir, "cache"), 1024*1024*1024), backends={"Pyttsx3": Pyttsx3Backend(ToneEngine())})
+    config = get_config(False)
+    text = SENTENCE*sentences
+    start_time = time.perf_counter()
+    synthesizer.synthesize(text, config)
+    miss_time = time.perf_counter()-start_time
+    start_time = time.perf_counter()
+    ttspath, cache_hit = synthesizer.synthesize(text, config)
+    hit_time = time.perf_counter()-start_time
+    if (not cache_hit):
+        raise RuntimeError("the second synthesis missed the cache")
+    return {"miss": miss_time, "hit": hit_time}
+
+
+def run_probe(path, audio_format):
+    start_time = time.perf_counter()
+    get_duration(path, audio_format)
+    duration_time = time.perf_counter()-start_time
+    start_time = time.perf_counter()
+    build_seek_index(path, audio_format)
+    return {"duration": duration_time, "seek_index": time.perf_counter()-start_time}
+
+
+def run_export(source, workdir, output_format):
+    start_time = time.perf_counter()
+    export_audio(source, os.path.join(workdir, "export."+output_format), output_format)
+    return time.perf_counter()-start_time
+
+
+def measure(repeat, function, *args):
+    # Median of every metric the function returns over repeat runs
+    runs = [function(*args) for i in range(repeat)]
+    if (isinstance(runs[0], dict)):
+        return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    return statistics.median(runs)
+
+
+def run_suite(repeat, sentences, minutes):
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        # Synthesis cases get an empty cache directory on every run
+        fresh_dir = lambda: tempfile.mkdtemp(dir=workdir)
+
+        for streaming in (True, False):
+            name = "generation_streaming" if streaming else "generation_whole"
+            timings = measure(repeat, lambda: run_generation(fresh_dir(), sentences, streaming))
+            results[name+"_first_segment"] = timings["first_segment"]
+            results[name+"_total"] = timings["total"]
+
+        timings = measure(repeat, lambda: run_cache(fresh_dir(), sentences))
+        results["cache_miss"] = timings["miss"]
+        results["cache_hit"] = timings["hit"]
+
+        wav_path = write_tone(os.path.join(workdir, "probe.wav"), minutes*60)
+        mp3_path = os.path.join(workdir, "probe.mp3")
+        with open(mp3_path, 'wb') as mp3file:
+            # 38.28 frames per second
+            mp3file.write(MP3_FRAME*int(minutes*60*44100/1152))
+        for path, audio_format in ((wav_path, "wav"), (mp3_path, "mp3")):
+            timings = measure(repeat, run_probe, path, audio_format)
+            results["probe_%s_duration"%audio_format] = timings["duration"]
+            results["probe_%s_seek_index"%audio_format] = timings["seek_index"]
+
+        ffmpeg = shutil.which("ffmpeg") is not None
+        for output_format in EXPORT_FORMATS:
+            if (ffmpeg or output_format == "wav"):
+                results["export_"+output_format] = measure(repeat, run_export, wav_path, workdir, output_format)
+            else:
+                results["export_"+output_format] = None
+    return results
+
+
+def compare(results, baseline, threshold, min_delta):
+    # Prints every case next to its baseline; returns the cases slower by more than threshold and min_delta seconds
+    regressions = []
+    print ("%-40s %12s %12s %9s"%("case", "baseline", "current", "change"))
+    for name in sorted(set(results)|set(baseline)):
+        current = results.get(name)
+        previous = baseline.get(name)
+        if (current is None or previous is None):
+            print ("%-40s %12s %12s %9s"%(name, "-" if previous is None else "%.4f"%previous, "-" if current is None else "%.4f"%current, "skipped"))
+            continue
+        change = (current-previous)/previous if previous > 0 else 0.0
+        flag = ""
+        if (change > threshold and current-previous > min_delta):
+            regressions.append(name)
+            flag = " <- slower"
+        print ("%-40s %12.4f %12.4f %+8.1f%%%s"%(name, previous, current, change*100, flag))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark Toice's synthesis, probing, caching and export paths with an offline tone engine.")
+    parser.add_argument("--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--compare", default=None, metavar="BASELINE", help="compare against the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown counted as a regression (default: 0.10)")
+    parser.add_argument("--min-delta", type=float, default=0.001, help="slowdowns smaller than this many seconds are noise (default: 0.001)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case, the median is reported (default: 5)")
+    parser.add_argument("--sentences", type=int, default=40, help="sentences in the synthesized text (default: 40)")
+    parser.add_argument("--minutes", type=int, default=10, help="length of the probed and exported audio (default: 10)")
+    args = parser.parse_args(argv)
+
+    results = run_suite(max(args.repeat, 1), args.sentences, args.minutes)
+    report = {
+                "meta": {
+                            "python": platform.python_version(),
+                            "platform": platform.platform(),
+                            "ffmpeg": shutil.which("ffmpeg") is not None,
+                            "repeat": args.repeat,
+                            "sentences": args.sentences,
+                            "minutes": args.minutes,
+                            "date": time.strftime("%Y-%m-%dT%H:%M:%S")
+                        },
+                "results": results
+             }
+    if (args.output is not None):
+        with open(args.output, 'w', encoding="UTF-8") as outputfile:
+            json.dump(report, outputfile, indent=4)
+
+    if (args.compare is None):
+        for name, seconds in results.items():
+            print ("%-40s %s"%(name, "skipped" if seconds is None else "%.4f s"%seconds))
+        return 0
+    with open(args.compare, encoding="UTF-8") as baselinefile:
+        baseline = json.load(baselinefile)["results"]
+    regressions = compare(results, baseline, args.threshold, args.min_delta)
+    if (len(regressions) != 0):
+        print ("%d case(s) slower than the baseline by more than %d%%: %s"%(len(regressions), args.threshold*100, ", ".join(regressions)))
+        return 1
+    return 0
+
+
+if (__name__ == "__main__"):
+    sys.exit(main(sys.argv[1:]))
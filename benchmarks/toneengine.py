@@ -0,0 +1,52 @@
+# -*- coding: utf8 -*-
+
+# A deterministic, offline stand-in for the pyttsx3 engine: every text becomes a 440 Hz tone whose
+# length only depends on the number of characters, written as 22050 Hz mono WAV like espeak's output.
+
+import math
+import time
+import wave
+import struct
+
+SAMPLE_RATE = 22050
+CHARS_PER_SECOND = 15
+
+
+def make_tone(seconds):
+    period = [int(8000*math.sin(2*math.pi*i/50)) for i in range(50)]
+    second = struct.pack("<%dh"%len(period), *period)*(SAMPLE_RATE//len(period))
+    return second*int(seconds)+second[:int(seconds%1*SAMPLE_RATE)*2]
+
+
+def write_tone(output_path, seconds):
+    with wave.open(output_path, 'wb') as wavfile:
+        wavfile.setparams((1, 2, SAMPLE_RATE, 0, "NONE", "not compressed"))
+        wavfile.writeframes(make_tone(seconds))
+    return output_path
+
+
+class ToneEngine:
+
+    # Same interface as ttsengine.Pyttsx3Engine; latency is added to every synthesis to mimic the engine's own overhead
+
+    def __init__(self, latency=0.0):
+
+        self.latency = latency
+
+
+    def warm_up(self):
+        pass
+
+
+    def synthesize(self, text, output_path, rate, volume, voice):
+        if (self.latency > 0):
+            time.sleep(self.latency)
+        return write_tone(output_path, len(text)/CHARS_PER_SECOND)
+
+
+    def get_voices(self):
+        return []
+
+
+    def shutdown(self):
+        pass
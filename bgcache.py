@@ -0,0 +1,125 @@
+# -*- coding: utf8 -*-
+
+import os
+import json
+import hashlib
+
+from PIL import Image, ImageFilter
+
+# Widths of the pre-blurred background levels kept in the cache
+PYRAMID_WIDTHS = (640, 1280, 1920, 2560)
+
+# Blur radius of the 1920 pixels wide level, the other levels are blurred in proportion
+BLUR_RADIUS = 15
+
+# Single blurred copy written by older versions
+LEGACY_CACHE_FILE = "CACHED_background.jpg"
+
+# Side of the thumbnail whose color histogram gives the dominant color
+COLOR_SAMPLE_SIZE = 150
+
+
+def hash_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as imagefile:
+        for block in iter(lambda: imagefile.read(1024*1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def get_dominant_color(image):
+    sample = image.convert("RGB").resize((COLOR_SAMPLE_SIZE, COLOR_SAMPLE_SIZE))
+    return tuple(max(sample.getcolors(COLOR_SAMPLE_SIZE*COLOR_SAMPLE_SIZE), key=lambda color: color[0])[1])
+
+
+class BackgroundCache:
+
+    # Blurred copies of a background image at a few sizes, plus its dominant color, in a sidecar keyed by the image's hash
+
+    def __init__(self, source_path, cachedir):
+
+        self.source_path = source_path
+        self.cachedir = cachedir
+        self.index_file = os.path.join(cachedir, "background.json")
+
+        # {"source": <sha256 of the source>, "dominant_color": [r, g, b], "complementary_color": [r, g, b],
+        #  "levels": [[width, height, filename], ...]}
+        self.index = None
+
+        # Levels opened so far, by filename
+        self.images = {}
+
+        os.makedirs(self.cachedir, exist_ok=True)
+        source_hash = hash_file(source_path)
+        self.load_index()
+        if (self.index is None or self.index["source"] != source_hash):
+            self.build(source_hash)
+
+
+    def load_index(self):
+        try:
+            with open(self.index_file, encoding="UTF-8") as indexfile:
+                index = json.load(indexfile)
+            for width, height, filename in index["levels"]:
+                if (not os.path.isfile(os.path.join(self.cachedir, filename))):
+                    return
+            self.index = index
+        except (OSError, ValueError, KeyError, TypeError):
+            self.index = None
+
+
+    def build(self, source_hash):
+        source = Image.open(self.source_path).convert("RGB")
+        widths = [width for width in PYRAMID_WIDTHS if width < source.width]+[min(source.width, PYRAMID_WIDTHS[-1])]
+        levels = []
+        for width in widths:
+            height = round(source.height*width/source.width)
+            level = source.resize((width, height), Image.LANCZOS).filter(ImageFilter.GaussianBlur(BLUR_RADIUS*width/1920))
+            filename = "background_%s_%d.jpg"%(source_hash[:16], width)
+            level.save(os.path.join(self.cachedir, filename), quality=90)
+            levels.append([width, height, filename])
+            self.images[filename] = level
+
+        dominant_color = get_dominant_color(self.images[levels[0][2]])
+        old_index = self.index
+        self.index = {
+                        "source": source_hash,
+                        "dominant_color": list(dominant_color),
+                        "complementary_color": [255-value for value in dominant_color],
+                        "levels": levels
+                     }
+        temp_file = self.index_file+".tmp"
+        with open(temp_file, 'w', encoding="UTF-8") as indexfile:
+            json.dump(self.index, indexfile)
+        os.replace(temp_file, self.index_file)
+
+        stale_files = [LEGACY_CACHE_FILE]
+        if (old_index is not None):
+            stale_files += [filename for width, height, filename in old_index["levels"] if filename not in self.images]
+        for filename in stale_files:
+            try:
+                os.remove(os.path.join(self.cachedir, filename))
+            except OSError:
+                pass
+
+
+    def get_dominant_color(self):
+        return tuple(self.index["dominant_color"])
+
+
+    def get_complementary_color(self):
+        return tuple(self.index["complementary_color"])
+
+
+    def get_image(self, width, height):
+        # The smallest level that still covers width x height, the largest one if none does
+        levels = self.index["levels"]
+        filename = levels[-1][2]
+        for level_width, level_height, level_filename in levels:
+            if (level_width >= width and level_height >= height):
+                filename = level_filename
+                break
+        if (filename not in self.images):
+            self.images[filename] = Image.open(os.path.join(self.cachedir, filename))
+            self.images[filename].load()
+        return self.images[filename]
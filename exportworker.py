@@ -0,0 +1,46 @@
+# -*- coding: utf8 -*-
+
+from uischeduler import UIWorker
+from audioutils import export_audio, get_format
+
+
+class ExportWorker(UIWorker):
+
+    # Exports one speech to any number of files off the UI thread, one format after another
+
+    def __init__(self, source, input_format, output_paths):
+
+        super().__init__()
+
+        self.source = source
+        self.input_format = input_format
+        self.output_paths = list(output_paths)
+
+        # Messages for the UI thread: ("progress", done, total) in percent over all outputs, ("exported", path),
+        # ("error", path, exception), ("done",)
+
+
+    def run(self):
+        outputs = len(self.output_paths)
+        last_percent = [-1]
+
+        for i in range(outputs):
+            output_path = self.output_paths[i]
+
+            def progress(done, total):
+                # Only whole percent steps reach the UI thread
+                percent = (100*i+100*done//max(total, 1))//outputs
+                if (percent != last_percent[0]):
+                    last_percent[0] = percent
+                    self.post("progress", percent, 100)
+
+            progress(0, 1)
+            try:
+                if (export_audio(self.source, output_path, get_format(output_path), self.input_format, progress, self.is_cancelled) is None):
+                    return
+                self.post("exported", output_path)
+            except Exception as e:
+                self.post("error", output_path, e)
+            if (self.is_cancelled()):
+                return
+        self.post("done")
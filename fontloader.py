@@ -0,0 +1,142 @@
+# -*- coding: utf8 -*-
+
+import os
+import json
+import ctypes
+import hashlib
+import ctypes.util
+from shutil import copy
+from subprocess import Popen, DEVNULL
+from platform import system
+
+from toiceconfig import SUCCESS, FAILURE
+
+# kCTFontManagerScopeProcess: the font is only visible to this process and goes away with it
+CT_FONT_MANAGER_SCOPE_PROCESS = 1
+
+
+def load_library(name):
+    path = ctypes.util.find_library(name)
+    if (path is None):
+        return None
+    try:
+        return ctypes.CDLL(path)
+    except OSError:
+        return None
+
+
+def register_font_fontconfig(font_file):
+    # Adds the font to this process' fontconfig configuration, which is what Tk's Xft backend looks fonts up in
+    fontconfig = load_library("fontconfig")
+    if (fontconfig is None):
+        return FAILURE
+    fontconfig.FcConfigAppFontAddFile.argtypes = (ctypes.c_void_p, ctypes.c_char_p)
+    fontconfig.FcConfigAppFontAddFile.restype = ctypes.c_int
+    if (fontconfig.FcConfigAppFontAddFile(None, os.fsencode(font_file))):
+        return SUCCESS
+    return FAILURE
+
+
+def register_font_coretext(font_file):
+    corefoundation = load_library("CoreFoundation")
+    coretext = load_library("CoreText")
+    if (corefoundation is None or coretext is None):
+        return FAILURE
+    corefoundation.CFURLCreateFromFileSystemRepresentation.argtypes = (ctypes.c_void_p, ctypes.c_char_p, ctypes.c_long, ctypes.c_bool)
+    corefoundation.CFURLCreateFromFileSystemRepresentation.restype = ctypes.c_void_p
+    corefoundation.CFRelease.argtypes = (ctypes.c_void_p,)
+    coretext.CTFontManagerRegisterFontsForURL.argtypes = (ctypes.c_void_p, ctypes.c_uint32, ctypes.c_void_p)
+    coretext.CTFontManagerRegisterFontsForURL.restype = ctypes.c_bool
+
+    path = os.fsencode(font_file)
+    url = corefoundation.CFURLCreateFromFileSystemRepresentation(None, path, len(path), False)
+    if (not url):
+        return FAILURE
+    try:
+        registered = coretext.CTFontManagerRegisterFontsForURL(url, CT_FONT_MANAGER_SCOPE_PROCESS, None)
+    finally:
+        corefoundation.CFRelease(url)
+    return SUCCESS if registered else FAILURE
+
+
+def hash_font(font_file):
+    with open(font_file, 'rb') as fontfile:
+        return hashlib.sha256(fontfile.read()).hexdigest()
+
+
+def read_marker(marker_file):
+    # {"file": <installed copy>, "sha256": <hash of what was copied>} of the copy we installed, None if there is none
+    try:
+        with open(marker_file, encoding="UTF-8") as marker:
+            content = marker.read().strip()
+    except OSError:
+        return None
+    try:
+        installed = json.loads(content)
+    except ValueError:
+        # Older markers only hold the path, their copy is refreshed once
+        return {"file": content} if content != "" else None
+    return installed if isinstance(installed, dict) and "file" in installed else None
+
+
+def rescan_fonts(fonts_dir):
+    # Only the one fonts directory is rescanned by fontconfig
+    if (system() == "Linux"):
+        try:
+            Popen(["fc-cache", fonts_dir], stdout=DEVNULL, stderr=DEVNULL, shell=False)
+        except FileNotFoundError:
+            pass
+
+
+def install_font(font_file, fonts_dir, marker_file):
+    # Fallback when the font cannot be registered privately: installed for the user once and then left in place.
+    # The marker tells our copy from one the user installed, which is never touched, and whether ours is up to date
+    installed_file = os.path.join(fonts_dir, os.path.basename(font_file))
+    installed = read_marker(marker_file)
+    try:
+        font_hash = hash_font(font_file)
+        if (os.path.isfile(installed_file)):
+            if (installed is None or installed["file"] != installed_file or installed.get("sha256") == font_hash):
+                return SUCCESS
+        os.makedirs(fonts_dir, exist_ok=True)
+        copy(font_file, installed_file)
+        os.makedirs(os.path.dirname(marker_file), exist_ok=True)
+        with open(marker_file, 'w', encoding="UTF-8") as marker:
+            json.dump({"file": installed_file, "sha256": font_hash}, marker)
+        rescan_fonts(fonts_dir)
+    except OSError:
+        return FAILURE
+    return SUCCESS
+
+
+def uninstall_font(marker_file):
+    # Removes the copy install_font() made, once it is no longer needed
+    installed = read_marker(marker_file)
+    if (installed is None):
+        return
+    try:
+        os.remove(installed["file"])
+    except OSError:
+        pass
+    try:
+        os.remove(marker_file)
+    except OSError:
+        pass
+    rescan_fonts(os.path.dirname(installed["file"]))
+
+
+def load_font(font_file, marker_file):
+    if (not os.path.isfile(font_file)):
+        return FAILURE
+    # A copy installed by an earlier run that could not register the font privately is removed once it can
+    if (system() == "Linux"):
+        if (register_font_fontconfig(font_file) == SUCCESS):
+            uninstall_font(marker_file)
+            return SUCCESS
+        return install_font(font_file, os.path.expanduser("~/.local/share/fonts"), marker_file)
+    elif (system() == "Darwin"):
+        if (register_font_coretext(font_file) == SUCCESS):
+            uninstall_font(marker_file)
+            return SUCCESS
+        return install_font(font_file, os.path.expanduser("~/Library/Fonts"), marker_file)
+    return FAILURE
@@ -0,0 +1,154 @@
+# -*- coding: utf8 -*-
+
+import re
+import time
+import random
+import base64
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import gtts
+
+GTTS_URL = "https://translate.google.%s/_/TranslateWebserverUi/data/batchexecute"
+
+# Answers worth asking again for: rate limited, or the server failing for now
+TRANSIENT_STATUSES = (408, 429, 500, 502, 503, 504)
+
+# Where the base64 MP3 sits in the API's answer, as gtts reads it
+AUDIO_PATTERN = re.compile(r'jQ1olc","\[\\"(.*)\\"]')
+
+
+class GTTSClientError(Exception):
+
+    # A segment failed for good: refused, or still failing after every retry
+
+    def __init__(self, message, status=None):
+
+        super().__init__(message)
+        self.status = status
+
+
+class TokenBucket:
+
+    # Lets requests through at rate per second on average, and up to capacity of them at once after a pause
+
+    def __init__(self, rate, capacity):
+
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def acquire(self):
+        # Takes a token right away, going into debt if there is none, then sleeps once until the debt is paid off
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens+(now-self.updated)*self.rate)
+            self.updated = now
+            self.tokens -= 1
+            delay = -self.tokens/self.rate
+        if (delay > 0):
+            time.sleep(delay)
+
+
+class GTTSClient:
+
+    # Fetches the segments gtts splits a text into side by side, over one pooled HTTP session
+
+    def __init__(self, concurrency=4, rate=8, retries=3, backoff=0.5, max_backoff=8.0, timeout=10.0, url=None):
+
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.url = url
+        self.bucket = TokenBucket(rate, max(concurrency, 1))
+
+        # Keep-alive connections to the API are reused by every segment of every text
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(gtts.gTTS.GOOGLE_TTS_HEADERS)
+        self.session.proxies.update(urllib.request.getproxies())
+
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+        # Requests sent and retried, for the benchmarks
+        self.requests_sent = 0
+        self.retries_made = 0
+        self.counter_lock = threading.Lock()
+
+
+    def get_delay(self, attempt, response=None):
+        # Exponential backoff with full jitter, so that segments failing together do not retry together
+        delay = random.uniform(0, min(self.max_backoff, self.backoff*2**attempt))
+        if (response is not None):
+            try:
+                delay = max(delay, min(float(response.headers.get("Retry-After", "0")), self.max_backoff))
+            except ValueError:
+                pass
+        return delay
+
+
+    def parse_audio(self, response):
+        for line in response.iter_lines(chunk_size=1024):
+            match = AUDIO_PATTERN.search(line.decode("UTF-8", "replace"))
+            if (match):
+                return base64.b64decode(match.group(1).encode("ascii"))
+        raise GTTSClientError("No audio in the response to a segment", response.status_code)
+
+
+    def fetch(self, url, body):
+        # The MP3 of one segment
+        attempt = 0
+        while (True):
+            self.bucket.acquire()
+            with self.counter_lock:
+                self.requests_sent += 1
+            response = None
+            try:
+                response = self.session.post(url, data=body, timeout=self.timeout)
+                if (response.status_code not in TRANSIENT_STATUSES):
+                    if (response.status_code != 200):
+                        raise GTTSClientError("%d (%s) from %s"%(response.status_code, response.reason, url), response.status_code)
+                    return self.parse_audio(response)
+                error = GTTSClientError("%d (%s) from %s"%(response.status_code, response.reason, url), response.status_code)
+            except requests.exceptions.RequestException as e:
+                # Dropped connections and timeouts
+                error = GTTSClientError(str(e))
+            if (attempt >= self.retries):
+                raise error
+            time.sleep(self.get_delay(attempt, response))
+            attempt += 1
+            with self.counter_lock:
+                self.retries_made += 1
+
+
+    def synthesize(self, text, lang="en", tld="com"):
+        # Every segment is fetched at once, up to the concurrency and rate limits; the MP3s are joined in text order
+        url = self.url if self.url is not None else GTTS_URL%tld
+        bodies = gtts.gTTS(text=text, lang=lang, tld=tld).get_bodies()
+        futures = [self.executor.submit(self.fetch, url, body) for body in bodies]
+        try:
+            return b"".join(future.result() for future in futures)
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+    def write(self, text, output_path, lang="en", tld="com"):
+        audio = self.synthesize(text, lang, tld)
+        with open(output_path, 'wb') as audiofile:
+            audiofile.write(audio)
+        return output_path
+
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
@@ -0,0 +1,112 @@
+# -*- coding: utf8 -*-
+
+import os
+import json
+
+LANGPACK_EXTENSION = ".lang"
+
+
+def parse_langpack(path):
+    # Returns (language name, strings), the name is None when the first non-blank line does not declare one
+    name = None
+    strings = {}
+    first_line = True
+    with open(path, encoding='UTF-8') as langpack:
+        for line in langpack:
+            if (line.strip() == ''):
+                continue
+            if (first_line):
+                first_line = False
+                if (not (line.startswith("LanguageName") and line.find('=') != -1)):
+                    return (None, {})
+                name = line[line.index('=')+1::].strip()
+            if (line.find('=') != -1):
+                key = line[:line.index('=')].strip()
+                strings[key] = line[line.index('=')+1::].strip().replace("<BREAK>", "\n")
+    return (name, strings)
+
+
+class LanguagePackIndex:
+
+    # Every language pack parsed once and kept in a cache file; a pack is only read again when its mtime or size changes
+
+    def __init__(self, langdir, index_file):
+
+        self.langdir = langdir
+        self.index_file = index_file
+
+        # filename -> {"mtime": <ns>, "size": <bytes>, "name": <language name or None>, "strings": {key: value}}
+        self.packs = {}
+
+        self.load_index()
+        self.refresh()
+
+
+    def load_index(self):
+        try:
+            with open(self.index_file, encoding="UTF-8") as indexfile:
+                self.packs = json.load(indexfile)
+            if (not isinstance(self.packs, dict)):
+                raise ValueError
+        except (OSError, ValueError):
+            self.packs = {}
+
+
+    def save_index(self):
+        try:
+            os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+            temp_file = self.index_file+".tmp"
+            with open(temp_file, 'w', encoding="UTF-8") as indexfile:
+                json.dump(self.packs, indexfile, ensure_ascii=False, separators=(',', ':'))
+            os.replace(temp_file, self.index_file)
+        except OSError:
+            pass
+
+
+    def refresh(self):
+        # Only a stat() per pack unless something changed on disk
+        try:
+            filenames = [_file for _file in os.listdir(self.langdir) if _file.endswith(LANGPACK_EXTENSION)]
+        except FileNotFoundError:
+            filenames = []
+        changed = False
+        packs = {}
+        for filename in sorted(filenames):
+            path = os.path.join(self.langdir, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            pack = self.packs.get(filename)
+            if (not isinstance(pack, dict) or pack.get("mtime") != stat.st_mtime_ns or pack.get("size") != stat.st_size):
+                try:
+                    name, strings = parse_langpack(path)
+                except (OSError, UnicodeDecodeError):
+                    name, strings = (None, {})
+                pack = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "name": name, "strings": strings}
+                changed = True
+            packs[filename] = pack
+        if (changed or packs.keys() != self.packs.keys()):
+            self.packs = packs
+            self.save_index()
+        self.packs = packs
+
+
+    def get_languages(self):
+        # language name -> path of its pack
+        return {pack["name"]: os.path.join(self.langdir, filename) for filename, pack in self.packs.items() if pack["name"] is not None}
+
+
+    def get_names(self):
+        return list(self.get_languages())
+
+
+    def get_invalid_files(self):
+        return [os.path.join(self.langdir, filename) for filename, pack in self.packs.items() if pack["name"] is None]
+
+
+    def get_strings(self, name):
+        for pack in self.packs.values():
+            if (pack["name"] == name):
+                return dict(pack["strings"])
+        return {}
@@ -0,0 +1,195 @@
+# -*- coding: utf8 -*-
+
+import io
+import os
+import mmap
+import array
+import struct
+
+from audioutils import get_format, iterate_mp3_frames, open_audio, read_wav_header
+
+SEEK_EXTENSION = ".seek"
+
+# Magic, format, sample rate, then for WAV: data offset, data size, block align, channels, sample width,
+# for MP3: samples per frame and the number of frame offsets that follow as uint32
+SEEK_FILE_HEADER = struct.Struct("<4s4sIQQIII")
+SEEK_FILE_MAGIC = b"TSK1"
+
+# Tags some encoders put in an MP3's first frame, which then holds no audio
+MP3_INFO_TAGS = (b"Xing", b"Info", b"VBRI")
+
+
+class SeekIndex:
+
+    # Where playback of a WAV or MP3 file can start for any position, without reading what comes before it
+
+    def __init__(self, audio_format, sample_rate, data_offset=0, data_size=0, block_align=0, channels=0, sample_width=0,
+                 samples_per_frame=0, frame_offsets=None):
+
+        self.audio_format = audio_format
+        self.sample_rate = sample_rate
+
+        # WAV: the PCM data and the layout of its frames
+        self.data_offset = data_offset
+        self.data_size = data_size
+        self.block_align = block_align
+        self.channels = channels
+        self.sample_width = sample_width
+
+        # MP3: the byte offset of every audio frame
+        self.samples_per_frame = samples_per_frame
+        self.frame_offsets = frame_offsets if frame_offsets is not None else array.array('I')
+
+
+    def locate(self, position):
+        # (byte offset, position in milliseconds it actually starts at) of the sample or frame at position
+        position = max(position, 0)
+        if (self.audio_format == "wav"):
+            frame = min(position*self.sample_rate//1000, self.data_size//max(self.block_align, 1))
+            return (self.data_offset+frame*self.block_align, frame*1000//self.sample_rate)
+        if (len(self.frame_offsets) == 0):
+            return (0, 0)
+        frame = min(position*self.sample_rate//(self.samples_per_frame*1000), len(self.frame_offsets)-1)
+        return (self.frame_offsets[frame], frame*self.samples_per_frame*1000//self.sample_rate)
+
+
+    def get_wav_header(self, data_size):
+        return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36+data_size, b"WAVE", b"fmt ", 16, 1, self.channels,
+                           self.sample_rate, self.sample_rate*self.block_align, self.block_align, self.sample_width*8,
+                           b"data", data_size)
+
+
+class AudioSlice(io.RawIOBase):
+
+    # A prefix followed by the [start, end) region of another file, read through without copying the region
+
+    def __init__(self, audiofile, start, end, prefix=b""):
+
+        super().__init__()
+        self.audiofile = audiofile
+        self.start = start
+        self.end = end
+        self.prefix = prefix
+        self.position = 0
+        self.size = len(prefix)+end-start
+
+
+    def readable(self):
+        return True
+
+
+    def seekable(self):
+        return True
+
+
+    def tell(self):
+        return self.position
+
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if (whence == io.SEEK_CUR):
+            offset += self.position
+        elif (whence == io.SEEK_END):
+            offset += self.size
+        self.position = min(max(offset, 0), self.size)
+        return self.position
+
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast('B')
+        done = 0
+        if (self.position < len(self.prefix)):
+            done = min(len(view), len(self.prefix)-self.position)
+            view[:done] = self.prefix[self.position:self.position+done]
+            self.position += done
+        if (done < len(view) and self.position < self.size):
+            self.audiofile.seek(self.start+self.position-len(self.prefix))
+            data = self.audiofile.read(min(len(view)-done, self.size-self.position))
+            view[done:done+len(data)] = data
+            done += len(data)
+            self.position += len(data)
+        return done
+
+
+    def close(self):
+        self.audiofile.close()
+        super().close()
+
+
+def get_seek_path(audio_path):
+    return os.path.splitext(audio_path)[0]+SEEK_EXTENSION
+
+
+def build_seek_index(source, audio_format=None):
+    # A WAV only needs its header, an MP3 is scanned once for the offset of every frame
+    if (audio_format is None):
+        audio_format = get_format(source)
+    with open_audio(source) as audiofile:
+        if (audio_format == "wav"):
+            header = read_wav_header(audiofile)
+            return SeekIndex("wav", header["sample_rate"], header["data_offset"], header["data_size"], header["block_align"],
+                             header["channels"], header["sample_width"])
+        if (isinstance(source, str)):
+            with mmap.mmap(audiofile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return build_mp3_seek_index(data)
+        return build_mp3_seek_index(audiofile.read())
+
+
+def build_mp3_seek_index(data):
+    frame_offsets = array.array('I')
+    samples_per_frame = 0
+    sample_rate = 0
+    for offset, frame_length, samples, frame_rate in iterate_mp3_frames(data):
+        if (len(frame_offsets) == 0 and samples_per_frame == 0):
+            samples_per_frame = samples
+            sample_rate = frame_rate
+            if (any(tag in data[offset:offset+frame_length] for tag in MP3_INFO_TAGS)):
+                continue
+        frame_offsets.append(offset)
+    if (sample_rate == 0):
+        raise ValueError("No MP3 frames found")
+    return SeekIndex("mp3", sample_rate, samples_per_frame=samples_per_frame, frame_offsets=frame_offsets)
+
+
+def save_seek_index(index, path):
+    temp_file = path+".tmp"
+    with open(temp_file, 'wb') as seekfile:
+        if (index.audio_format == "wav"):
+            seekfile.write(SEEK_FILE_HEADER.pack(SEEK_FILE_MAGIC, b"wav ", index.sample_rate, index.data_offset, index.data_size,
+                                                 index.block_align, index.channels, index.sample_width))
+        else:
+            seekfile.write(SEEK_FILE_HEADER.pack(SEEK_FILE_MAGIC, b"mp3 ", index.sample_rate, 0, 0,
+                                                 index.samples_per_frame, len(index.frame_offsets), 0))
+            seekfile.write(index.frame_offsets.tobytes())
+    os.replace(temp_file, path)
+    return path
+
+
+def load_seek_index(path):
+    # None when there is no usable seek file
+    try:
+        with open(path, 'rb') as seekfile:
+            magic, audio_format, sample_rate, data_offset, data_size, field1, field2, field3 = SEEK_FILE_HEADER.unpack(seekfile.read(SEEK_FILE_HEADER.size))
+            if (magic != SEEK_FILE_MAGIC or sample_rate == 0):
+                return None
+            if (audio_format == b"wav "):
+                return SeekIndex("wav", sample_rate, data_offset, data_size, field1, field2, field3)
+            frame_offsets = array.array('I')
+            frame_offsets.frombytes(seekfile.read(field2*frame_offsets.itemsize))
+    except (OSError, struct.error, ValueError):
+        return None
+    if (audio_format != b"mp3 " or len(frame_offsets) != field2):
+        return None
+    return SeekIndex("mp3", sample_rate, samples_per_frame=field1, frame_offsets=frame_offsets)
+
+
+def open_audio_at(source, index, position):
+    # (file object playing from position, position in milliseconds it actually starts at), found in constant time
+    offset, start = index.locate(position)
+    audiofile = open_audio(source)
+    end = audiofile.seek(0, io.SEEK_END)
+    if (index.audio_format == "wav"):
+        end = min(end, index.data_offset+index.data_size)
+        end -= (end-offset)%max(index.block_align, 1)
+        return (io.BufferedReader(AudioSlice(audiofile, offset, end, index.get_wav_header(end-offset))), start)
+    return (io.BufferedReader(AudioSlice(audiofile, offset, end)), start)
@@ -5,20 +5,23 @@ import tkinter.ttk as ttk
 from platform import system
 import os
 
+from ttsengine import get_available_backends
+
 class ToiceSettingsMenu(tk.Toplevel):
 
-    def __init__(self, master: tk.Tk, settings_data: dict, lang_data: dict):
+    def __init__(self, master: tk.Tk, settings_data: dict, lang_data: dict, tts_engine=None, lang_index=None):
 
         super().__init__(master)
 
         self.config = settings_data.copy()
         self.master_config = settings_data.copy()
         self.uilang = lang_data
+        self.lang_index = lang_index
 
         self.transient(master)
         self.title(self.uilang["SettingsMenuTitle"]+" - "+self.master.title())
 
-        self.dimensions = "480x360"
+        self.dimensions = "480x400"
         self.settings_changed = False
 
         # Get the height and width from the dimensions and center the toplevel on the master
@@ -43,11 +46,11 @@ class ToiceSettingsMenu(tk.Toplevel):
         self.geometry(self.dimensions+"+%d+%d"%(center_x, center_y))
         self.resizable(0,0)
 
-        try:
-            import pyttsx3
-            self.tts = pyttsx3.init()
-        except:
-            self.tts = None
+        # Voices come from the app's long-lived pyttsx3 engine instead of initializing a new one
+        if (tts_engine is not None):
+            self.voices = tts_engine.get_voices()
+        else:
+            self.voices = []
 
         self.style = ttk.Style()
 
@@ -84,10 +87,14 @@ class ToiceSettingsMenu(tk.Toplevel):
         self.choose_api_label.pack(side=tk.LEFT, padx=5)
 
         self.choose_api_var = tk.StringVar()
-        self.choose_api_radiobutton_gtts = ttk.Radiobutton(self.choose_api_frame, text="GTTS", value="GTTS", variable=self.choose_api_var)
-        self.choose_api_radiobutton_gtts.pack(side=tk.RIGHT, padx=10)
-        self.choose_api_radiobutton_pyttsx3 = ttk.Radiobutton(self.choose_api_frame, text="Pyttsx3", value="Pyttsx3", variable=self.choose_api_var)
-        self.choose_api_radiobutton_pyttsx3.pack(side=tk.RIGHT, padx=10)
+        # One button per backend usable on this system, and the one in use even if it no longer is
+        backend_names = get_available_backends()
+        if (self.config['APIInUse'] not in backend_names):
+            backend_names.append(self.config['APIInUse'])
+        self.choose_api_radiobuttons = {}
+        for name in reversed(backend_names):
+            self.choose_api_radiobuttons[name] = ttk.Radiobutton(self.choose_api_frame, text=name, value=name, variable=self.choose_api_var)
+            self.choose_api_radiobuttons[name].pack(side=tk.RIGHT, padx=10)
         self.choose_api_var.set(self.config['APIInUse'])
 
         self.buttons_frame = tk.Frame(self)
@@ -108,15 +115,10 @@ class ToiceSettingsMenu(tk.Toplevel):
         self.general_uilanguage_frame.pack(fill=tk.X, padx=5, pady=(30, 20))
         self.general_uilanguage_label = tk.Label(self.general_uilanguage_frame, text=self.uilang["UILanguageLabel"]+":")
         self.general_uilanguage_label.pack(side=tk.LEFT)
-        langdir = os.path.dirname(__file__).replace("\\", "/")+"/languages/"
         self.languages = []
-        try:
-            for langfile in os.listdir(langdir):
-                with open(langdir+langfile, encoding="UTF-8") as lang:
-                    langline = lang.readlines()[0]
-                    self.languages.append(langline[langline.index("=")+1::].strip())
-        except Exception as e:
-            print (e)
+        if (self.lang_index is not None):
+            self.languages = self.lang_index.get_names()
+        if (len(self.languages) == 0):
             self.languages.append("English (US)")
         self.general_uilanguage_combobox = ttk.Combobox(self.general_uilanguage_frame, values=self.languages, state='readonly', width=max([len(x) for x in self.languages]))
         self.general_uilanguage_combobox.set(self.config["UILanguage"])
@@ -204,12 +206,27 @@ class ToiceSettingsMenu(tk.Toplevel):
         self.pyttsx3_voiceinfo_label.pack(side=tk.LEFT)
         self.pyttsx3_voiceinfo_genderlabel = tk.Label(self.pyttsx3_voiceinfo_frame, text=self.uilang["Pyttsx3VoiceGender"+voice_gender])
         self.pyttsx3_voiceinfo_genderlabel.pack(side=tk.RIGHT, padx=10)
+
+        self.pyttsx3_workers_frame = tk.Frame(self.pyttsx3_tab)
+        self.pyttsx3_workers_frame.pack(fill=tk.X, padx=5, pady=10)
+        self.pyttsx3_workers_label = tk.Label(self.pyttsx3_workers_frame, text=self.uilang["Pyttsx3WorkersLabel"]+":")
+        self.pyttsx3_workers_label.pack(side=tk.LEFT)
+        self.pyttsx3_workers_var = tk.IntVar()
+        self.pyttsx3_workers_spinbox = ttk.Spinbox(
+                                            self.pyttsx3_workers_frame,
+                                            from_ = 1,
+                                            to = max(os.cpu_count() or 1, int(self.config["Pyttsx3Workers"])),
+                                            textvariable = self.pyttsx3_workers_var,
+                                            state = 'readonly',
+                                            width = 5
+                                            )
+        self.pyttsx3_workers_var.set(int(self.config["Pyttsx3Workers"]))
+        self.pyttsx3_workers_spinbox.pack(padx=10, side=tk.RIGHT)
         
 
 
     def get_pyttsx3_voice_supported_gender(self, voiceid):
-        voices = self.tts.getProperty('voices')
-        gender = voices[voiceid].gender
+        gender = self.voices[voiceid].gender
         gender = str(gender).strip()
         if (gender.lower() not in ('male', 'female')):
             gender = "Unknown"
@@ -218,23 +235,18 @@ class ToiceSettingsMenu(tk.Toplevel):
 
     def get_pyttsx3_supported_voices(self):
         supported_voices = []
-        if (self.tts is not None):
-            voices = self.tts.getProperty('voices')
-            for voice in voices:
-                supported_voices.append(str(voice.name))
+        for voice in self.voices:
+            supported_voices.append(str(voice.name))
         return supported_voices
 
 
     def get_selected_voiceid(self):
         selected_voice_name = self.pyttsx3_voice_combobox.get()
         voiceid = 0
-        if (self.tts is not None):
-            voices = self.tts.getProperty('voices')
-            for voice in voices:
-                if (voice.name == selected_voice_name):
-                    gender = self.get_pyttsx3_voice_supported_gender(voiceid)
-                    break
-                voiceid += 1
+        for voice in self.voices:
+            if (voice.name == selected_voice_name):
+                break
+            voiceid += 1
         return voiceid
 
         
@@ -252,6 +264,7 @@ class ToiceSettingsMenu(tk.Toplevel):
         self.config["Pyttsx3Speed"] = str(self.pyttsx3_speed_var.get())
         self.config["Pyttsx3Volume"] = str(self.pyttsx3_volume_var.get())
         self.config["Pyttsx3VoiceID"] = str(self.get_selected_voiceid())
+        self.config["Pyttsx3Workers"] = str(self.pyttsx3_workers_var.get())
         self.config["APIInUse"] = self.choose_api_var.get()
         self.config["UILanguage"] = self.general_uilanguage_combobox.get()
         if (self.config != self.master_config):
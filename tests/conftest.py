@@ -0,0 +1,48 @@
+# -*- coding: utf8 -*-
+
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository, next to toice.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from toiceconfig import DEFAULT_CONFIG
+from ttsengine import Pyttsx3Backend
+from silenceengine import SilenceEngine
+
+
+@pytest.fixture
+def config():
+    # Pyttsx3 with a 1 MB cache, which texts from large_texts overflow on almost every add
+    return dict(DEFAULT_CONFIG, APIInUse="Pyttsx3", CacheSizeMB="1")
+
+
+@pytest.fixture
+def engine():
+    return SilenceEngine()
+
+
+@pytest.fixture
+def backend(engine):
+    # Pyttsx3 as the batch and service modes create it, speaking through the silence engine
+    return Pyttsx3Backend(engine)
+
+
+@pytest.fixture
+def userdir(tmp_path, monkeypatch):
+    # The batch and service modes keep their cache under USERDIR
+    import toicebatch
+    import toiceserver
+    for module in (toicebatch, toiceserver):
+        monkeypatch.setattr(module, "USERDIR", str(tmp_path)+"/")
+    return tmp_path
+
+
+@pytest.fixture
+def large_texts():
+    # count different texts of about 440 kB of speech each
+    def make(count, subject="Text"):
+        return [("%s number %02d is read aloud. "%(subject, i)*3).strip() for i in range(count)]
+    return make
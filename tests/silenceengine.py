@@ -0,0 +1,30 @@
+# -*- coding: utf8 -*-
+
+import wave
+
+SAMPLE_RATE = 22050
+
+
+class SilenceEngine:
+
+    # Writes a second of silence per 10 characters, in place of the pyttsx3 engine
+
+    def __init__(self):
+
+        self.calls = 0
+
+
+    def warm_up(self):
+        pass
+
+
+    def synthesize(self, text, output_path, rate, volume, voice):
+        self.calls += 1
+        with wave.open(output_path, 'wb') as wavfile:
+            wavfile.setparams((1, 2, SAMPLE_RATE, 0, "NONE", "not compressed"))
+            wavfile.writeframes(b"\0\0"*(SAMPLE_RATE*len(text)//10))
+        return output_path
+
+
+    def shutdown(self):
+        pass
@@ -0,0 +1,100 @@
+# -*- coding: utf8 -*-
+
+import io
+import wave
+import struct
+
+import pytest
+
+from audioutils import get_duration, id3v2_size, parse_mp3_frame_header, read_wav_header
+
+# A silent MPEG 1 layer III frame, 128 kbps, 44.1 kHz, stereo: 417 bytes and 1152 samples
+MP3_FRAME = b"\xff\xfb\x90\x00"+b"\x00"*413
+
+
+def make_wav(seconds, sample_rate=22050, channels=1, sample_width=2):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wavfile:
+        wavfile.setparams((channels, sample_width, sample_rate, 0, "NONE", "not compressed"))
+        wavfile.writeframes(b"\0"*int(seconds*sample_rate)*channels*sample_width)
+    return buffer.getvalue()
+
+
+def make_xing_frame(frames):
+    # The first frame of a VBR file: Xing tag with the frame count after the 32 bytes of stereo side info
+    frame = bytearray(MP3_FRAME)
+    frame[36:48] = b"Xing"+struct.pack(">II", 1, frames)
+    return bytes(frame)
+
+
+def make_id3(size):
+    # ID3v2 header whose syncsafe size covers size bytes of tag data
+    return b"ID3\x03\x00\x00"+bytes((size >> 21 & 0x7f, size >> 14 & 0x7f, size >> 7 & 0x7f, size & 0x7f))+b"\0"*size
+
+
+def test_wav_duration():
+    assert get_duration(make_wav(2.5), "wav") == 2500
+    assert get_duration(make_wav(1, 44100, 2, 2), "wav") == 1000
+
+
+def test_wav_duration_from_a_path(tmp_path):
+    path = str(tmp_path/"speech.wav")
+    with open(path, 'wb') as wavfile:
+        wavfile.write(make_wav(3))
+    assert get_duration(path) == 3000
+
+
+def test_wav_header_skips_unknown_chunks():
+    wav = make_wav(1)
+    # A LIST chunk with an odd size, which is padded to an even one, between fmt and data
+    extra = b"LIST"+struct.pack("<I", 5)+b"INFO\0\0"
+    wav = wav[:36]+extra+wav[36:]
+    header = read_wav_header(io.BytesIO(wav))
+    assert header["data_offset"] == 44+len(extra)
+    assert get_duration(wav, "wav") == 1000
+
+
+def test_wav_with_placeholder_sizes():
+    # Streaming writers leave the RIFF and data sizes at their maximum until they finish
+    wav = bytearray(make_wav(2))
+    wav[4:8] = struct.pack("<I", 0xFFFFFFFF)
+    wav[40:44] = struct.pack("<I", 0xFFFFFFFF)
+    assert get_duration(bytes(wav), "wav") == 2000
+
+
+def test_not_a_wav():
+    with pytest.raises(ValueError):
+        get_duration(b"RIFF\0\0\0\0AVI LIST", "wav")
+
+
+def test_mp3_frame_header():
+    assert parse_mp3_frame_header(MP3_FRAME, 0) == (417, 1152, 44100)
+    assert parse_mp3_frame_header(b"\xff\xfb\x92\x00", 0) == (418, 1152, 44100)
+    assert parse_mp3_frame_header(b"\x00"*4, 0) is None
+    # Bitrate index 15 is invalid
+    assert parse_mp3_frame_header(b"\xff\xfb\xf0\x00", 0) is None
+
+
+def test_cbr_mp3_duration_counts_frames():
+    assert get_duration(MP3_FRAME*100, "mp3") == 100*1152*1000//44100
+
+
+def test_mp3_duration_skips_id3_and_junk():
+    assert id3v2_size(make_id3(300)) == 310
+    assert get_duration(make_id3(300)+b"junk"+MP3_FRAME*10, "mp3") == 10*1152*1000//44100
+
+
+def test_vbr_mp3_duration_from_the_xing_tag():
+    assert get_duration(make_xing_frame(1000)+MP3_FRAME*5, "mp3") == 1000*1152*1000//44100
+
+
+def test_mp3_duration_from_a_path(tmp_path):
+    path = str(tmp_path/"speech.mp3")
+    with open(path, 'wb') as mp3file:
+        mp3file.write(MP3_FRAME*50)
+    assert get_duration(path) == 50*1152*1000//44100
+
+
+def test_not_an_mp3():
+    with pytest.raises(ValueError):
+        get_duration(b"\0"*1000, "mp3")
@@ -0,0 +1,94 @@
+# -*- coding: utf8 -*-
+
+import os
+import sys
+import time
+import wave
+
+import pytest
+
+import audioutils
+from exportworker import ExportWorker
+
+# The stand-in ffmpeg below is a script run through its #! line
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="needs #! scripts")
+
+# Stands in for ffmpeg: reports progress every FAKE_FFMPEG_DELAY seconds, fails to encode flac
+FAKE_FFMPEG = '''#!%s
+import os
+import sys
+import time
+
+output_format = sys.argv[sys.argv.index("-vn")+2]
+if (output_format == "flac"):
+    sys.stderr.write("Unknown encoder 'flac'\\n")
+    sys.exit(1)
+for second in range(10):
+    time.sleep(float(os.environ.get("FAKE_FFMPEG_DELAY", "0")))
+    print ("out_time_us=%%d"%%(second*1000000), flush=True)
+with open(sys.argv[-1], "wb") as output:
+    output.write(b"encoded")
+'''
+
+
+@pytest.fixture
+def speech(tmp_path, monkeypatch):
+    # Ten seconds of silence, exported through the stand-in ffmpeg
+    ffmpeg = tmp_path/"ffmpeg"
+    ffmpeg.write_text(FAKE_FFMPEG%sys.executable)
+    ffmpeg.chmod(0o755)
+    monkeypatch.setattr(audioutils, "get_ffmpeg", lambda: str(ffmpeg))
+    path = str(tmp_path/"speech.wav")
+    with wave.open(path, 'wb') as wavfile:
+        wavfile.setparams((1, 2, 22050, 0, "NONE", "not compressed"))
+        wavfile.writeframes(b"\0\0"*22050*10)
+    return path
+
+
+def test_every_format_is_exported_with_progress(speech, tmp_path):
+    outputs = [str(tmp_path/"out.ogg"), str(tmp_path/"out.wav")]
+    worker = ExportWorker(speech, "wav", outputs)
+
+    worker.run()
+
+    messages = worker.poll()
+    assert [message for message in messages if message[0] != "progress"] == [("exported", outputs[0]), ("exported", outputs[1]), ("done",)]
+    percents = [message[1] for message in messages if message[0] == "progress"]
+    assert percents == sorted(percents)
+    # The wav output is a plain copy, which reports no progress of its own
+    assert percents[0] == 0 and percents[-1] == 50
+    with open(outputs[0], 'rb') as output:
+        assert output.read() == b"encoded"
+
+
+def test_ffmpeg_failure_is_reported_and_the_other_formats_still_export(speech, tmp_path):
+    outputs = [str(tmp_path/"out.flac"), str(tmp_path/"out.ogg")]
+    worker = ExportWorker(speech, "wav", outputs)
+
+    worker.run()
+
+    messages = [message for message in worker.poll() if message[0] != "progress"]
+    assert messages[0][:2] == ("error", outputs[0])
+    assert "Unknown encoder 'flac'" in str(messages[0][2])
+    assert messages[1:] == [("exported", outputs[1]), ("done",)]
+    assert sorted(os.listdir(str(tmp_path))) == ["ffmpeg", "out.ogg", "speech.wav"]
+
+
+def test_cancel_mid_export_stops_ffmpeg_and_leaves_no_files(speech, tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_FFMPEG_DELAY", "0.5")
+    worker = ExportWorker(speech, "wav", [str(tmp_path/"out.ogg"), str(tmp_path/"out.mp3")])
+    worker.start()
+    deadline = time.monotonic()+10
+    while (not any(message[0] == "progress" and message[1] > 0 for message in worker.poll())):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    start_time = time.monotonic()
+    worker.cancel()
+    worker.join(10)
+
+    assert not worker.is_alive()
+    # ffmpeg is killed at its next report instead of running to the end
+    assert time.monotonic()-start_time < 2
+    assert worker.poll() == []
+    assert sorted(os.listdir(str(tmp_path))) == ["ffmpeg", "speech.wav"]
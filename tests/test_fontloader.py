@@ -0,0 +1,78 @@
+# -*- coding: utf8 -*-
+
+import os
+
+import fontloader
+from fontloader import install_font, read_marker, uninstall_font
+from toiceconfig import SUCCESS
+
+
+def make_files(tmp_path, content=b"font"):
+    font_file = str(tmp_path/"bundled"/"NotoSans-Regular.ttf")
+    os.makedirs(os.path.dirname(font_file), exist_ok=True)
+    with open(font_file, 'wb') as fontfile:
+        fontfile.write(content)
+    return font_file, str(tmp_path/"fonts"), str(tmp_path/"user"/"NotoSans-Regular.installed")
+
+
+def test_install_copies_once_and_records_it(tmp_path, monkeypatch):
+    rescans = []
+    monkeypatch.setattr(fontloader, "rescan_fonts", rescans.append)
+    font_file, fonts_dir, marker_file = make_files(tmp_path)
+    assert install_font(font_file, fonts_dir, marker_file) == SUCCESS
+    installed_file = os.path.join(fonts_dir, "NotoSans-Regular.ttf")
+    assert os.path.isfile(installed_file)
+    assert read_marker(marker_file)["file"] == installed_file
+    # Up to date: no copy and no rescan on later runs
+    assert install_font(font_file, fonts_dir, marker_file) == SUCCESS
+    assert rescans == [fonts_dir]
+
+
+def test_install_updates_our_outdated_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(fontloader, "rescan_fonts", lambda fonts_dir: None)
+    font_file, fonts_dir, marker_file = make_files(tmp_path)
+    install_font(font_file, fonts_dir, marker_file)
+    with open(font_file, 'wb') as fontfile:
+        fontfile.write(b"newer font")
+    install_font(font_file, fonts_dir, marker_file)
+    with open(os.path.join(fonts_dir, "NotoSans-Regular.ttf"), 'rb') as fontfile:
+        assert fontfile.read() == b"newer font"
+
+
+def test_a_copy_the_user_installed_is_left_alone(tmp_path, monkeypatch):
+    monkeypatch.setattr(fontloader, "rescan_fonts", lambda fonts_dir: None)
+    font_file, fonts_dir, marker_file = make_files(tmp_path)
+    os.makedirs(fonts_dir)
+    with open(os.path.join(fonts_dir, "NotoSans-Regular.ttf"), 'wb') as fontfile:
+        fontfile.write(b"the user's font")
+    assert install_font(font_file, fonts_dir, marker_file) == SUCCESS
+    assert read_marker(marker_file) is None
+    uninstall_font(marker_file)
+    assert os.path.isfile(os.path.join(fonts_dir, "NotoSans-Regular.ttf"))
+
+
+def test_uninstall_removes_our_copy(tmp_path, monkeypatch):
+    rescans = []
+    monkeypatch.setattr(fontloader, "rescan_fonts", rescans.append)
+    font_file, fonts_dir, marker_file = make_files(tmp_path)
+    install_font(font_file, fonts_dir, marker_file)
+    uninstall_font(marker_file)
+    assert not os.path.exists(os.path.join(fonts_dir, "NotoSans-Regular.ttf"))
+    assert not os.path.exists(marker_file)
+    assert rescans == [fonts_dir, fonts_dir]
+
+
+def test_path_only_markers_of_older_versions_are_ours(tmp_path, monkeypatch):
+    monkeypatch.setattr(fontloader, "rescan_fonts", lambda fonts_dir: None)
+    font_file, fonts_dir, marker_file = make_files(tmp_path)
+    installed_file = os.path.join(fonts_dir, "NotoSans-Regular.ttf")
+    os.makedirs(fonts_dir)
+    os.makedirs(os.path.dirname(marker_file))
+    with open(installed_file, 'wb') as fontfile:
+        fontfile.write(b"old font")
+    with open(marker_file, 'w', encoding="UTF-8") as marker:
+        marker.write(installed_file)
+    install_font(font_file, fonts_dir, marker_file)
+    with open(installed_file, 'rb') as fontfile:
+        assert fontfile.read() == b"font"
+    assert "sha256" in read_marker(marker_file)
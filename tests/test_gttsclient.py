@@ -0,0 +1,148 @@
+# -*- coding: utf8 -*-
+
+import os
+import sys
+
+import pytest
+
+import gttsclient
+from gttsclient import GTTSClient, GTTSClientError, TokenBucket
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from gttsstandin import StandInServer
+
+TEXT = "The stand-in reads this sentence aloud. "*8
+
+
+class FakeTime:
+
+    # Stands in for the time module: sleeping only moves the clock
+
+    def __init__(self):
+
+        self.now = 1000.0
+        self.slept = []
+
+
+    def monotonic(self):
+        return self.now
+
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class Response:
+
+    def __init__(self, headers):
+
+        self.headers = headers
+
+
+@pytest.fixture
+def server():
+    server = StandInServer().start()
+    yield server
+    server.stop()
+
+
+def make_client(server, **kwargs):
+    return GTTSClient(url=server.url, backoff=0.001, max_backoff=0.01, **kwargs)
+
+
+def test_token_bucket_allows_a_burst_then_the_rate(monkeypatch):
+    fake_time = FakeTime()
+    monkeypatch.setattr(gttsclient, "time", fake_time)
+    bucket = TokenBucket(rate=4, capacity=2)
+    for i in range(2):
+        bucket.acquire()
+    assert fake_time.slept == []
+    for i in range(4):
+        bucket.acquire()
+    # Four more tokens at four per second
+    assert fake_time.now == pytest.approx(1001.0)
+
+
+def test_token_bucket_refills_up_to_its_capacity(monkeypatch):
+    fake_time = FakeTime()
+    monkeypatch.setattr(gttsclient, "time", fake_time)
+    bucket = TokenBucket(rate=10, capacity=3)
+    for i in range(3):
+        bucket.acquire()
+    fake_time.now += 60
+    for i in range(3):
+        bucket.acquire()
+    assert fake_time.slept == []
+    bucket.acquire()
+    assert sum(fake_time.slept) == pytest.approx(0.1)
+
+
+def test_backoff_is_jittered_and_capped():
+    client = GTTSClient(backoff=0.5, max_backoff=4.0)
+    try:
+        for attempt in range(8):
+            delays = [client.get_delay(attempt) for i in range(50)]
+            assert all(0 <= delay <= min(4.0, 0.5*2**attempt) for delay in delays)
+            assert len(set(delays)) > 1
+        assert client.get_delay(0, Response({"Retry-After": "3"})) >= 3
+        assert client.get_delay(0, Response({"Retry-After": "120"})) <= 4.0
+        assert client.get_delay(0, Response({"Retry-After": "soon"})) <= 0.5
+    finally:
+        client.close()
+
+
+def test_synthesize_joins_segments_in_text_order(server):
+    client = make_client(server, concurrency=4)
+    try:
+        audio = client.synthesize(TEXT)
+        segments = [client.fetch(server.url, body) for body in gttsclient.gtts.gTTS(text=TEXT).get_bodies()]
+    finally:
+        client.close()
+    assert len(segments) > 1
+    assert audio == b"".join(segments)
+
+
+def test_transient_failures_are_retried(server):
+    server.failure_rate = 0.5
+    client = make_client(server, concurrency=4, rate=1000, retries=20)
+    try:
+        assert len(client.synthesize(TEXT)) > 0
+    finally:
+        client.close()
+    assert client.retries_made == server.counts["failed"] > 0
+
+
+def test_gives_up_after_the_retries(server):
+    server.failure_rate = 1.0
+    client = make_client(server, concurrency=1, retries=2)
+    try:
+        with pytest.raises(GTTSClientError) as error:
+            client.synthesize("Never answered.")
+    finally:
+        client.close()
+    assert error.value.status == 503
+    assert server.requests == 3
+
+
+def test_refused_requests_are_not_retried(server):
+    client = make_client(server, retries=5)
+    try:
+        with pytest.raises(GTTSClientError) as error:
+            client.fetch(server.url, "not an rpc")
+    finally:
+        client.close()
+    assert error.value.status == 400
+    assert server.requests == 1
+
+
+def test_rate_limited_requests_are_retried(server):
+    server.latency = 0.02
+    server.max_inflight = 1
+    client = make_client(server, concurrency=4, rate=1000, retries=50)
+    try:
+        assert len(client.synthesize(TEXT)) > 0
+    finally:
+        client.close()
+    assert server.counts["rate_limited"] > 0
@@ -0,0 +1,112 @@
+# -*- coding: utf8 -*-
+
+import os
+import json
+
+import langpacks
+from langpacks import LanguagePackIndex, parse_langpack
+
+LANGDIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "languages")
+
+
+def write_pack(path, name, strings):
+    lines = ["LanguageName = %s\n"%name]+["%s = %s\n"%(key, value) for key, value in strings.items()]
+    path.write_text("".join(lines), encoding="UTF-8")
+
+
+def count_parses(monkeypatch):
+    parsed = []
+
+    def parse(path):
+        parsed.append(os.path.basename(path))
+        return parse_langpack(path)
+
+    monkeypatch.setattr(langpacks, "parse_langpack", parse)
+    return parsed
+
+
+def test_parse_langpack(tmp_path):
+    path = tmp_path/"xx.lang"
+    path.write_text("\n\nLanguageName = Test\n\nGreeting = Hello<BREAK>there\nNo equals sign\n", encoding="UTF-8")
+    assert parse_langpack(str(path)) == ("Test", {"LanguageName": "Test", "Greeting": "Hello\nthere"})
+    path.write_text("Greeting = Hello\nLanguageName = Test\n", encoding="UTF-8")
+    assert parse_langpack(str(path)) == (None, {})
+
+
+def test_shipped_packs_have_every_english_string(tmp_path):
+    index = LanguagePackIndex(LANGDIR, str(tmp_path/"languages.json"))
+    english = index.get_strings("English (US)")
+    assert index.get_invalid_files() == []
+    assert "English (US)" in index.get_names()
+    for name in index.get_names():
+        assert set(index.get_strings(name)) == set(english), name
+
+
+def test_lookups_and_fallbacks(tmp_path):
+    langdir = tmp_path/"languages"
+    langdir.mkdir()
+    write_pack(langdir/"en.lang", "English", {"Greeting": "Hello"})
+    (langdir/"broken.lang").write_text("Greeting = Hello\n", encoding="UTF-8")
+    (langdir/"latin1.lang").write_bytes("LanguageName = Fran\xe7ais\n".encode("latin-1"))
+    (langdir/"notes.txt").write_text("LanguageName = Notes\n", encoding="UTF-8")
+
+    index = LanguagePackIndex(str(langdir), str(tmp_path/"cache"/"languages.json"))
+
+    assert index.get_languages() == {"English": str(langdir/"en.lang")}
+    assert index.get_names() == ["English"]
+    assert sorted(index.get_invalid_files()) == [str(langdir/"broken.lang"), str(langdir/"latin1.lang")]
+    assert index.get_strings("English")["Greeting"] == "Hello"
+    # Callers layer a pack's strings over their defaults, an unknown language leaves them as they are
+    assert index.get_strings("Klingon") == {}
+    # A copy, so that callers can not change the index
+    index.get_strings("English")["Greeting"] = "Changed"
+    assert index.get_strings("English")["Greeting"] == "Hello"
+
+
+def test_packs_are_only_parsed_again_when_they_change(tmp_path, monkeypatch):
+    langdir = tmp_path/"languages"
+    langdir.mkdir()
+    index_file = str(tmp_path/"cache"/"languages.json")
+    write_pack(langdir/"en.lang", "English", {"Greeting": "Hello"})
+    write_pack(langdir/"de.lang", "Deutsch", {"Greeting": "Hallo"})
+    parsed = count_parses(monkeypatch)
+
+    LanguagePackIndex(str(langdir), index_file)
+    assert sorted(parsed) == ["de.lang", "en.lang"]
+
+    # A fresh index, as at the next startup, reads everything from the cache file
+    del parsed[:]
+    LanguagePackIndex(str(langdir), index_file)
+    assert parsed == []
+
+    write_pack(langdir/"de.lang", "Deutsch", {"Greeting": "Guten Tag"})
+    (langdir/"en.lang").unlink()
+    index = LanguagePackIndex(str(langdir), index_file)
+    assert parsed == ["de.lang"]
+    assert index.get_names() == ["Deutsch"]
+    assert index.get_strings("Deutsch")["Greeting"] == "Guten Tag"
+    with open(index_file, encoding="UTF-8") as indexfile:
+        assert list(json.load(indexfile)) == ["de.lang"]
+
+
+def test_unreadable_cache_file_is_rebuilt(tmp_path, monkeypatch):
+    langdir = tmp_path/"languages"
+    langdir.mkdir()
+    write_pack(langdir/"en.lang", "English", {"Greeting": "Hello"})
+    index_file = tmp_path/"languages.json"
+    for contents in ("{not json", "[1, 2]", '{"en.lang": "not a pack"}'):
+        index_file.write_text(contents, encoding="UTF-8")
+        parsed = count_parses(monkeypatch)
+
+        index = LanguagePackIndex(str(langdir), str(index_file))
+
+        assert parsed == ["en.lang"]
+        assert index.get_strings("English")["Greeting"] == "Hello"
+        with open(str(index_file), encoding="UTF-8") as indexfile:
+            assert json.load(indexfile)["en.lang"]["name"] == "English"
+
+
+def test_missing_language_directory_has_no_languages(tmp_path):
+    index = LanguagePackIndex(str(tmp_path/"nowhere"), str(tmp_path/"languages.json"))
+    assert index.get_languages() == {}
+    assert index.get_invalid_files() == []
@@ -0,0 +1,100 @@
+# -*- coding: utf8 -*-
+
+import io
+import wave
+
+from seekindex import AudioSlice, build_seek_index, get_seek_path, load_seek_index, open_audio_at, save_seek_index
+
+SAMPLE_RATE = 22050
+
+# A silent MPEG 1 layer III frame, 128 kbps, 44.1 kHz, stereo: 417 bytes and 1152 samples
+MP3_FRAME = b"\xff\xfb\x90\x00"+b"\x00"*413
+
+
+def make_wav(seconds):
+    # Every frame holds its own index, so that a slice shows where it starts
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wavfile:
+        wavfile.setparams((1, 2, SAMPLE_RATE, 0, "NONE", "not compressed"))
+        wavfile.writeframes(b"".join((i % 32768).to_bytes(2, "little") for i in range(int(seconds*SAMPLE_RATE))))
+    return buffer.getvalue()
+
+
+def make_info_frame():
+    frame = bytearray(MP3_FRAME)
+    frame[36:40] = b"Info"
+    return bytes(frame)
+
+
+def test_wav_locate():
+    index = build_seek_index(make_wav(2), "wav")
+    assert index.locate(0) == (44, 0)
+    assert index.locate(1000) == (44+SAMPLE_RATE*2, 1000)
+    assert index.locate(-5) == (44, 0)
+    # Past the end it stops at the last frame
+    assert index.locate(60000)[0] == 44+2*SAMPLE_RATE*2
+
+
+def test_wav_slice_is_a_wav_starting_at_the_position():
+    wav = make_wav(2)
+    audiofile, start = open_audio_at(wav, build_seek_index(wav, "wav"), 500)
+    assert start == 500
+    with wave.open(audiofile, 'rb') as sliced:
+        assert sliced.getframerate() == SAMPLE_RATE
+        assert sliced.getnframes() == SAMPLE_RATE*3//2
+        first = int.from_bytes(sliced.readframes(1), "little")
+    assert first == SAMPLE_RATE//2
+
+
+def test_mp3_locate_skips_the_info_frame():
+    data = make_info_frame()+MP3_FRAME*100
+    index = build_seek_index(data, "mp3")
+    assert len(index.frame_offsets) == 100
+    assert index.locate(0) == (417, 0)
+    # 1 s is 38.28 frames
+    assert index.locate(1000) == (417*39, 38*1152*1000//44100)
+    assert index.locate(10**6)[0] == 417*100
+
+
+def test_mp3_slice_starts_at_a_frame():
+    data = MP3_FRAME*100
+    audiofile, start = open_audio_at(data, build_seek_index(data, "mp3"), 1000)
+    assert start == 38*1152*1000//44100
+    assert audiofile.read() == MP3_FRAME*62
+
+
+def test_seek_files_round_trip(tmp_path):
+    for audio_format, data in (("wav", make_wav(1)), ("mp3", MP3_FRAME*20)):
+        path = str(tmp_path/("speech.seek"))
+        index = build_seek_index(data, audio_format)
+        save_seek_index(index, path)
+        loaded = load_seek_index(path)
+        assert loaded.audio_format == audio_format
+        assert loaded.sample_rate == index.sample_rate
+        for position in (0, 250, 700, 5000):
+            assert loaded.locate(position) == index.locate(position)
+
+
+def test_unusable_seek_files(tmp_path):
+    path = str(tmp_path/"speech.seek")
+    assert load_seek_index(path) is None
+    with open(path, 'wb') as seekfile:
+        seekfile.write(b"JUNK"*20)
+    assert load_seek_index(path) is None
+    # Truncated frame table
+    save_seek_index(build_seek_index(MP3_FRAME*20, "mp3"), path)
+    with open(path, 'r+b') as seekfile:
+        seekfile.truncate(seekfile.seek(0, 2)-4)
+    assert load_seek_index(path) is None
+
+
+def test_audio_slice_reads_prefix_then_region():
+    audio_slice = AudioSlice(io.BytesIO(b"0123456789"), 3, 7, b"ab")
+    assert audio_slice.read() == b"ab3456"
+    audio_slice.seek(1)
+    assert audio_slice.read(3) == b"b34"
+    assert audio_slice.seek(0, io.SEEK_END) == 6
+
+
+def test_seek_path():
+    assert get_seek_path("/cache/key_1.mp3") == "/cache/key_1.seek"
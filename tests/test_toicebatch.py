@@ -0,0 +1,35 @@
+# -*- coding: utf8 -*-
+
+import os
+import time
+
+import toicebatch
+from toicebatch import BatchRunner
+
+export_audio = toicebatch.export_audio
+
+
+def slow_export(source, output_path, output_format=None, *args, **kwargs):
+    # Widens the window between synthesis and export, in which other jobs add to the cache
+    time.sleep(0.005)
+    return export_audio(source, output_path, output_format, *args, **kwargs)
+
+
+def make_runner(config, backend, output_dir, jobs):
+    runner = BatchRunner(config, output_dir, ["wav"], jobs)
+    runner.synthesizer.backends["Pyttsx3"] = backend
+    return runner
+
+
+def test_entries_are_not_evicted_before_they_are_exported(userdir, config, backend, large_texts, monkeypatch):
+    monkeypatch.setattr(toicebatch, "export_audio", slow_export)
+    runner = make_runner(config, backend, str(userdir/"out"), 4)
+    entries = [{"text": text, "line": i+1} for i, text in enumerate(large_texts(60, "Entry"))]
+
+    summary = runner.run(entries)
+
+    assert runner.failures == []
+    assert summary["succeeded"] == 60
+    assert len(os.listdir(str(userdir/"out"))) == 60
+    # The cache still evicted, just never an entry being exported
+    assert len(runner.cache.entries) < 60
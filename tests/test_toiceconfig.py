@@ -0,0 +1,125 @@
+# -*- coding: utf8 -*-
+
+import os
+
+import pytest
+
+from toiceconfig import (CONFIG_CHECKS, DEFAULT_CONFIG, ConfigFile, check_color, check_formats, check_int,
+                         get_synthesis_workers, override_settings, parse_settings, validate_config)
+
+
+def test_parse_settings():
+    lines = ["# comment\n", "// comment\n", "FontSize = 24\n", "TextboxFG=#ff0000 \n", "no equals sign\n", "Empty =\n"]
+    assert parse_settings(lines) == {"FontSize": "24", "TextboxFG": "#ff0000", "Empty": ""}
+
+
+def test_defaults_are_valid():
+    validated, problems = validate_config(DEFAULT_CONFIG)
+    assert validated == DEFAULT_CONFIG
+    assert problems == []
+
+
+def test_missing_invalid_and_unknown_keys():
+    config = dict(DEFAULT_CONFIG, FontSize="huge", Pyttsx3Speed="400", Color="blue")
+    del config["LoopAudio"]
+    validated, problems = validate_config(config)
+    assert validated["FontSize"] == DEFAULT_CONFIG["FontSize"]
+    assert validated["Pyttsx3Speed"] == DEFAULT_CONFIG["Pyttsx3Speed"]
+    assert validated["LoopAudio"] == DEFAULT_CONFIG["LoopAudio"]
+    assert "Color" not in validated
+    assert sorted(problems) == [("Color", "unknown"), ("FontSize", "invalid"), ("LoopAudio", "missing"), ("Pyttsx3Speed", "invalid")]
+
+
+def test_valid_values_are_kept(tmp_path):
+    config = dict(DEFAULT_CONFIG, FontSize="32", WindowMaximized="1", APIInUse="GTTS", LastSavedInDirectory=str(tmp_path),
+                  TextboxBG="#1c1b22", ExtraExportFormats=" .OGG, flac")
+    validated, problems = validate_config(config)
+    assert problems == []
+    assert validated["ExtraExportFormats"] == "ogg,flac"
+    assert validated["LastSavedInDirectory"] == str(tmp_path)
+
+
+def test_checks():
+    assert check_int("5", (0, 10)) == "5"
+    for value, limits in (("1.0", None), ("11", (0, 10)), ("-1", (0, None))):
+        with pytest.raises(ValueError):
+            check_int(value, limits)
+    assert check_color("#abc", None) == "#abc"
+    assert check_color("light blue", None) == "light blue"
+    with pytest.raises(ValueError):
+        check_color("#abcd1", None)
+    with pytest.raises(ValueError):
+        check_formats("mp3,exe", ("mp3", "wav"))
+    with pytest.raises(ValueError):
+        CONFIG_CHECKS["backend"]("NoSuchEngine", None)
+
+
+def test_checks_can_be_replaced():
+    # The GUI swaps in checks that need Tk, like its own color check
+    checks = dict(CONFIG_CHECKS, color=lambda value, options: value.upper())
+    validated, problems = validate_config(dict(DEFAULT_CONFIG), checks)
+    assert validated["TextboxFG"] == "BLACK"
+
+
+def test_override_settings():
+    config = override_settings(DEFAULT_CONFIG, {"rate": 200, "voice": "1", "text": "ignored"})
+    assert config["Pyttsx3Speed"] == "200"
+    assert config["Pyttsx3VoiceID"] == "1"
+    assert DEFAULT_CONFIG["Pyttsx3Speed"] == "150"
+    for overrides in ({"api": "NoSuchEngine"}, {"rate": 10}, {"volume": 101}, {"voice": -1}):
+        with pytest.raises(ValueError):
+            override_settings(DEFAULT_CONFIG, overrides)
+
+
+def test_overrides_are_normalized_and_errors_name_the_key():
+    config = override_settings(DEFAULT_CONFIG, {"rate": " 0200", "volume": "050"})
+    assert config["Pyttsx3Speed"] == "200"
+    assert config["Pyttsx3Volume"] == "50"
+    with pytest.raises(ValueError, match="rate must be an integer from 50 to 300, not 'fast'"):
+        override_settings(DEFAULT_CONFIG, {"rate": "fast"})
+    with pytest.raises(ValueError, match="voice must be an integer of at least 0"):
+        override_settings(DEFAULT_CONFIG, {"voice": "-1"})
+    with pytest.raises(ValueError, match="api must be one of Pyttsx3, GTTS"):
+        override_settings(DEFAULT_CONFIG, {"api": "NoSuchEngine"})
+
+
+def test_synthesis_workers():
+    assert DEFAULT_CONFIG["SynthesisWorkers"] == "0"
+    assert get_synthesis_workers(DEFAULT_CONFIG) == 1
+    assert get_synthesis_workers({"Pyttsx3Workers": "3"}) == 3
+    assert get_synthesis_workers({"SynthesisWorkers": "0", "Pyttsx3Workers": "3"}) == 3
+    assert get_synthesis_workers({"SynthesisWorkers": "6", "Pyttsx3Workers": "3"}) == 6
+    validated, problems = validate_config({"SynthesisWorkers": "65"})
+    assert validated["SynthesisWorkers"] == "0"
+    assert [key for key, problem in problems if key == "SynthesisWorkers"]
+
+
+def test_command_backends_use_synthesis_workers():
+    from ttsengine import CommandBackend
+    assert CommandBackend().get_workers({"SynthesisWorkers": "5", "Pyttsx3Workers": "2"}) == 5
+    assert CommandBackend().get_workers({"SynthesisWorkers": "0", "Pyttsx3Workers": "2"}) == 2
+
+
+def test_config_file_only_writes_changes(tmp_path):
+    path = str(tmp_path/"toice"/"config.cfg")
+    configfile = ConfigFile(path)
+    assert configfile.read() == {}
+    assert configfile.write(DEFAULT_CONFIG)
+    assert ConfigFile(path).read() == DEFAULT_CONFIG
+
+    mtime = os.stat(path).st_mtime_ns
+    assert not configfile.write(dict(DEFAULT_CONFIG))
+    assert os.stat(path).st_mtime_ns == mtime
+
+    changed = dict(DEFAULT_CONFIG, FontSize="30")
+    assert configfile.dirty_keys(changed) == ["FontSize"]
+    assert configfile.write(changed)
+    assert ConfigFile(path).read()["FontSize"] == "30"
+    assert not os.path.exists(path+".tmp")
+
+
+def test_config_file_notices_removed_keys(tmp_path):
+    path = str(tmp_path/"config.cfg")
+    configfile = ConfigFile(path)
+    configfile.write({"A": "1", "B": "2"})
+    assert configfile.dirty_keys({"A": "1"}) == ["B"]
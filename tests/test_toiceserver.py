@@ -0,0 +1,120 @@
+# -*- coding: utf8 -*-
+
+import json
+import asyncio
+
+import pytest
+
+from toiceserver import MAX_BODY_BYTES, HTTPError, ToiceServer
+
+
+def make_server(config, backend, workers, queue_size=64):
+    server = ToiceServer(config, workers, queue_size, logging=False)
+    server.synthesizer.backends["Pyttsx3"] = backend
+    return server
+
+
+async def synthesize_all(server, texts):
+    return await asyncio.gather(*(server.handle_synthesize(json.dumps({"text": text}).encode("UTF-8")) for text in texts), return_exceptions=True)
+
+
+async def serve(server, requests):
+    # The workers run on the same event loop as the requests, since the server's queue is bound to the loop that first uses it
+    tasks = [asyncio.create_task(server.run_worker()) for i in range(server.workers)]
+    try:
+        return await requests
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def test_concurrent_requests_get_their_audio_from_a_tiny_cache(userdir, config, backend, large_texts):
+    server = make_server(config, backend, 4)
+    texts = large_texts(40, "Request")
+
+    async def requests():
+        responses = await synthesize_all(server, texts)
+        cached = [text for text in texts if server.cache.make_key(text, server.config) in server.cache.entries]
+        return responses, cached, await synthesize_all(server, cached)
+
+    responses, cached, hits = asyncio.run(serve(server, requests()))
+
+    for response in responses:
+        assert not isinstance(response, Exception), repr(response)
+        content_type, audio = response
+        assert content_type == "audio/wav"
+        assert audio[:4] == b"RIFF"
+    # Cache hits are served through the same pinned read
+    assert len(cached) != 0
+    assert [audio[:4] for content_type, audio in hits] == [b"RIFF"]*len(cached)
+
+
+def test_identical_requests_share_one_synthesis(userdir, config, engine, backend):
+    server = make_server(config, backend, 2)
+
+    responses = asyncio.run(serve(server, synthesize_all(server, ["Said only once."]*5)))
+
+    assert engine.calls == 1
+    assert len(set(audio for content_type, audio in responses)) == 1
+
+
+def read_request(server, data):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await server.read_request(reader)
+    return asyncio.run(read())
+
+
+@pytest.mark.parametrize("length, status", [("ten", 400), ("", 400), ("-5", 400), (str(MAX_BODY_BYTES+1), 413)])
+def test_bad_content_lengths_are_rejected(userdir, config, backend, length, status):
+    server = make_server(config, backend, 1)
+    with pytest.raises(HTTPError) as error:
+        read_request(server, ("POST /synthesize HTTP/1.1\r\nContent-Length: %s\r\n\r\n{}"%length).encode("latin-1"))
+    assert error.value.status == status
+
+
+def test_request_body_is_read_to_its_length(userdir, config, backend):
+    server = make_server(config, backend, 1)
+    body = b'{"text": "Hi"}'
+    request = b"POST /synthesize HTTP/1.1\r\nContent-Length: %d\r\n\r\n"%len(body)+body
+    assert read_request(server, request) == ("POST", "/synthesize", body)
+    assert read_request(server, b"GET /health HTTP/1.1\r\n\r\n") == ("GET", "/health", b"")
+
+
+class Writer:
+
+    # Collects a response in place of the connection's StreamWriter
+
+    def __init__(self):
+
+        self.data = b""
+
+
+    def write(self, data):
+        self.data += data
+
+
+    async def drain(self):
+        pass
+
+
+    def close(self):
+        pass
+
+
+def test_bad_content_length_gets_a_400_response(userdir, config, backend):
+    server = make_server(config, backend, 1)
+    writer = Writer()
+
+    async def connect():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"POST /synthesize HTTP/1.1\r\nContent-Length: ten\r\n\r\n")
+        reader.feed_eof()
+        await server.handle_connection(reader, writer)
+
+    asyncio.run(connect())
+
+    assert writer.data.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+    assert b"invalid Content-Length: ten" in writer.data
@@ -0,0 +1,206 @@
+# -*- coding: utf8 -*-
+
+import os
+import json
+import time
+
+import pytest
+
+import ttscache
+from ttscache import TTSCache, IN_USE_SECONDS
+
+CONFIG = {"APIInUse": "Pyttsx3", "Pyttsx3Speed": "150", "Pyttsx3Volume": "67", "Pyttsx3VoiceID": "0"}
+
+
+class Clock:
+
+    # Stands in for the time module, so that entries get distinct last_used values
+
+    def __init__(self):
+
+        self.now = time.time()
+
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+
+    def time_ns(self):
+        return int(self.time()*1e9)
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ttscache, "time", clock)
+    return clock
+
+
+def write_audio(cache, key, size):
+    path = cache.new_path(key, ".wav")
+    with open(path, 'wb') as audiofile:
+        audiofile.write(b"\0"*size)
+    return path
+
+
+def make_old(path):
+    old = time.time()-IN_USE_SECONDS-60
+    os.utime(path, (old, old))
+
+
+def test_make_key_depends_on_text_and_settings():
+    key = TTSCache.make_key("hello", CONFIG)
+    assert key == TTSCache.make_key("hello", dict(CONFIG))
+    assert key != TTSCache.make_key("hello!", CONFIG)
+    assert key != TTSCache.make_key("hello", dict(CONFIG, Pyttsx3Speed="151"))
+
+
+def test_lookup(tmp_path):
+    cache = TTSCache(str(tmp_path), 1024)
+    assert cache.lookup("a") is None
+    path = write_audio(cache, "a", 10)
+    cache.add("a", path, 1500)
+    assert cache.lookup("a") == path
+    assert cache.get_duration(path) == 1500
+    os.remove(path)
+    assert cache.lookup("a") is None
+
+
+def test_add_replaces_the_old_file(tmp_path):
+    cache = TTSCache(str(tmp_path), 1024)
+    old_path = write_audio(cache, "a", 10)
+    cache.add("a", old_path)
+    new_path = write_audio(cache, "a", 10)
+    cache.add("a", new_path)
+    assert cache.lookup("a") == new_path
+    assert not os.path.exists(old_path)
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = TTSCache(str(tmp_path), 250)
+    paths = {}
+    for key in ("a", "b"):
+        paths[key] = write_audio(cache, key, 100)
+        cache.add(key, paths[key])
+    # Using a makes b the least recently used
+    cache.lookup("a")
+    paths["c"] = write_audio(cache, "c", 100)
+    cache.add("c", paths["c"])
+    assert cache.lookup("b") is None
+    assert not os.path.exists(paths["b"])
+    assert cache.lookup("a") == paths["a"]
+    assert cache.lookup("c") == paths["c"]
+    assert cache.total_bytes() <= 250
+
+
+def test_never_evicts_the_entry_being_added(tmp_path):
+    cache = TTSCache(str(tmp_path), 50)
+    path = write_audio(cache, "a", 100)
+    cache.add("a", path)
+    assert cache.lookup("a") == path
+
+
+def test_set_max_bytes_evicts(tmp_path):
+    cache = TTSCache(str(tmp_path), 1000)
+    for key in ("a", "b", "c"):
+        cache.add(key, write_audio(cache, key, 100))
+    cache.set_max_bytes(150)
+    assert cache.total_bytes() <= 150
+    assert cache.lookup("c") is not None
+
+
+def test_sidecars_go_with_their_entry(tmp_path):
+    cache = TTSCache(str(tmp_path), 150)
+    path = write_audio(cache, "a", 100)
+    peaks = os.path.splitext(path)[0]+".peaks"
+    open(peaks, 'wb').close()
+    cache.add("a", path)
+    cache.add("b", write_audio(cache, "b", 100))
+    assert not os.path.exists(peaks)
+
+
+def test_index_survives_a_restart(tmp_path):
+    cache = TTSCache(str(tmp_path), 1024)
+    path = write_audio(cache, "a", 10)
+    cache.add("a", path, 1200)
+    cache.close()
+    cache = TTSCache(str(tmp_path), 1024)
+    assert cache.lookup("a") == path
+    assert cache.get_duration(path) == 1200
+
+
+def test_removes_only_old_orphans(tmp_path):
+    cache = TTSCache(str(tmp_path), 1024)
+    indexed = write_audio(cache, "a", 10)
+    cache.add("a", indexed)
+    old_orphan = write_audio(cache, "b", 10)
+    make_old(old_orphan)
+    new_orphan = write_audio(cache, "c", 10)
+    old_sidecar = os.path.join(str(tmp_path), "gone_1.seek")
+    open(old_sidecar, 'wb').close()
+    make_old(old_sidecar)
+    TTSCache(str(tmp_path), 1024)
+    assert os.path.exists(indexed)
+    assert not os.path.exists(old_orphan)
+    assert not os.path.exists(old_sidecar)
+    # Possibly still being written by another process
+    assert os.path.exists(new_orphan)
+
+
+def test_processes_sharing_a_directory_keep_each_others_entries(tmp_path):
+    first = TTSCache(str(tmp_path), 1024)
+    second = TTSCache(str(tmp_path), 1024)
+    first.add("a", write_audio(first, "a", 10))
+    second.add("b", write_audio(second, "b", 10))
+    first.close()
+    with open(os.path.join(str(tmp_path), "index.json"), encoding="UTF-8") as indexfile:
+        assert set(json.load(indexfile)) == {"a", "b"}
+    third = TTSCache(str(tmp_path), 1024)
+    assert third.lookup("a") is not None
+    assert third.lookup("b") is not None
+
+
+def test_removed_entries_are_not_merged_back(tmp_path):
+    first = TTSCache(str(tmp_path), 150)
+    first.add("a", write_audio(first, "a", 100))
+    first.add("b", write_audio(first, "b", 100))
+    assert first.lookup("a") is None
+    second = TTSCache(str(tmp_path), 150)
+    assert second.lookup("a") is None
+    assert second.lookup("b") is not None
+
+
+def test_recent_entries_of_other_processes_are_not_evicted(tmp_path):
+    first = TTSCache(str(tmp_path), 150)
+    first_path = write_audio(first, "a", 100)
+    first.add("a", first_path)
+    second = TTSCache(str(tmp_path), 150)
+    second.add("b", write_audio(second, "b", 100))
+    assert os.path.exists(first_path)
+    make_old(first_path)
+    second.add("c", write_audio(second, "c", 100))
+    assert not os.path.exists(first_path)
+
+
+def test_pinned_entries_are_not_evicted_until_released(tmp_path):
+    cache = TTSCache(str(tmp_path), 150)
+    path = write_audio(cache, "a", 100)
+    cache.add("a", path, pin=True)
+    cache.add("b", write_audio(cache, "b", 100))
+    assert os.path.exists(path)
+    cache.release(path)
+    cache.add("c", write_audio(cache, "c", 100))
+    assert not os.path.exists(path)
+
+
+def test_replaced_pinned_file_is_removed_on_release(tmp_path):
+    cache = TTSCache(str(tmp_path), 1024)
+    cache.add("a", write_audio(cache, "a", 10))
+    old_path = cache.lookup("a", pin=True)
+    new_path = write_audio(cache, "a", 10)
+    cache.add("a", new_path)
+    assert os.path.exists(old_path)
+    cache.release(old_path)
+    assert not os.path.exists(old_path)
+    assert cache.lookup("a") == new_path
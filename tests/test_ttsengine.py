@@ -0,0 +1,130 @@
+# -*- coding: utf8 -*-
+
+import time
+import threading
+
+import pytest
+
+import ttsengine
+from toiceconfig import DEFAULT_CONFIG
+from ttsengine import (CommandBackend, Pyttsx3Engine, Pyttsx3ProcessPool, TTSBackend, create_backend,
+                       create_standalone_backend, get_audio_format, get_available_backends, get_backends, load_backend_plugins,
+                       register_backend)
+
+PLUGIN = '''
+from ttsengine import TTSBackend, register_backend
+
+@register_backend
+class PluginBackend(TTSBackend):
+    name = "Plugin"
+    audio_format = "mp3"
+'''
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    # A copy of the registry for the test to change, with the user's own plugins left unloaded
+    monkeypatch.setattr(ttsengine, "BACKENDS", dict(ttsengine.BACKENDS))
+    monkeypatch.setattr(ttsengine, "PLUGIN_ERRORS", [])
+    monkeypatch.setattr(ttsengine, "plugins_loaded", True)
+    return ttsengine.BACKENDS
+
+
+class CountingBackend(CommandBackend):
+
+    # Counts the programs running at once instead of running any
+
+    program = "counting"
+
+    def __init__(self):
+
+        super().__init__()
+        self.running = 0
+        self.most_running = 0
+        self.lock = threading.Lock()
+
+
+    def synthesize(self, text, output_path, config):
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+        return output_path
+
+
+def test_builtin_backends_are_registered_in_order():
+    assert list(get_backends())[:4] == ["Pyttsx3", "GTTS", "espeak-ng", "Piper"]
+    assert get_audio_format("Pyttsx3") == "wav"
+    assert get_audio_format("GTTS") == "mp3"
+    assert get_audio_format("NoSuchEngine") == "wav"
+
+
+def test_registered_backends_can_be_created(registry):
+    @register_backend
+    class OggBackend(TTSBackend):
+        name = "Ogg"
+        audio_format = "ogg"
+
+    assert registry["Ogg"] is OggBackend
+    assert get_audio_format("Ogg") == "ogg"
+    engine = object()
+    backend = create_backend("Ogg", engine)
+    assert isinstance(backend, OggBackend)
+    assert backend.pyttsx3_engine is engine
+    assert create_backend("NoSuchEngine") is None
+
+
+def test_plugins_register_backends_and_failures_are_kept(registry, tmp_path, monkeypatch):
+    (tmp_path/"plugin.py").write_text(PLUGIN)
+    (tmp_path/"broken.py").write_text("raise RuntimeError('broken plugin')\n")
+    (tmp_path/"notes.txt").write_text("not a plugin\n")
+    monkeypatch.setattr(ttsengine, "plugins_loaded", False)
+
+    load_backend_plugins(str(tmp_path))
+
+    assert get_audio_format("Plugin") == "mp3"
+    assert [(path, str(error)) for path, error in ttsengine.PLUGIN_ERRORS] == [(str(tmp_path/"broken.py"), "broken plugin")]
+    # Plugins are only ever loaded once
+    (tmp_path/"plugin.py").unlink()
+    load_backend_plugins(str(tmp_path))
+    assert "Plugin" in get_backends()
+    assert len(ttsengine.PLUGIN_ERRORS) == 1
+
+
+def test_missing_programs_are_not_available(registry, monkeypatch):
+    monkeypatch.setattr(ttsengine, "which", lambda program: "/usr/bin/espeak-ng" if program == "espeak-ng" else None)
+    assert get_available_backends() == ["Pyttsx3", "GTTS", "espeak-ng"]
+
+
+def test_standalone_backends_bring_their_engines():
+    backend = create_standalone_backend("Pyttsx3", 1)
+    assert isinstance(backend.pyttsx3_engine, Pyttsx3Engine)
+    backend.shutdown()
+    backend = create_standalone_backend("Pyttsx3", 3)
+    assert isinstance(backend.pyttsx3_engine, Pyttsx3ProcessPool)
+    assert backend.pyttsx3_engine.workers == 3
+    backend.shutdown()
+    assert create_standalone_backend("GTTS", 3).pyttsx3_engine is None
+    assert create_standalone_backend("NoSuchEngine", 3) is None
+
+
+def test_synthesis_workers_bound_the_programs_running_at_once(monkeypatch):
+    monkeypatch.setattr(CommandBackend, "executor", None)
+    monkeypatch.setattr(CommandBackend, "executor_workers", None)
+    backend = CountingBackend()
+
+    config = dict(DEFAULT_CONFIG, SynthesisWorkers="3")
+    futures = [backend.submit("Text %d"%i, "out%d.wav"%i, config) for i in range(12)]
+    assert [future.result() for future in futures] == ["out%d.wav"%i for i in range(12)]
+    assert backend.most_running == 3
+
+    # A changed setting takes effect from the next text on
+    backend.most_running = 0
+    config = dict(DEFAULT_CONFIG, SynthesisWorkers="0", Pyttsx3Workers="5")
+    futures = [backend.submit("Text %d"%i, "out%d.wav"%i, config) for i in range(20)]
+    for future in futures:
+        future.result()
+    assert backend.most_running == 5
+    CommandBackend.executor.shutdown()
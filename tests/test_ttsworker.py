@@ -0,0 +1,119 @@
+# -*- coding: utf8 -*-
+
+import os
+
+import pytest
+
+from ttscache import TTSCache
+from ttsengine import GTTSBackend
+from ttsworker import FIRST_CHUNK_CHARS, MAX_CHUNK_CHARS, CachedSynthesizer, TTSWorker, split_long_sentence, split_text
+
+# About 2 MB of speech in chunks of up to 44 kB
+STREAMED_TEXT = " ".join("Sentence number %03d is read aloud."%i for i in range(300))
+
+
+def test_empty_text_has_no_chunks():
+    assert split_text("") == []
+    assert split_text("  \n\n  ") == []
+
+
+def test_short_text_is_one_chunk():
+    assert split_text("Hello there.") == ["Hello there."]
+
+
+def test_first_chunk_is_one_sentence():
+    chunks = split_text("First sentence. Second sentence! Third one? Fourth.")
+    assert chunks == ["First sentence.", "Second sentence! Third one? Fourth."]
+
+
+def test_lines_are_sentences():
+    assert split_text("A title\nSome text.") == ["A title", "Some text."]
+
+
+def test_no_text_is_lost():
+    text = " ".join("Sentence number %d, with a clause; and another."%i for i in range(200))
+    assert " ".join(split_text(text)).split() == text.split()
+
+
+def test_chunks_respect_their_limits():
+    text = " ".join("Sentence number %d has a few more words in it."%i for i in range(300))
+    chunks = split_text(text)
+    assert len(chunks[0]) <= FIRST_CHUNK_CHARS
+    assert all(len(chunk) <= MAX_CHUNK_CHARS for chunk in chunks)
+    # Sentences are packed together rather than sent one at a time
+    assert len(chunks) < 300/5
+
+
+def test_long_first_sentence_is_split_for_a_quick_start():
+    sentence = ", ".join("clause number %d"%i for i in range(40))+"."
+    chunks = split_text(sentence)
+    assert len(chunks[0]) <= FIRST_CHUNK_CHARS
+    assert " ".join(chunks) == sentence
+
+
+def test_long_sentence_splits_at_clauses_then_words():
+    assert split_long_sentence("short", 10) == ["short"]
+    assert split_long_sentence("one two, three four", 10) == ["one two,", "three four"]
+    pieces = split_long_sentence("word "*50, 22)
+    assert all(len(piece) <= 22 for piece in pieces)
+    assert " ".join(pieces).split() == ["word"]*50
+
+
+def test_devanagari_sentence_ends():
+    assert split_text("पहला वाक्य। दूसरा वाक्य॥ तीसरा") == ["पहला वाक्य।", "दूसरा वाक्य॥ तीसरा"]
+
+
+def make_streaming_worker(config, engine, output_path):
+    # Streams STREAMED_TEXT against a 200 kB budget
+    worker = TTSWorker(STREAMED_TEXT, dict(config, StreamingSynthesis="1"), output_path, engine)
+    worker.memory_budget = 200*1024
+    return worker
+
+
+def test_streamed_segments_past_the_budget_are_posted_as_files(tmp_path, config, engine):
+    worker = make_streaming_worker(config, engine, str(tmp_path/"speech.wav"))
+
+    worker.run()
+
+    messages = worker.poll()
+    segments = [message for message in messages if message[0] == "segment"]
+    assert [message[1] for message in segments] == list(range(len(segments)))
+    held = [message[2] for message in segments if isinstance(message[2], bytes)]
+    posted = [message[2] for message in segments if isinstance(message[2], str)]
+    assert sum(len(audio) for audio in held) <= worker.memory_budget
+    assert len(posted) > len(held)
+    # The UI plays the posted files after the worker is done, and removes them itself
+    for path in posted:
+        with open(path, 'rb') as audiofile:
+            assert audiofile.read(4) == b"RIFF"
+    assert messages[-1] == ("saved", str(tmp_path/"speech.wav"))
+    assert sorted(os.listdir(str(tmp_path))) == sorted(["speech.wav", "speech.peaks", "speech.seek"]+[os.path.basename(path) for path in posted])
+
+
+def test_cancelled_worker_removes_the_files_it_posted(tmp_path, config, engine):
+    worker = make_streaming_worker(config, engine, str(tmp_path/"speech.wav"))
+    synthesize = engine.synthesize
+
+    def cancel_midway(text, output_path, *args):
+        if (engine.calls == 20):
+            worker.cancel()
+        return synthesize(text, output_path, *args)
+
+    engine.synthesize = cancel_midway
+    worker.run()
+
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_cached_synthesizer_takes_each_backend_from_the_registry(tmp_path, config, engine, backend):
+    synthesizer = CachedSynthesizer(TTSCache(str(tmp_path), 1024*1024), 2, {"Pyttsx3": backend})
+
+    ttspath, cache_hit = synthesizer.synthesize("Hello there.", config)
+    assert not cache_hit
+    assert ttspath.endswith(".wav")
+    assert engine.calls == 1
+    assert isinstance(synthesizer.get_backend("GTTS"), GTTSBackend)
+    assert synthesizer.get_backend("GTTS") is synthesizer.get_backend("GTTS")
+    with pytest.raises(Exception, match="NoSuchEngine"):
+        synthesizer.synthesize("Hello there.", dict(config, APIInUse="NoSuchEngine"))
+    synthesizer.shutdown()
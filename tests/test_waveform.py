@@ -0,0 +1,118 @@
+# -*- coding: utf8 -*-
+
+import io
+import os
+import wave
+import struct
+
+import numpy as np
+
+import waveform
+from ttsworker import TTSWorker
+from waveform import SAMPLES_PER_PEAK, Peaks, compute_peaks, get_peak_path, get_waveform_polygon, load_peaks, save_peaks
+
+
+def make_wav(samples, channels=1, sample_width=2, sample_rate=22050):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wavfile:
+        wavfile.setparams((channels, sample_width, sample_rate, 0, "NONE", "not compressed"))
+        wavfile.writeframes(samples)
+    return buffer.getvalue()
+
+
+def test_peaks_are_block_minima_and_maxima():
+    # A ramp from -32768 up by 64 per sample, so that every peak spans 256*64 of it
+    ramp = np.arange(-32768, 32768, 64, dtype="<i2")
+    peaks = compute_peaks(make_wav(ramp.tobytes()), "wav")
+
+    assert len(peaks) == len(ramp)//SAMPLES_PER_PEAK
+    assert peaks.sample_rate == 22050
+    assert list(peaks.mins) == [(-32768+i*SAMPLES_PER_PEAK*64) >> 8 for i in range(len(peaks))]
+    assert list(peaks.maxs) == [(-32768+(i+1)*SAMPLES_PER_PEAK*64-64) >> 8 for i in range(len(peaks))]
+
+
+def test_peaks_of_other_sample_widths_and_channels():
+    # A short final peak keeps the tail of the audio
+    stereo = struct.pack("<%dh"%(2*300), *([1000, -2000]*300))
+    peaks = compute_peaks(make_wav(stereo, channels=2), "wav")
+    assert len(peaks) == 2
+    assert list(peaks.mins) == [-2000 >> 8]*2
+    assert list(peaks.maxs) == [1000 >> 8]*2
+
+    unsigned = bytes([128, 255, 0]*SAMPLES_PER_PEAK)
+    peaks = compute_peaks(make_wav(unsigned, sample_width=1), "wav")
+    assert (list(peaks.mins), list(peaks.maxs)) == ([-128]*3, [127]*3)
+
+    wide = b"".join(struct.pack("<i", value)[:3] for value in [0x100000, -0x200000]*SAMPLES_PER_PEAK)
+    peaks = compute_peaks(make_wav(wide, sample_width=3), "wav")
+    assert (list(peaks.mins), list(peaks.maxs)) == ([-0x2000 >> 8]*2, [0x1000 >> 8]*2)
+
+    assert len(compute_peaks(make_wav(b""), "wav")) == 0
+
+
+def test_peak_file_round_trip_and_unusable_files(tmp_path):
+    peaks = Peaks(np.array([-5, -100], np.int8), np.array([7, 120], np.int8), 24000, 512)
+    path = str(tmp_path/"speech.peaks")
+    save_peaks(peaks, path)
+
+    loaded = load_peaks(path)
+    assert (list(loaded.mins), list(loaded.maxs), loaded.sample_rate, loaded.samples_per_peak) == ([-5, -100], [7, 120], 24000, 512)
+    assert loaded.get_duration() == 2*512*1000//24000
+
+    with open(path, 'rb') as peakfile:
+        data = peakfile.read()
+    for unusable in (data[:-1], b"XXXX"+data[4:], data[:6], b""):
+        with open(path, 'wb') as peakfile:
+            peakfile.write(unusable)
+        assert load_peaks(path) is None
+    assert load_peaks(str(tmp_path/"missing.peaks")) is None
+
+
+def test_rebucketing_keeps_the_extremes():
+    peaks = Peaks(np.array([-1, -9, -3, -4, -2, -8], np.int8), np.array([1, 2, 9, 3, 8, 4], np.int8), 22050)
+    mins, maxs = peaks.rebucket(3)
+    assert (list(mins), list(maxs)) == ([-9, -4, -8], [2, 9, 8])
+    mins, maxs = peaks.rebucket(100)
+    assert len(mins) == 6
+    assert len(peaks.rebucket(0)[0]) == 0
+
+    coords = get_waveform_polygon(peaks, 3, 100)
+    assert len(coords) == 3*2*2
+    assert coords[0::2] == [0.0, 1.0, 2.0, 2.0, 1.0, 0.0]
+    assert get_waveform_polygon(Peaks(np.zeros(0, np.int8), np.zeros(0, np.int8), 22050), 100, 100) == []
+
+
+def test_freshly_synthesized_audio_has_its_peaks_computed_once(tmp_path, config, engine, monkeypatch):
+    computed = []
+    compute = waveform.compute_peaks
+
+    def count_computes(source, audio_format=None):
+        computed.append(source)
+        return compute(source, audio_format)
+
+    monkeypatch.setattr(waveform, "compute_peaks", count_computes)
+    output_path = str(tmp_path/"speech.wav")
+
+    TTSWorker("Hello there, this is fresh speech.", dict(config, StreamingSynthesis="0"), output_path, engine).run()
+
+    # Computed by the worker from the audio it already holds, before the file is ever read back
+    assert len(computed) == 1
+    assert isinstance(computed[0], bytes)
+    # The UI reuses the peak file instead of computing the peaks again
+    peaks = load_peaks(get_peak_path(output_path))
+    expected = compute(output_path)
+    assert len(computed) == 1
+    assert (list(peaks.mins), list(peaks.maxs)) == (list(expected.mins), list(expected.maxs))
+
+
+def test_damaged_peak_file_is_not_reused(tmp_path, config, engine):
+    output_path = str(tmp_path/"speech.wav")
+    TTSWorker("Hello there.", dict(config, StreamingSynthesis="0"), output_path, engine).run()
+    with open(get_peak_path(output_path), 'r+b') as peakfile:
+        peakfile.truncate(10)
+
+    # What the UI does when load_peaks() finds nothing usable
+    assert load_peaks(get_peak_path(output_path)) is None
+    save_peaks(compute_peaks(output_path), get_peak_path(output_path))
+    assert len(load_peaks(get_peak_path(output_path))) == len(compute_peaks(output_path))
+    assert os.path.getsize(get_peak_path(output_path)) > 10
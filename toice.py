@@ -25,31 +25,57 @@
 # Font used: Noto Sans
 
 
+import sys
+import time
+
+# Reference point of --profile-startup, so that module imports are part of the profile
+STARTUP_TIME = time.perf_counter()
+
+# Headless modes run without ever importing Tk, customtkinter or pygame
+if (__name__ == "__main__" and "--batch" in sys.argv[1:]):
+    from toicebatch import main
+    sys.exit(main(sys.argv[1:]))
+elif (__name__ == "__main__" and "--serve" in sys.argv[1:]):
+    from toiceserver import main
+    sys.exit(main(sys.argv[1:]))
+
 import tkinter as tk
 import tkinter.ttk as ttk
 import tkinter.messagebox as mbox
 from tkinter.scrolledtext import ScrolledText
 
 import customtkinter as ctk
-from pygame import mixer
 from PIL import Image, ImageTk
-import pydub
 
+import io
 import os
-from shutil import copy
-from subprocess import Popen, PIPE
-import time
+import threading
 from platform import system
 
-from settingsmenu import ToiceSettingsMenu
-import ttshandler as ttsh
+from toiceconfig import APPNAME, DIRS_IN_USERDIR, ROOTDIR, USERDIR, CONFIG_FILE, DEFAULT_CONFIG, CONFIG_CHECKS, EXPORT_FORMATS, SUCCESS, FAILURE, ConfigFile, validate_config
+from ttsworker import TTSWorker
+from audioutils import get_duration, get_format
+from exportworker import ExportWorker
+from ttscache import TTSCache
+from ttsengine import PLUGIN_ERRORS, Pyttsx3Engine, Pyttsx3ProcessPool, create_backend, get_audio_format
+from uischeduler import UIScheduler
+from bgcache import BackgroundCache
+from fontloader import load_font
+from langpacks import LanguagePackIndex
+from seekindex import build_seek_index, get_seek_path, load_seek_index, open_audio_at
+
+# Bounds of the playback clock's period, in milliseconds
+MIN_CLOCK_INTERVAL = 15
+MAX_CLOCK_INTERVAL = 250
 
-APPNAME = "Toice"
+# Quiet time after the last <Configure> event before the layout follows the new window size, in milliseconds
+RESIZE_DEBOUNCE_MS = 100
 
-DIRS_IN_USERDIR = {
-        "IMAGE": "images/",
-        "CACHE": "cache/"
-        }
+# Quiet time after the last seeker movement before playback jumps there, in milliseconds
+SEEK_DEBOUNCE_MS = 80
+
+# Icon sizes are rounded to multiples of this many pixels, so that only a few CTkImages ever exist per icon
+ICON_SIZE_STEP = 4
 
 DEFAULT_UI_LANG = \
 '''
@@ -65,6 +91,8 @@ WaveformLabelNoTextAlert = Type some text to get audio feedback
 WaveformLabelTTSNotGeneratedAlert = Nothing to Save<BREAK>No speech has been generated yet
 WaveformLabelNoConnectionAlert = You are offline<BREAK>To use GTTS, you must be online
 WaveformLabelUnknownErrorAlert = Oops! Something bad happened :(
+WaveformLabelExporting = Saving speech audio...
+WaveformLabelExportFailedAlert = Could not save the speech audio
 
 SettingsMenuTitle = Preferences
 SaveDialogTitle = Save Speech Audio
@@ -88,60 +116,22 @@ Pyttsx3VoiceinfoLabel = Gender supported by selected voice
 Pyttsx3VoiceGenderMale = Male
 Pyttsx3VoiceGenderFemale = Female
 Pyttsx3VoiceGenderUnknown = Unknown
+Pyttsx3WorkersLabel = Parallel synthesis processes
 
 ButtonApply = Apply
 ButtonCancel = Cancel
 ButtonOK = OK
 '''
 
-ROOTDIR = os.path.dirname(__file__).replace("\\", "/")+"/"
-
-if (ROOTDIR == '/'):
-    ROOTDIR = ''
-
-if (system() == "Windows"):
-    USERDIR = os.environ["LOCALAPPDATA"]+"\\"+APPNAME+"\\".replace("\\", "/")
-elif (system() == "Darwin"):
-    USERDIR = os.path.expanduser("~/Library/%s/"%APPNAME)
-else:
-    USERDIR = os.path.expanduser("~/.%s/"%APPNAME.lower())
-
-CONFIG_FILE = USERDIR+"config.cfg"
-
-DEFAULT_CONFIG = \
-f'''
-WindowWidth = 1024
-WindowHeight = 576
-WindowX = 50
-WindowY = 50
-WindowMaximized = 0
-
-TextboxFG = black
-TextboxBG = white
-
-LastSavedInDirectory = {os.path.expanduser('~')}
-
-FontSize = 20
-
-AudioVolume = 67
-LoopAudio = 1
-
-UILanguage = English (US)
-
-Pyttsx3Speed = 150
-Pyttsx3Volume = 67 
-Pyttsx3VoiceID = 0
-
-APIInUse = Pyttsx3
-'''
-
-SUCCESS = 0
-FAILURE = 1
-
-
 class Toice(tk.Tk):
 
-    def __init__(self, logging=False):
+    def __init__(self, logging=False, profile_startup=False):
+
+        # Wall time of each startup phase, printed by --profile-startup
+        self.profile_startup = profile_startup
+        self.startup_phases = []
+        self.startup_clock = STARTUP_TIME
+        self.mark_startup_phase("Imports")
 
         # Init super
         super().__init__()
@@ -153,25 +143,28 @@ class Toice(tk.Tk):
             self.wm_iconphoto(True, self.icon)
         except FileNotFoundError:
             self.log ("App icon not found!")
+        self.mark_startup_phase("Tk")
 
-        # Init pygame mixer for audio playback
-        mixer.init()
-
-        # Keep track of whether the Noto Sans font is being installed
-        self.installed_font = False
+        # pygame is imported and its mixer opened at the first playback, see get_mixer()
+        self.pygame = None
+        self.mixer = None
+        self.music_end_event = None
 
         # Font files
         self.font_file = os.path.join(ROOTDIR, "fonts/NotoSans-Regular.ttf")
-        self.font_file_linux = os.path.expanduser("~/.local/share/fonts/NotoSans-Regular.ttf")
-        self.font_file_macos = os.path.expanduser("~/Library/Fonts/NotoSans-Regular.ttf")
+        self.font_marker_file = USERDIR+"NotoSans-Regular.installed"
 
         # Noto Sans font will be loaded for Linux/MacOS systems
         font_load_status = self.load_notosans_font()
+        self.mark_startup_phase("Fonts")
 
         # Default values
         self.logging = logging
         self.log_count = 1
         self.orig_image = None
+        self.bg_cache = None
+        self.background_image_id = None
+        self.icon_cache = {}
         self.bg_image = None
         self.tkbg_image = None
         self.accent_color = "#25003e" #'#060e32'
@@ -182,8 +175,35 @@ class Toice(tk.Tk):
         self.config = {}
         self.uilang = {}
 
-        self.ttspath = ""
+        # The whole generated speech, either its cache file path or its audio kept in memory
+        self.ttsaudio = None
+        self.ttsformat = ""
         self.text = ""
+        self.tts_worker = None
+        self.export_worker = None
+        self.export_failed = False
+        self.tts_cache = None
+        self.tts_engine = Pyttsx3Engine()
+        self.tts_pool = None
+        self.segments = []
+        # Files of segments the TTS worker moved out of memory, removed once they are no longer played
+        self.segment_files = []
+        self.segment_index = 0
+        self.segment_offset = 0
+        self.segment_start = 0
+        self.seek_indexes = {}
+        self.awaiting_segment = False
+        self.seeker_pixel = None
+        self.peaks = None
+        self.peak_loader = None
+
+        # Bumped whenever the current audio is discarded, so that peaks computed for earlier audio are dropped
+        self.audio_generation = 0
+        self.waveform_id = None
+        self.playhead_id = None
+        self.playhead_x = None
+        self.placeholder_shown = True
+        self.scheduler = UIScheduler(self)
         self.paused = False
         self.settings_changed = False
         self.error_occured = False
@@ -218,33 +238,15 @@ class Toice(tk.Tk):
         self.protocol("WM_DELETE_WINDOW", self.exit)
 
         # Check available language packs and remove invalid ones
-        self.supported_ui_langs = {}
-        invalid_lang_files = []
-
-        try:
-            languages = os.listdir(ROOTDIR+"languages")
-            if (len(languages) == 0):
-                raise FileNotFoundError
-            for lang in languages:
-                abslangpath = ROOTDIR+"languages/"+lang
-                with open(abslangpath, encoding='UTF-8') as langfile:
-                    strings = langfile.readlines()
-                    for i in range(len(strings)):
-                        try:
-                            if (strings[i].strip() == ''):
-                                strings.pop(i)
-                        except IndexError:
-                            break
-                    if (len(strings) == 0):
-                        invalid_lang_files.append(abslangpath)
-                    elif (not (strings[0].startswith("LanguageName") and strings[0].find("=") != -1)):
-                        invalid_lang_files.append(abslangpath)
-                    else:
-                        line = strings[0]
-                        langname = line[line.index('=')+1::].strip()
-                        self.supported_ui_langs[langname] = abslangpath
+        self.lang_index = LanguagePackIndex(ROOTDIR+"languages", USERDIR+DIRS_IN_USERDIR["CACHE"]+"languages.json")
+        invalid_lang_files = self.lang_index.get_invalid_files()
+        for langfile in invalid_lang_files:
+            self.log ("Removing invalid language file: %s"%langfile)
+            os.remove(langfile)
+        if (invalid_lang_files):
+            self.lang_index.refresh()
 
-        except FileNotFoundError:
+        if (len(self.lang_index.get_languages()) == 0):
             self.log ("Missing language packs! Will load default language pack for UI: %s"%self.defcon["UILanguage"])
             os.makedirs(ROOTDIR+"languages", exist_ok=True)
             with open(ROOTDIR+"languages/en-us.lang", 'w', encoding='UTF-8') as langfile:
@@ -252,15 +254,27 @@ class Toice(tk.Tk):
                 for line in lines:
                     if (line.find('=') != -1):
                         langfile.writelines([line+"\n"])
-            self.supported_ui_langs[self.defcon["UILanguage"]] = ROOTDIR+"languages/en-us.lang"
-        
-
-        for langfile in invalid_lang_files:
-            self.log ("Removing invalid language file: %s"%langfile)
-            os.remove(langfile)
+            self.lang_index.refresh()
+        self.supported_ui_langs = self.lang_index.get_languages()
+        self.mark_startup_phase("Language pack scan")
 
         # Load configuration settings
         self.load_settings()
+        self.mark_startup_phase("Settings")
+
+        # Synthesized speech cache
+        self.tts_cache = TTSCache(USERDIR+DIRS_IN_USERDIR["CACHE"], int(self.config["CacheSizeMB"])*1024*1024)
+
+        # Pool of pyttsx3 processes for synthesizing long texts on several cores, started on first use
+        self.tts_pool = Pyttsx3ProcessPool(int(self.config["Pyttsx3Workers"]))
+
+        # Start the backend in use in the background (the pyttsx3 driver, for one) so that the first synthesis does not pay for it
+        backend = create_backend(self.config["APIInUse"], self.tts_engine, self.tts_pool)
+        for path, error in PLUGIN_ERRORS:
+            self.log ("Failed to load TTS backend plugin %s: %s"%(path, error), logtype="ERROR")
+        if (backend is not None):
+            backend.warm_up()
+        self.mark_startup_phase("TTS cache and engines")
 
         # Loop setting
         if (self.config["LoopAudio"] == "0"):
@@ -272,7 +286,7 @@ class Toice(tk.Tk):
         ctk.set_appearance_mode('dark')
 
         # Load the language pack
-        self.load_ui_lang(lang=self.config["UILanguage"], langfile=self.supported_ui_langs[self.config["UILanguage"]])
+        self.load_ui_lang(lang=self.config["UILanguage"])
         if (self.defuilang.keys() == self.uilang.keys()):
             self.log ("Loaded language pack: %s"%(self.config["UILanguage"]))
         else:
@@ -280,6 +294,7 @@ class Toice(tk.Tk):
             self.log ("Falling back to default language pack: %s"%(self.defcon["UILanguage"]))
             self.uilang = self.defuilang
             self.config["UILanguage"] = self.defcon["UILanguage"]
+        self.mark_startup_phase("Language pack")
 
         # Default values
         self.lastwinwidth = self.config["WindowWidth"]
@@ -314,68 +329,190 @@ class Toice(tk.Tk):
         self.background = ctk.CTkCanvas(self, highlightthickness=0, bg=self.accent_color)
         self.background.pack(fill=tk.BOTH, expand=True)
 
+        # Background image and the accent colors taken from it, before the widgets that use them. One in the
+        # user directory takes precedence over the bundled one; without either the default colors stay
+        if (self.load_bg_image(USERDIR) == FAILURE and self.load_bg_image() == FAILURE):
+            self.log ("No background image found, using the default colors")
+        self.mark_startup_phase("Background")
+
         # Add the widgets
         self.add_widgets()
+        self.mark_startup_phase("Widgets")
+
+
+    def mark_startup_phase(self, phase):
+        now = time.perf_counter()
+        self.startup_phases.append((phase, now-self.startup_clock))
+        self.startup_clock = now
+
+
+    def print_startup_profile(self):
+        print ("Startup profile:")
+        for phase, seconds in self.startup_phases:
+            print ("    %-24s %8.1f ms"%(phase, seconds*1000))
+        print ("    %-24s %8.1f ms"%("Total", sum(seconds for phase, seconds in self.startup_phases)*1000))
 
 
     def load_notosans_font(self):
-        try:
-            if (system() == 'Darwin'):
-                if (not os.path.isfile(self.font_file_macos)):
-                    copy(self.font_file, self.font_file_macos)
-                    self.installed_font = True
-            elif (system() == "Linux"):
-                if (not os.path.isfile(self.font_file_linux)):
-                    copy(self.font_file, self.font_file_linux)
-                    Popen(["fc-cache", "-fv"], stdout=PIPE, stderr=PIPE, shell=False)
-                    self.installed_font = True
-            else:
-                return FAILURE
-            return SUCCESS
-        except FileNotFoundError:
-            return FAILURE
+        # Registered for this process only (fontconfig on Linux, CoreText on MacOS), so nothing is left to undo at exit
+        return load_font(self.font_file, self.font_marker_file)
 
 
-    def unload_notosans_font(self):
-        if (self.installed_font):
-            try:
-                if (system() == 'Darwin'):
-                    os.remove(self.font_file_macos)
-                else:
-                    os.remove(self.font_file_linux)
-                    Popen(["fc-cache", "-fv"], stdout=PIPE, stderr=PIPE, shell=False)
-            except FileNotFoundError:
-                return FAILURE
-        return SUCCESS
+    def get_mixer(self):
+        # Imported and opened on first use, so that starting the app does not wait for the audio device
+        if (self.mixer is None):
+            import pygame
+            # The end of track events need pygame's event queue, which lives in the video subsystem:
+            # the dummy driver provides it without opening any window
+            os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+            pygame.display.init()
+            pygame.mixer.init()
+            self.music_end_event = pygame.USEREVENT+1
+            pygame.mixer.music.set_endevent(self.music_end_event)
+            pygame.mixer.music.set_volume(int(self.config["AudioVolume"])/100)
+            self.pygame = pygame
+            self.mixer = pygame.mixer
+        return self.mixer
+
+
+    def clear_music_end_events(self):
+        # Stopping or replacing a track also reports its end, which is no end of playback
+        if (self.pygame is not None):
+            self.pygame.event.clear(self.music_end_event)
 
 
     def audio_playing(self):
-        return (mixer.music.get_busy() or self.paused)
+        return ((self.mixer is not None and self.mixer.music.get_busy()) or self.paused or self.awaiting_segment)
 
 
     def pause_unpause_audio(self):
         if (self.audio_playing()):
             if (not self.paused):
-                mixer.music.pause()
+                self.get_mixer().music.pause()
                 self.paused = True
+                self.stop_playback_clock()
                 self.waveform_label.configure(text=self.uilang["WaveformLabelPaused"])
                 self.playpausebtn.configure(image=self.play_image)
                 self.playpausebtn.update_idletasks()
             elif (self.paused):
-                mixer.music.unpause()
+                self.get_mixer().music.unpause()
                 self.paused = False
+                self.start_playback_clock()
                 self.waveform_label.configure(text=self.uilang["WaveformLabelPlaying"])
                 self.playpausebtn.configure(image=self.pause_image)
                 self.playpausebtn.update_idletasks()
 
 
+    def get_audio_length(self, path):
+        audio_length = self.tts_cache.get_duration(path)
+        if (audio_length is None):
+            audio_length = get_duration(path)
+        return audio_length
+
+
+    def load_segment(self, index, position=0):
+        self.segment_index = index
+        self.segment_offset = sum(length for path, length in self.segments[:index])
+        self.segment_start = 0
+        self.awaiting_segment = False
+        source = self.segments[index][0]
+        mixer = self.get_mixer()
+        if (position > 0):
+            # get_pos() counts from here on, so the offset the slice actually starts at is kept to add to it
+            audiofile, self.segment_start = open_audio_at(source, self.get_seek_index(index), position)
+            mixer.music.load(audiofile, self.ttsformat)
+        elif (isinstance(source, bytes)):
+            mixer.music.load(io.BytesIO(source), self.ttsformat)
+        else:
+            mixer.music.load(source)
+        mixer.music.play()
+        self.clear_music_end_events()
+        if (self.paused):
+            mixer.music.pause()
+
+
+    def get_seek_index(self, index):
+        # Read from the cache entry's seek file when there is one, built from the segment's own header or frames otherwise
+        if (index not in self.seek_indexes):
+            source = self.segments[index][0]
+            seek_index = None
+            if (isinstance(source, str)):
+                seek_index = load_seek_index(get_seek_path(source))
+            if (seek_index is None):
+                seek_index = build_seek_index(source, self.ttsformat)
+            self.seek_indexes[index] = seek_index
+        return self.seek_indexes[index]
+
+
+    def rewind_audio(self):
+        # Once the whole speech has been generated, play it as one piece instead of its segments
+        if (self.ttsaudio is not None and len(self.segments) > 1):
+            self.get_mixer().music.unload()
+            self.segments = [[self.ttsaudio, self.audio_length]]
+            self.seek_indexes = {}
+            self.remove_segment_files()
+        self.audio_length = sum(length for path, length in self.segments)
+        self.seeker.configure(from_=0, to=max(self.audio_length-1, 1))
+        self.seeker_pixel = None
+        self.load_segment(0)
+
+
+    def advance_segment(self):
+        if (self.segment_index+1 < len(self.segments)):
+            self.load_segment(self.segment_index+1)
+        elif (self.generating_tts()):
+            # The next segment is still being synthesized
+            self.awaiting_segment = True
+        elif (self.loops == -1):
+            self.rewind_audio()
+        else:
+            self.awaiting_segment = False
+
+
+    def add_audio_segment(self, path, audio_length):
+        self.segments.append([path, audio_length])
+        self.audio_length += audio_length
+        self.seeker.configure(from_=0, to=max(self.audio_length-1, 1))
+        self.seeker_pixel = None
+        if (len(self.segments) == 1):
+            self.play_audio()
+        elif (self.awaiting_segment):
+            self.load_segment(len(self.segments)-1)
+
+
+    def remove_segment_files(self):
+        for path in self.segment_files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.segment_files = []
+
+
+    def discard_audio(self):
+        self.stop_playback_clock()
+        if (self.mixer is not None):
+            self.mixer.music.stop()
+            self.mixer.music.unload()
+            self.clear_music_end_events()
+        self.segments = []
+        self.remove_segment_files()
+        self.seek_indexes = {}
+        self.segment_index = 0
+        self.segment_offset = 0
+        self.segment_start = 0
+        self.audio_length = 0
+        self.awaiting_segment = False
+        self.paused = False
+        self.ttsaudio = None
+        self.text = ""
+        self.audio_generation += 1
+        self.set_peaks(None)
+
+
     def play_audio(self):
-        audio = pydub.AudioSegment.from_file(self.ttspath)
-        self.audio_length = len(audio)
-        del audio
-        mixer.music.load(self.ttspath)
-        mixer.music.play(loops = self.loops)
-        self.seeker.configure(from_=0, to=self.audio_length-1)
+        self.stop_playback_clock()
+        self.rewind_audio()
         self.update_seeker()
         self.waveform_label.configure(text=self.uilang["WaveformLabelPlaying"])
         self.playpausebtn.configure(image=self.pause_image)
@@ -399,80 +536,282 @@ class Toice(tk.Tk):
             tmin_string = "0"+tmin_string
         time_string = tmin_string+":"+ts_string
         return time_string
-        
+
+
+    def start_playback_clock(self):
+        self.scheduler.cancel("playback_clock")
+        self.scheduler.request("playback_clock", self.update_seeker)
+
+
+    def stop_playback_clock(self):
+        self.scheduler.cancel("playback_clock")
+
+
+    def get_clock_interval(self, audio_position):
+        # Wake up when the seeker moves by a pixel, the time label changes or the track is due to end, whichever comes first
+        if (self.awaiting_segment):
+            return MAX_CLOCK_INTERVAL
+        interval = min(self.audio_length/max(self.seeker.winfo_width(), 1), 1000-audio_position%1000)
+        interval = min(interval, self.segment_offset+self.segments[self.segment_index][1]-audio_position)
+        return int(min(max(interval, MIN_CLOCK_INTERVAL), MAX_CLOCK_INTERVAL))
+
+
+    def draw_seeker(self, audio_position):
+        # Redraw only what visibly changed, and leave the seeker alone while it is being dragged
+        if (self.scheduler.pending("seek")):
+            return
+        pixel = audio_position*self.seeker.winfo_width()//max(self.audio_length, 1)
+        if (pixel != self.seeker_pixel):
+            self.seeker_pixel = pixel
+            self.seeker.set(audio_position)
+        self.draw_playhead(audio_position)
+        time_string = self.format_time(audio_position)
+        if (time_string != self.seeker_timelabel.cget('text')):
+            self.seeker_timelabel.configure(text=time_string)
+
+
+    def seeker_cb(self, value):
+        # Dragging only moves the labels, playback jumps once the seeker comes to rest
+        if (len(self.segments) == 0):
+            self.seeker.set(0)
+            return
+        self.seeker_timelabel.configure(text=self.format_time(value))
+        self.draw_playhead(value)
+        self.scheduler.call_later("seek", SEEK_DEBOUNCE_MS, self.seek_audio, int(value))
+
+
+    def seek_audio(self, position):
+        if (len(self.segments) == 0):
+            return
+        if (not self.audio_playing()):
+            self.play_audio()
+        # The segment holding position, or the last one there is while the rest is still being synthesized
+        index = 0
+        offset = 0
+        while (index+1 < len(self.segments) and offset+self.segments[index][1] <= position):
+            offset += self.segments[index][1]
+            index += 1
+        self.stop_playback_clock()
+        self.load_segment(index, position-offset)
+        self.seeker_pixel = None
+        self.update_seeker()
+
+
+    def set_peaks(self, peaks):
+        self.peaks = peaks
+        self.scheduler.request("waveform", self.draw_waveform)
+
+
+    def load_waveform(self, audio_path):
+        # Peak files are written along with the cache entry, older entries get theirs computed in the background
+        import waveform
+        peaks = waveform.load_peaks(waveform.get_peak_path(audio_path))
+        if (peaks is not None):
+            self.set_peaks(peaks)
+            return
+        loader = {"generation": self.audio_generation, "peaks": None}
+
+        def compute():
+            try:
+                loader["peaks"] = waveform.compute_peaks(audio_path)
+                waveform.save_peaks(loader["peaks"], waveform.get_peak_path(audio_path))
+            except Exception as e:
+                self.log ("Unable to compute the waveform of %s: %s"%(audio_path, e), logtype="ERROR")
+
+        loader["thread"] = threading.Thread(target=compute, daemon=True)
+        self.peak_loader = loader
+        loader["thread"].start()
+        self.poll_peak_loader(loader)
+
+
+    def poll_peak_loader(self, loader):
+        if (loader is not self.peak_loader):
+            return
+        if (loader["thread"].is_alive()):
+            self.scheduler.call_later("peak_loader", 100, self.poll_peak_loader, loader)
+            return
+        self.peak_loader = None
+        if (loader["generation"] == self.audio_generation):
+            self.set_peaks(loader["peaks"])
+
+
+    def draw_waveform(self):
+        # Drawn from the peaks rebucketed to the canvas width, the audio itself is never read again
+        import waveform
+        width = self.waveform_canvas.winfo_width()
+        height = self.waveform_canvas.winfo_height()
+        coords = []
+        if (self.peaks is not None and width > 1 and height > 1):
+            coords = waveform.get_waveform_polygon(self.peaks, width, height)
+        if (len(coords) < 6):
+            self.waveform_canvas.delete("waveform")
+            self.waveform_id = None
+            self.playhead_id = None
+            self.playhead_x = None
+            return
+        if (self.waveform_id is None):
+            self.waveform_id = self.waveform_canvas.create_polygon(coords, fill='#9400ff', outline='#b44dff', tags="waveform")
+            self.playhead_id = self.waveform_canvas.create_line(0, 0, 0, height, fill='white', width=2, tags="waveform")
+        else:
+            self.waveform_canvas.coords(self.waveform_id, coords)
+        self.playhead_x = None
+        self.draw_playhead(self.seeker.get())
+
+
+    def draw_playhead(self, audio_position):
+        if (self.playhead_id is None):
+            return
+        x = int(audio_position*self.waveform_canvas.winfo_width()//max(self.audio_length, 1))
+        if (x != self.playhead_x):
+            self.playhead_x = x
+            self.waveform_canvas.coords(self.playhead_id, x, 0, x, self.waveform_canvas.winfo_height())
+
+
     def update_seeker(self):
+        track_ended = (self.pygame is not None and len(self.pygame.event.get(self.music_end_event)) != 0)
+        if ((track_ended or self.awaiting_segment) and len(self.segments) != 0):
+            self.advance_segment()
         if (self.audio_playing()):
-            audio_position = mixer.music.get_pos()
-            if (audio_position >= self.audio_length):
-                mixer.music.stop()
-                if (self.loops == -1):
-                    mixer.music.play(loops = self.loops)
-                self.seeker.set(0)
-                self.seeker.update_idletasks()
-                self.seeker_timelabel.configure(text=self.format_time(0))
+            if (self.awaiting_segment):
+                audio_position = self.segment_offset+self.segments[self.segment_index][1]
             else:
-                self.seeker.set(audio_position)
-                self.seeker.update_idletasks()
-                self.seeker_timelabel.configure(text=self.format_time(audio_position))
-            return self.after(10, self.update_seeker)
+                audio_position = self.segment_offset+self.segment_start+max(self.get_mixer().music.get_pos(), 0)
+            audio_position = min(audio_position, self.audio_length)
+            self.draw_seeker(audio_position)
+            if (not self.paused):
+                self.scheduler.call_later("playback_clock", self.get_clock_interval(audio_position), self.update_seeker)
         else:
-            self.seeker.set(0)
-            self.seeker.update_idletasks()
-            self.seeker_timelabel.configure(text=self.format_time(0))
+            self.draw_seeker(0)
+            self.playback_state_changed()
+
+
+    def playback_state_changed(self):
+        # Called whenever playback or generation may have started or stopped
+        self.scheduler.request("playback_state", self.reset_pause_state)
 
 
     def reset_pause_state(self):
-        if (not self.audio_playing()):
+        if (not self.audio_playing() and not self.generating_tts()):
             self.paused = False
             self.playpausebtn.configure(image=self.play_image)
-            self.playpausebtn.update_idletasks()
+            if (self.export_worker is not None):
+                # The export's progress keeps the label
+                return
             if (self.waveform_label.cget('text') in (self.uilang["WaveformLabelGenerating"],
                                                     self.uilang["WaveformLabelNoTextAlert"],
                                                     self.uilang["WaveformLabelTTSNotGeneratedAlert"],
                                                     self.uilang["WaveformLabelNoConnectionAlert"],
-                                                    self.uilang["WaveformLabelUnknownErrorAlert"])):
-                return self.after (1000, lambda: (self.waveform_label.configure(text=self.uilang["WaveformLabelNormal"]), self.reset_pause_state()))
+                                                    self.uilang["WaveformLabelUnknownErrorAlert"],
+                                                    self.uilang["WaveformLabelExportFailedAlert"])):
+                # Alerts stay up for a second
+                self.scheduler.call_later("waveform_label", 1000, self.reset_waveform_label)
+            else:
+                self.waveform_label.configure(text=self.uilang["WaveformLabelNormal"])
+
+
+    def reset_waveform_label(self):
+        if (not self.audio_playing() and not self.generating_tts() and self.export_worker is None):
             self.waveform_label.configure(text=self.uilang["WaveformLabelNormal"])
-        return self.after (50, self.reset_pause_state)
+
+
+    def generating_tts(self):
+        # A worker whose speech is complete is only writing it to the cache
+        return (self.tts_worker is not None and self.ttsaudio is None)
+
+
+    def cancel_tts_worker(self):
+        # A worker that is only writing finished speech to the cache is left to deliver its "saved" message,
+        # which loads the waveform and seek files of that speech
+        if (self.generating_tts()):
+            self.log ("Cancelling TTS generation...")
+            self.tts_worker.cancel()
+            self.tts_worker = None
+            # Partially streamed speech is removed along with the cancelled job
+            if (len(self.segments) != 0):
+                self.discard_audio()
+
+
+    def poll_tts_worker(self, worker):
+        # Ignore leftover callbacks of a cancelled or replaced worker
+        if (worker is not self.tts_worker):
+            return
+        for message in worker.poll():
+            if (message[0] == "progress"):
+                done, total = message[1], message[2]
+                self.waveform_label.configure(text="%s (%d%%)"%(self.uilang["WaveformLabelGenerating"], 100*done//total))
+            elif (message[0] == "segment"):
+                if (message[1] == 0):
+                    self.start_new_audio(worker.text)
+                    self.ttsformat = worker.audio_format
+                if (isinstance(message[2], str)):
+                    self.segment_files.append(message[2])
+                self.add_audio_segment(message[2], message[3])
+            elif (message[0] == "error" and self.ttsaudio is not None):
+                # Only writing the cache file failed, the speech itself is fine
+                self.tts_worker = None
+                self.log (message[1], logtype="ERROR")
+                self.playback_state_changed()
+                return
+            elif (message[0] == "error"):
+                self.tts_worker = None
+                self.error_occured = True
+                self.discard_audio()
+                import ttshandler as ttsh
+                if (isinstance(message[1], ttsh.ttsexceptions.GTTSConnectionError)):
+                    self.waveform_label.configure(text=self.uilang["WaveformLabelNoConnectionAlert"])
+                else:
+                    self.waveform_label.configure(text=self.uilang["WaveformLabelUnknownErrorAlert"])
+                self.log (message[1], logtype="ERROR")
+                self.playback_state_changed()
+                return
+            elif (message[0] == "done"):
+                self.ttsaudio = message[1]
+                if (self.audio_playing() and not self.paused):
+                    self.waveform_label.configure(text=self.uilang["WaveformLabelPlaying"])
+                self.playback_state_changed()
+            elif (message[0] == "saved"):
+                self.tts_worker = None
+                self.log ("TTS saved to cache: %s"%message[1])
+                self.load_waveform(message[1])
+                return
+        self.scheduler.call_later("tts_worker", 50, self.poll_tts_worker, worker)
+
+
+    def start_new_audio(self, text):
+        self.log ("Running TTS...")
+        self.discard_audio()
+        self.text = text
 
 
     def playpause_cb(self):
         text = self.textbox.get("1.0", tk.END).strip()
-        if ((text != "" and self.text != text) or self.settings_changed or self.error_occured):
+        if (self.generating_tts() and (text != self.tts_worker.text or self.settings_changed)):
+            self.cancel_tts_worker()
+        if (not self.generating_tts() and ((text != "" and self.text != text) or self.settings_changed or self.error_occured)):
             self.error_occured = False
             self.settings_changed = False
+            cache_key = self.tts_cache.make_key(text, self.config)
+            cached_ttspath = self.tts_cache.lookup(cache_key)
+            if (cached_ttspath is not None):
+                self.log("Found TTS in cache: %s"%cached_ttspath)
+                self.start_new_audio(text)
+                self.ttsaudio = cached_ttspath
+                self.ttsformat = get_format(cached_ttspath)
+                self.add_audio_segment(cached_ttspath, self.get_audio_length(cached_ttspath))
+                self.load_waveform(cached_ttspath)
+                return
             self.log("Generating TTS...")
             self.waveform_label.configure(text=self.uilang["WaveformLabelGenerating"])
-            self.waveform_label.update()
-            self.tts = ttsh.TTSHandler(text, api=self.config["APIInUse"])
-            self.ttspath = USERDIR+DIRS_IN_USERDIR["CACHE"]+str(round(time.time()))
-            if (self.config["APIInUse"] == "Pyttsx3"):
-                self.tts.set_property(rate=int(self.config["Pyttsx3Speed"]), volume=float(self.config["Pyttsx3Volume"])/100, voice=int(self.config["Pyttsx3VoiceID"]))
-                self.ttspath += ".wav"
-            else:
-                self.ttspath += ".mp3"
-            try:
-                self.tts.generate_tts(self.ttspath)
-                while (True):
-                    if (os.path.isfile(self.ttspath)):
-                        if (os.path.getsize(self.ttspath) == 0):
-                            pass
-                        else:
-                            break
-            except ttsh.ttsexceptions.GTTSConnectionError as e:
-                self.waveform_label.configure(text=self.uilang["WaveformLabelNoConnectionAlert"])
-                self.waveform_label.update()
-                self.error_occured = True
-                self.log (e, logtype="ERROR")
-            except:
-                self.waveform_label.configure(text=self.uilang["WaveformLabelUnknownErrorAlert"])
-                self.waveform_label.update()
-                self.error_occured = True
-            self.text = text
+            ttspath = self.tts_cache.new_path(cache_key, "."+get_audio_format(self.config["APIInUse"]))
+            self.tts_worker = TTSWorker(text, self.config, ttspath, self.tts_engine, self.tts_pool, self.tts_cache, cache_key)
+            self.tts_worker.start()
+            self.poll_tts_worker(self.tts_worker)
+            return
 
         if (text == ""):
             self.waveform_label.configure(text=self.uilang["WaveformLabelNoTextAlert"])
-        if (os.path.isfile(self.ttspath) and not self.audio_playing() and text != "" and not self.error_occured):
+            self.playback_state_changed()
+        if (len(self.segments) != 0 and not self.audio_playing() and text != "" and not self.error_occured):
             self.log ("Running TTS...")
             self.play_audio()
         else:
@@ -480,11 +819,14 @@ class Toice(tk.Tk):
 
 
     def stop_cb(self):
-        mixer.music.stop()
-        self.seeker.set(0)
-        self.seeker.update_idletasks()
-        self.seeker_timelabel.configure(text=self.format_time(0))
+        self.cancel_tts_worker()
+        self.stop_playback_clock()
+        if (self.mixer is not None):
+            self.mixer.music.stop()
+            self.clear_music_end_events()
+        self.awaiting_segment = False
         self.paused = False
+        self.draw_seeker(0)
         self.audio_length = 0
         self.waveform_label.configure(text=self.uilang["WaveformLabelNormal"])
         self.playpausebtn.configure(image=self.play_image)
@@ -492,8 +834,11 @@ class Toice(tk.Tk):
 
 
     def save_cb(self):
-        if (self.textbox.get("1.0", tk.END).strip() == "" or self.ttspath == ""):
+        if (self.textbox.get("1.0", tk.END).strip() == "" or self.ttsaudio is None):
             self.waveform_label.configure(text=self.uilang["WaveformLabelTTSNotGeneratedAlert"])
+            self.playback_state_changed()
+            return
+        if (self.export_worker is not None):
             return
         supported_formats = [
                                 ("MP3 - Compressed audio", "*.mp3"),
@@ -506,14 +851,7 @@ class Toice(tk.Tk):
                                 ("AIFF", "*.aiff")
                             ]
         file_path = ""
-        initialfilename = "Untitled Speech"
-        tempname = initialfilename
-        i=1
-        for _file in os.listdir(self.config["LastSavedInDirectory"]):
-            if (_file.startswith(initialfilename)):
-                tempname = f"{initialfilename} ({i})"
-                i+=1
-        initialfilename = tempname
+        initialfilename = self.get_untitled_name(self.config["LastSavedInDirectory"], "Untitled Speech")
         try:
             if (system() == 'Windows'):
                 file_path = tk.filedialog.asksaveasfilename(title=self.uilang["SaveDialogTitle"], initialfile=initialfilename, defaultextension=".mp3", filetypes=supported_formats, initialdir=self.config["LastSavedInDirectory"])
@@ -523,28 +861,64 @@ class Toice(tk.Tk):
             pass
         if (file_path != ""):
             self.config["LastSavedInDirectory"] = os.path.dirname(file_path)
-            if (self.ttspath.endswith(".wav")):
-                if (file_path.endswith(".wav")):
-                    copy(self.ttspath, file_path)
-                else:
-                    audio = pydub.AudioSegment.from_wav(self.ttspath)
-                    audio.export(file_path)
-            elif (self.ttspath.endswith(".mp3")):
-                if (file_path.endswith(".mp3")):
-                    copy(self.ttspath, file_path)
+            if (get_format(file_path) == ""):
+                file_path += ".mp3"
+            # The chosen file, plus the same name in every extra format from the config
+            root = os.path.splitext(file_path)[0]
+            output_paths = [file_path]
+            for _format in self.config["ExtraExportFormats"].split(','):
+                if (_format != "" and root+"."+_format not in output_paths):
+                    output_paths.append(root+"."+_format)
+            self.log ("Exporting speech to %s"%", ".join(output_paths))
+            self.export_worker = ExportWorker(self.ttsaudio, self.ttsformat, output_paths)
+            self.export_worker.start()
+            self.poll_export_worker(self.export_worker)
+
+
+    def get_untitled_name(self, directory, name):
+        # The first of "name", "name (1)", "name (2)"... not taken in any export format, found without listing the directory
+        i = 0
+        tempname = name
+        while (any(os.path.exists(os.path.join(directory, tempname+"."+_format)) for _format in EXPORT_FORMATS)):
+            i += 1
+            tempname = f"{name} ({i})"
+        return tempname
+
+
+    def poll_export_worker(self, worker):
+        if (worker is not self.export_worker):
+            return
+        for message in worker.poll():
+            if (message[0] == "progress"):
+                self.waveform_label.configure(text="%s (%d%%)"%(self.uilang["WaveformLabelExporting"], 100*message[1]//message[2]))
+            elif (message[0] == "exported"):
+                self.log ("Audio saved successfully: %s"%message[1])
+            elif (message[0] == "error"):
+                self.log ("Unable to save %s: %s"%(message[1], message[2]), logtype="ERROR")
+                self.export_failed = True
+            elif (message[0] == "done"):
+                self.export_worker = None
+                if (self.export_failed):
+                    self.export_failed = False
+                    self.waveform_label.configure(text=self.uilang["WaveformLabelExportFailedAlert"])
+                elif (self.audio_playing() and not self.paused):
+                    self.waveform_label.configure(text=self.uilang["WaveformLabelPlaying"])
+                elif (self.paused):
+                    self.waveform_label.configure(text=self.uilang["WaveformLabelPaused"])
                 else:
-                    audio = pydub.AudioSegment.from_mp3(self.ttspath)
-                    audio.export(file_path)
-            self.log("Audio saved successfully!")
-            
+                    self.waveform_label.configure(text=self.uilang["WaveformLabelNormal"])
+                self.playback_state_changed()
+                return
+        self.scheduler.call_later("export_worker", 100, self.poll_export_worker, worker)
 
 
     def volume_slider_cb(self, val):
         if (self.volume_slider.get() == 0):
-            self.volume_icon.configure(image=ctk.CTkImage(self.volume_image_muted_original, size = self.volume_icon.cget('image').cget('size')))
+            self.volume_icon.configure(image=self.get_icon(self.volume_image_muted_original, self.volume_icon.cget('image').cget('size')[0]))
         else:
-            self.volume_icon.configure(image=ctk.CTkImage(self.volume_image_original, size = self.volume_icon.cget('image').cget('size')))
-        mixer.music.set_volume(val/100)
+            self.volume_icon.configure(image=self.get_icon(self.volume_image_original, self.volume_icon.cget('image').cget('size')[0]))
+        if (self.mixer is not None):
+            self.mixer.music.set_volume(val/100)
         self.config["AudioVolume"] = str(int(val))
 
 
@@ -563,11 +937,11 @@ class Toice(tk.Tk):
         if (self.volume_slider.get() != 0):
             self.volume_slider.set(0)
             self.config["AudioVolume"] = "0"
-            self.volume_icon.configure(image=ctk.CTkImage(self.volume_image_muted_original, size = self.volume_icon.cget('image').cget('size')))
+            self.volume_icon.configure(image=self.get_icon(self.volume_image_muted_original, self.volume_icon.cget('image').cget('size')[0]))
         else:
             self.volume_slider.set(100)
             self.config["AudioVolume"] = "100"
-            self.volume_icon.configure(image=ctk.CTkImage(self.volume_image_original, size = self.volume_icon.cget('image').cget('size')))
+            self.volume_icon.configure(image=self.get_icon(self.volume_image_original, self.volume_icon.cget('image').cget('size')[0]))
         self.volume_slider_cb(self.volume_slider.get())
 
 
@@ -608,13 +982,22 @@ class Toice(tk.Tk):
         self.about_text.pack(padx=15)
 
 
+    def textbox_modified(self, event=None):
+        # Re-arm <<Modified>>, which Tk only fires when the flag goes from unset to set
+        self.textbox.edit_modified(False)
+        self.scheduler.request("textbox_placeholder", self.alter_textbox_placeholder)
+
+
     def alter_textbox_placeholder(self):
-        if (self.textbox.get("1.0", tk.END).strip('\n') != ""):
-            self.textbox_placeholder.grid_forget()
-        else:
+        # Looks for the first character other than a newline instead of reading the whole text
+        show_placeholder = (self.textbox.search("[^\n]", "1.0", tk.END, regexp=True) == "")
+        if (show_placeholder == self.placeholder_shown):
+            return
+        self.placeholder_shown = show_placeholder
+        if (show_placeholder):
             self.textbox_placeholder.grid(row=0, column=0, sticky=tk.NW, padx=15, pady=10)
-        self.textbox_placeholder.update()
-        return self.after(50, self.alter_textbox_placeholder)
+        else:
+            self.textbox_placeholder.grid_forget()
 
 
     def add_widgets(self):
@@ -644,7 +1027,10 @@ class Toice(tk.Tk):
         self.waveform_frame.pack_propagate(False)
         self.waveform_canvasid = self.background.create_window(int(self.config["WindowWidth"])-20, 100, anchor=tk.NE, window=self.waveform_frame)
         self.waveform_label = ctk.CTkLabel(self.waveform_frame, text=self.uilang["WaveformLabelNormal"], bg_color='#1c1b22', font=(self.font[0], 15))
-        self.waveform_label.pack(expand=True, padx=3, pady=3)
+        self.waveform_label.pack(side=tk.TOP, padx=3, pady=3)
+        self.waveform_canvas = tk.Canvas(self.waveform_frame, background='#1c1b22', highlightthickness=0)
+        self.waveform_canvas.pack(side=tk.TOP, fill=tk.BOTH, expand=True, padx=6, pady=(0, 6))
+        self.waveform_canvas.bind("<Configure>", lambda event: self.scheduler.request("waveform", self.draw_waveform))
 
         # Add a control panel
         self.control_frame = ctk.CTkFrame(self.background, fg_color=self.accent_color)
@@ -656,7 +1042,7 @@ class Toice(tk.Tk):
         self.seeker_frame.pack(fill=tk.X, side=tk.TOP)
         self.seeker_timelabel = ctk.CTkLabel(self.seeker_frame, text="00:00", font=(self.font[0], 15))
         self.seeker_timelabel.pack(side=tk.RIGHT, padx=5)
-        self.seeker = ctk.CTkSlider(self.seeker_frame, progress_color="#9400ff", fg_color='white', button_color="#9400ff", button_hover_color="#5f00a4", bg_color=self.control_frame.cget('bg_color'))
+        self.seeker = ctk.CTkSlider(self.seeker_frame, progress_color="#9400ff", fg_color='white', button_color="#9400ff", button_hover_color="#5f00a4", bg_color=self.control_frame.cget('bg_color'), command=self.seeker_cb)
         self.seeker.pack(side=tk.LEFT, fill=tk.X, pady=30/1920*int(self.config["WindowWidth"]), padx=5)
         self.seeker.set(0)
 
@@ -721,7 +1107,6 @@ class Toice(tk.Tk):
         self.volume_slider = ctk.CTkSlider(self.volume_frame, from_=0, to=100, progress_color="#9400ff", fg_color='white', button_color="#9400ff", button_hover_color="#5f00a4", bg_color=self.accent_color,
                                             command = self.volume_slider_cb)
         self.volume_slider.set(int(self.config["AudioVolume"]))
-        mixer.music.set_volume(int(self.config["AudioVolume"])/100)
         self.volume_slider.pack(fill=tk.X, expand=True, side=tk.RIGHT)
 
         #self.waveform_label = tk.Label(self.waveform_frame, bg=self.accent_color)
@@ -735,11 +1120,11 @@ class Toice(tk.Tk):
 
 
     def get_default(self, datatype="config"):
+        if (datatype == "config"): 
+            return DEFAULT_CONFIG.copy()
         data = {}
         data_lines = []
-        if (datatype == "config"): 
-            data_lines = DEFAULT_CONFIG.split("\n")
-        elif (datatype == "uilang"):
+        if (datatype == "uilang"):
             data_lines = DEFAULT_UI_LANG.split("\n")
 
         for line in data_lines:
@@ -765,71 +1150,20 @@ class Toice(tk.Tk):
         os.makedirs(USERDIR, exist_ok = True)
         for directory in DIRS_IN_USERDIR:
             os.makedirs(USERDIR+DIRS_IN_USERDIR[directory], exist_ok = True)
+        self.config_file = ConfigFile(CONFIG_FILE)
         if (not os.path.isfile(CONFIG_FILE)):
-            self.log ("Detected first time run, creating user configuration file")
-            with open(CONFIG_FILE, 'w') as configfile:
-                configfile.write(DEFAULT_CONFIG)
-            self.log ("User configuration file created")
-
-        with open(CONFIG_FILE) as configfile:
-            for line in configfile.readlines():
-                if (not (line.startswith('//') or line.startswith('#')) and line.find('=') != -1):
-                    key = line[:line.index('=')].strip()
-                    value = line[line.index('=')+1::].strip()
-                    self.config[key] = value
+            self.log ("Detected first time run, the user configuration file will be created on exit")
 
         # Verify configuration integrity
-        for key in self.defcon.keys():
-            try:
-                if (key.startswith("Window") or key == "AudioVolume"):
-                    self.config[key] = str(int(self.config[key]))
-                    if (key == "WindowMaximized" and int(self.config[key]) not in (0, 1)):
-                        raise ValueError
-                elif (key == "LastSavedInDirectory"):
-                    if (not os.path.isdir(self.config["LastSavedInDirectory"])):
-                        raise ValueError
-                elif (key == "APIInUse"):
-                    if (self.config[key] not in ("Pyttsx3", "GTTS")):
-                        raise ValueError
-                elif (key == "LoopAudio"):
-                    if (int(self.config[key]) not in (0, 1)):
-                        raise ValueError
-                elif (key.startswith("Textbox")):
-                    tempwidget = tk.Text(foreground=self.config[key])
-                    del tempwidget
-                elif (key.startswith("Font")):
-                    if (key == "FontSize"):
-                        self.config[key] = str(int(self.config[key]))
-                elif (key == "UILanguage"):
-                    if (self.config[key] not in self.supported_ui_langs):
-                        raise ValueError
-                elif (key.startswith("Pyttsx3")):
-                    if (key == "Pyttsx3Speed"):
-                        val = int(self.config[key])
-                        if (val>300 or val<50 or self.config[key].find('.') != -1):
-                            raise ValueError
-                    elif (key == "Pyttsx3Volume"):
-                        val = int(self.config[key])
-                        if (val>100 or val<0 or self.config[key].find('.') != -1):
-                            raise ValueError
-                    elif (key == "Pyttsx3VoiceID"):
-                        if (int(self.config[key]) < 0 or self.config[key].find('.') != -1):
-                            raise ValueError
-                else:
-                    self.config[key]
-            except KeyError:
+        checks = dict(CONFIG_CHECKS, color=self.check_color, language=self.check_language)
+        self.config, problems = validate_config(self.config_file.read(), checks)
+        for key, problem in problems:
+            if (problem == "missing"):
                 self.log ("Missing value for "+key+", loading default value", logtype="ERROR")
-                self.set_default(key)
-            except:
+            elif (problem == "invalid"):
                 self.log ("Invalid value for "+key+", loading default value", logtype="ERROR")
-                self.set_default(key)
-        config_keys = list(self.config.keys())
-        for key in config_keys:
-            try:
-                self.defcon[key]
-            except KeyError as e:
-                self.log ("Removing unwanted key: "+str(e))
-                self.config.pop(key)
+            else:
+                self.log ("Removing unwanted key: "+repr(key))
         self.log ("User configuration loaded")
         self.log (self.config)
 
@@ -845,21 +1179,44 @@ class Toice(tk.Tk):
             self.config["WindowHeight"] = str(self.winfo_height())
             self.config["WindowMaximized"] = "0"
                 
-        self.log (self.config)
-        with open(CONFIG_FILE, 'w') as configfile:
-            for key, value in self.config.items():
-                configfile.write(key+" = "+value+"\n")
+        dirty_keys = self.config_file.dirty_keys(self.config)
+        if (len(dirty_keys) == 0):
+            self.log ("No settings changed")
+            return
+        self.log ("Changed settings: "+", ".join(dirty_keys))
+        try:
+            self.config_file.write(self.config)
+            self.log ("Settings saved")
+        except OSError as e:
+            self.log ("Unable to save settings: "+str(e), logtype="ERROR")
+
+
+    def check_color(self, value, options):
+        # Resolved by Tk itself, without creating a widget to try it on
+        try:
+            self.winfo_rgb(value)
+        except tk.TclError:
+            raise ValueError
+        return value
+
+
+    def check_language(self, value, options):
+        if (value not in self.supported_ui_langs):
+            raise ValueError
+        return value
 
 
     def show_settingsmenu(self):
         # Running settings menu
         last_uilang = self.config["UILanguage"]
         self.log ("Running settings menu...")
-        self.settingsmenu= ToiceSettingsMenu(self, self.config, self.uilang)
+        from settingsmenu import ToiceSettingsMenu
+        self.settingsmenu= ToiceSettingsMenu(self, self.config, self.uilang, self.tts_engine, self.lang_index)
         self.settingsmenu.run()
         self.log ("Closed settings menu, loading saved settings")
         self.config = self.settingsmenu.config.copy()
         self.settings_changed = self.settingsmenu.settings_changed
+        self.tts_pool.resize(int(self.config["Pyttsx3Workers"]))
         self.log ("Saved settings loaded")
         if (self.config["UILanguage"] != last_uilang):
             response = mbox.askyesno (APPNAME, self.uilang["UILanguageChangeAlert"])
@@ -871,14 +1228,8 @@ class Toice(tk.Tk):
         
 
         
-    def load_ui_lang(self, lang, langfile):
-        with open(langfile, encoding='UTF-8') as langpack:
-            langpack_lines = langpack.readlines()
-            for line in langpack_lines:
-                if (line.find('=') != -1):
-                    key = line[:line.index('=')].strip()
-                    value = line[line.index('=')+1::].strip().replace("<BREAK>", "\n")
-                    self.uilang[key] = value
+    def load_ui_lang(self, lang):
+        self.uilang.update(self.lang_index.get_strings(lang))
 
 
     def reduce(self, n, percent):
@@ -907,16 +1258,28 @@ class Toice(tk.Tk):
 
 
     def exit(self):
+        if (self.tts_worker is not None and not self.generating_tts()):
+            # Let the finished speech reach the cache before it is closed
+            self.tts_worker.join()
+        self.cancel_tts_worker()
+
+        if (self.export_worker is not None):
+            # Half written exports are not kept
+            self.export_worker.cancel()
+            self.export_worker.join()
+
         self.log ("Saving settings...")
         self.save_settings()
-        self.log ("Settings saved")
 
-        if (system() != "Windows"):
-            if (self.installed_font):
-                self.log ("Noto Sans font was not previously installed, uninstalling it")
-            else:
-                self.log ("Noto Sans font was previously installed and will not be uninstalled")
-            self.unload_notosans_font()
+        if (self.tts_cache is not None):
+            self.tts_cache.close()
+        self.tts_engine.shutdown()
+        if (self.tts_pool is not None):
+            self.tts_pool.shutdown()
+
+        self.scheduler.cancel_all()
+        for line in self.scheduler.report():
+            self.log (line, logtype="TIMING")
 
         self.log ("Exitting...")
         self.destroy()
@@ -924,43 +1287,16 @@ class Toice(tk.Tk):
 
     def load_bg_image(self, directory=ROOTDIR):
 
-        cached_imgpath = USERDIR+DIRS_IN_USERDIR["CACHE"]+"CACHED_background.jpg"
         imgpath = directory+DIRS_IN_USERDIR["IMAGE"]+"background-default.jpg"
 
-        if (os.path.isfile(cached_imgpath)):
-            self.log ("Found cached background image, loading it")
-            self.orig_image = Image.open(cached_imgpath)
-
-            # Extract the accent color from the background image
-            temp_img = self.orig_image.resize((150, 150))
-            colors = temp_img.getcolors(temp_img.size[0] * temp_img.size[1])
-            sorted_colors = sorted(colors, key=lambda x: x[0], reverse=True)
-            self.dominant_color_rgb = sorted_colors[0][1]
+        if (os.path.isfile(imgpath)):
+            # Blurring and the accent color are computed once per image, later runs only open the cached level
+            self.bg_cache = BackgroundCache(imgpath, USERDIR+DIRS_IN_USERDIR["CACHE"])
+            self.orig_image = self.bg_cache.get_image(int(self.config["WindowWidth"]), int(self.config["WindowHeight"]))
+            self.dominant_color_rgb = self.bg_cache.get_dominant_color()
             self.accent_color = self.get_color_code(self.dominant_color_rgb)
-
-            status = SUCCESS
-
-        elif (os.path.isfile(imgpath)):
-            self.orig_image = Image.open(imgpath)
-
-            # Resize the cached image by 40% to reduce cache-size
-            cached_image = self.orig_image.resize((1920, 1080), Image.LANCZOS)
-
-            # Apply Gaussian blur on original image
-            self.orig_image = self.orig_image.filter(ImageFilter.GaussianBlur(50))
-
-            # Apply 40% less Gaussian blur on cached image (this will save application of blur everytime the image is loaded from cache)
-            cached_image = cached_image.filter(ImageFilter.GaussianBlur(15))
-
-            # Extract the accent color from the background image
-            temp_img = self.orig_image.resize((150, 150))
-            colors = temp_img.getcolors(temp_img.size[0] * temp_img.size[1])
-            sorted_colors = sorted(colors, key=lambda x: x[0], reverse=True)
-            self.dominant_color_rgb = sorted_colors[0][1]
-            self.accent_color = self.get_color_code(self.dominant_color_rgb)
-
-            cached_image.save(cached_imgpath)
-            self.log ("Cached background image was not found and has been generated")
+            self.antiaccent_color = self.get_color_code(self.bg_cache.get_complementary_color())
+            self.log ("Loaded background image")
 
             status = SUCCESS
 
@@ -991,13 +1327,39 @@ class Toice(tk.Tk):
         return color_code
 
 
-    def window_config(self, event):
+    def get_icon(self, original, size):
+        # CTkImages are shared per size bucket, so resizing back and forth reuses them instead of creating new ones
+        size = max(round(size/ICON_SIZE_STEP)*ICON_SIZE_STEP, ICON_SIZE_STEP)
+        key = (id(original), size)
+        if (key not in self.icon_cache):
+            self.icon_cache[key] = ctk.CTkImage(original, size=(size, size))
+        return self.icon_cache[key]
+
+
+    def set_button_icon(self, button, image):
+        if (button.cget('image') is not image):
+            button.configure(image=image, width=image.cget('size')[0], height=image.cget('size')[1])
+
+
+    def window_resized(self, event):
+        # The root's bindings also see every child widget's <Configure>, only the window's own matter
+        if (event.widget is self):
+            self.scheduler.call_later("window_config", RESIZE_DEBOUNCE_MS, self.window_config)
+
+
+    def window_config(self, event=None):
         if (self.lastwinwidth != self.winfo_width() or self.lastwinheight != self.winfo_height()):
+            if (self.bg_cache is not None):
+                # Scaled from the smallest cached level covering the window rather than from the full size image
+                self.orig_image = self.bg_cache.get_image(self.winfo_width(), self.winfo_height())
             if (self.orig_image is not None):
                 self.bg_image = self.orig_image.resize((self.winfo_width(), self.winfo_height()), Image.NEAREST)
                 self.tkbg_image = ImageTk.PhotoImage(self.bg_image)
                 self.background.image = self.tkbg_image
-                self.background.create_image(0, 0, anchor=tk.NW, image=self.background.image)
+                if (self.background_image_id is None):
+                    self.background_image_id = self.background.create_image(0, 0, anchor=tk.NW, image=self.background.image)
+                else:
+                    self.background.itemconfigure(self.background_image_id, image=self.background.image)
 
             if (self.textbox is not None):
                 self.textbox.configure(width=round(400/800*self.winfo_width()), height=round(self.winfo_height()-120))
@@ -1017,42 +1379,40 @@ class Toice(tk.Tk):
                 self.control_frame.configure(width=800/1920*self.winfo_width(), height=self.winfo_height()-self.waveform_frame.cget('height')-140)
                 self.seeker.pack_configure(fill=tk.X, side=tk.TOP, pady=30/1920*self.winfo_height(), padx=5)
 
-                #self.play_image = self.play_image_original.resize((round(50/1080*self.winfo_height()), round(50/1080*self.winfo_height())), Image.LANCZOS)
-                self.play_image = ctk.CTkImage(self.play_image_original, size=(round(50/1080*self.winfo_height()), round(50/1080*self.winfo_height())))
-                #self.pause_image = self.pause_image_original.resize((round(50/1080*self.winfo_height()), round(50/1080*self.winfo_height())), Image.LANCZOS)
-                self.pause_image = ctk.CTkImage(self.pause_image_original, size=(round(50/1080*self.winfo_height()), round(50/1080*self.winfo_height())))
-                if (self.playpausebtn.cget('image') == self.playpausebtn.play_image):
-                    self.playpausebtn.configure(image=self.play_image, width=self.play_image.cget('size')[0], height=self.play_image.cget('size')[1])
-                elif (self.playpausebtn.cget('image') == self.playpausebtn.pause_image):
-                    self.playpausebtn.configure(image=self.pause_image, width=self.pause_image.cget('size')[0], height=self.pause_image.cget('size')[1])
+                button_size = 50/1080*self.winfo_height()
+                showing_play_image = (self.playpausebtn.cget('image') == self.playpausebtn.play_image)
+                self.play_image = self.get_icon(self.play_image_original, button_size)
+                self.pause_image = self.get_icon(self.pause_image_original, button_size)
+                if (showing_play_image):
+                    self.set_button_icon(self.playpausebtn, self.play_image)
+                else:
+                    self.set_button_icon(self.playpausebtn, self.pause_image)
                 self.playpausebtn.pack_configure(ipadx=10/1920*self.winfo_width(), ipady=10/1080*self.winfo_height())
                 self.playpausebtn.play_image = self.play_image
                 self.playpausebtn.pause_image = self.pause_image
 
-
-                #self.stop_image = self.stop_image_original.resize((round(50/1080*self.winfo_height()), round(50/1080*self.winfo_height())), Image.LANCZOS)
-                self.stop_image = ctk.CTkImage(self.stop_image_original, size=(round(50/1080*self.winfo_height()), round(50/1080*self.winfo_height())))
-                self.stopbtn.configure(image=self.stop_image, width=self.stop_image.cget('size')[0], height=self.stop_image.cget('size')[1])
+                self.stop_image = self.get_icon(self.stop_image_original, button_size)
+                self.set_button_icon(self.stopbtn, self.stop_image)
                 self.stopbtn.pack_configure(padx=0.0001/1920*self.winfo_width(), ipadx=10/1920*self.winfo_width(), ipady=10/1080*self.winfo_height())
                 self.stopbtn.image = self.stop_image
 
-                self.loop_image = ctk.CTkImage(self.loop_image_original, size=(round(50/1080*self.winfo_height()), round(50/1080*self.winfo_height())))
-                self.loopbtn.configure(image=self.loop_image, width=self.loop_image.cget('size')[0], height=self.loop_image.cget('size')[1])
+                self.loop_image = self.get_icon(self.loop_image_original, button_size)
+                self.set_button_icon(self.loopbtn, self.loop_image)
                 self.loopbtn.pack_configure(ipadx=10/1920*self.winfo_width(), ipady=10/1080*self.winfo_height())
                 self.loopbtn.image = self.loop_image
 
-                self.save_image = ctk.CTkImage(self.save_image_original, size=(round(50/1080*self.winfo_height()), round(50/1080*self.winfo_height())))
-                self.savebtn.configure(image=self.save_image, width=self.save_image.cget('size')[0], height=self.save_image.cget('size')[1])
+                self.save_image = self.get_icon(self.save_image_original, button_size)
+                self.set_button_icon(self.savebtn, self.save_image)
                 self.savebtn.pack_configure(ipadx=10/1920*self.winfo_width(), ipady=10/1080*self.winfo_height())
                 self.savebtn.image = self.save_image
 
                 if (self.volume_slider.get() != 0):
-                    self.volume_image = ctk.CTkImage(self.volume_image_original, size=(round(40/1080*self.winfo_height()), round(40/1080*self.winfo_height())))
-                    self.volume_icon.configure(image=self.volume_image, width=self.volume_image.cget('size')[0], height=self.volume_image.cget('size')[1])
+                    self.volume_image = self.get_icon(self.volume_image_original, 40/1080*self.winfo_height())
+                    self.set_button_icon(self.volume_icon, self.volume_image)
                     self.volume_icon.image = self.volume_image
                 else:
-                    self.volume_image_muted = ctk.CTkImage(self.volume_image_muted_original, size=(round(40/1080*self.winfo_height()), round(40/1080*self.winfo_height())))
-                    self.volume_icon.configure(image=self.volume_image_muted, width=self.volume_image_muted.cget('size')[0], height=self.volume_image_muted.cget('size')[1])
+                    self.volume_image_muted = self.get_icon(self.volume_image_muted_original, 40/1080*self.winfo_height())
+                    self.set_button_icon(self.volume_icon, self.volume_image_muted)
                     self.volume_icon.image_muted = self.volume_image_muted
                 self.volume_frame.pack_configure(padx=20/1024*self.winfo_width())
 
@@ -1062,18 +1422,24 @@ class Toice(tk.Tk):
 
     def run(self):
         self.deiconify()
-        self.bind("<Configure>", lambda event: self.after(10, self.window_config, event))
+        if (self.profile_startup):
+            self.update_idletasks()
+            self.mark_startup_phase("First window")
+            self.print_startup_profile()
+        self.bind("<Configure>", self.window_resized)
         self.bind("<FocusIn>", lambda event: self.textbox.focus_set())
+        self.textbox.bind("<<Modified>>", self.textbox_modified)
+        self.textbox.bind("<FocusIn>", self.textbox_modified)
         self.textbox.focus_set()
         self.reset_pause_state()
         self.alter_textbox_placeholder()
         self.mainloop()
         
 
-def start_toice(logging=False):
-    toice = Toice(logging=logging)
+def start_toice(logging=False, profile_startup=False):
+    toice = Toice(logging=logging, profile_startup=profile_startup)
     toice.run()
 
 
 if (__name__ == "__main__"):
-    start_toice(logging=True)
+    start_toice(logging=True, profile_startup=("--profile-startup" in sys.argv[1:]))
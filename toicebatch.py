@@ -0,0 +1,137 @@
+# -*- coding: utf8 -*-
+
+# Headless bulk text to speech: python toice.py --batch manifest.jsonl --out dir/ --format ogg,mp3
+#
+# Every manifest line is either a JSON string (the text) or a JSON object with a "text" key and
+# optional "id", "api", "rate", "volume" and "voice" keys overriding the settings from config.cfg.
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from toiceconfig import USERDIR, DIRS_IN_USERDIR, get_synthesis_workers, read_config, override_settings
+from ttsworker import CachedSynthesizer
+from ttscache import TTSCache
+from ttsengine import get_available_backends
+from audioutils import export_audio
+
+
+def read_manifest(path):
+    entries = []
+    with open(path, encoding="UTF-8") as manifest:
+        line_number = 0
+        for line in manifest:
+            line_number += 1
+            if (line.strip() == ""):
+                continue
+            entry = json.loads(line)
+            if (isinstance(entry, str)):
+                entry = {"text": entry}
+            entry["line"] = line_number
+            entries.append(entry)
+    return entries
+
+
+def get_output_name(entry, digits):
+    name = str(entry.get("id", str(entry["line"]).zfill(digits)))
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", name)
+
+
+class BatchRunner:
+
+    def __init__(self, config, output_dir, output_formats, jobs):
+
+        # Command line backends run as many programs at once as there are jobs
+        self.config = dict(config, SynthesisWorkers=str(jobs))
+        self.output_dir = output_dir
+        self.output_formats = output_formats
+        self.jobs = jobs
+
+        self.cache = TTSCache(USERDIR+DIRS_IN_USERDIR["CACHE"], int(config["CacheSizeMB"])*1024*1024)
+        # Each entry's backend comes from the registry, with engines for as many entries at once as there are jobs
+        self.synthesizer = CachedSynthesizer(self.cache, jobs)
+
+        self.cache_hits = 0
+        self.failures = []
+
+
+    def process(self, entry, digits):
+        try:
+            text = str(entry["text"]).strip()
+            if (text == ""):
+                raise ValueError("empty text")
+            # Pinned, since the other jobs keep adding to the cache while this one exports
+            ttspath, cache_hit = self.synthesizer.synthesize(text, override_settings(self.config, entry), pin=True)
+            if (cache_hit):
+                self.cache_hits += 1
+            try:
+                for output_format in self.output_formats:
+                    output_path = os.path.join(self.output_dir, get_output_name(entry, digits)+"."+output_format)
+                    export_audio(ttspath, output_path, output_format)
+            finally:
+                self.synthesizer.release(ttspath)
+            return len(text)
+        except Exception as e:
+            self.failures.append((entry["line"], repr(e)))
+            return None
+
+
+    def run(self, entries):
+        os.makedirs(self.output_dir, exist_ok=True)
+        digits = len(str(len(entries)))
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            results = list(executor.map(lambda entry: self.process(entry, digits), entries))
+        elapsed = time.perf_counter()-start_time
+
+        characters = sum(result for result in results if result is not None)
+        self.cache.close()
+        self.synthesizer.shutdown()
+        return {
+                    "entries": len(entries),
+                    "succeeded": len(entries)-len(self.failures),
+                    "failed": len(self.failures),
+                    "cache_hits": self.cache_hits,
+                    "seconds": elapsed,
+                    "entries_per_second": len(entries)/elapsed if elapsed > 0 else 0.0,
+                    "characters_per_second": characters/elapsed if elapsed > 0 else 0.0
+               }
+
+
+def print_summary(summary, failures):
+    print ("Processed %d entries in %.2f s (%.2f entries/s, %.0f characters/s)"%(summary["entries"], summary["seconds"], summary["entries_per_second"], summary["characters_per_second"]))
+    print ("Succeeded: %d (cache hits: %d)"%(summary["succeeded"], summary["cache_hits"]))
+    print ("Failed: %d"%summary["failed"])
+    for line_number, error in sorted(failures):
+        print ("    line %d: %s"%(line_number, error))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="toice.py", description="Convert every text of a JSON lines manifest to an audio file, without the GUI.")
+    parser.add_argument("--batch", required=True, metavar="MANIFEST", help="JSON lines file with one text (or object with a \"text\" key) per line")
+    parser.add_argument("--out", required=True, metavar="DIR", help="directory to write the audio files to")
+    parser.add_argument("--format", default="mp3", help="output audio formats, comma separated, e.g. mp3 or ogg,flac (default: mp3)")
+    parser.add_argument("--jobs", type=int, default=None, help="entries synthesized concurrently (default: SynthesisWorkers from config.cfg)")
+    args = parser.parse_args(argv)
+
+    config = read_config()
+    if (config["APIInUse"] not in get_available_backends()):
+        print ("The %s backend set in config.cfg is not available"%config["APIInUse"], file=sys.stderr)
+        return 2
+    jobs = args.jobs if args.jobs is not None else get_synthesis_workers(config)
+
+    try:
+        entries = read_manifest(args.batch)
+    except (OSError, ValueError) as e:
+        print ("Unable to read manifest %s: %s"%(args.batch, e), file=sys.stderr)
+        return 2
+
+    output_formats = [_format.strip().lower().lstrip(".") for _format in args.format.split(",") if _format.strip() != ""] or ["mp3"]
+    runner = BatchRunner(config, args.out, output_formats, max(jobs, 1))
+    summary = runner.run(entries)
+    print_summary(summary, runner.failures)
+    return 0 if summary["failed"] == 0 else 1
@@ -0,0 +1,279 @@
+# -*- coding: utf8 -*-
+
+import os
+import re
+from platform import system
+
+APPNAME = "Toice"
+
+DIRS_IN_USERDIR = {
+        "IMAGE": "images/",
+        "CACHE": "cache/",
+        "BACKENDS": "backends/"
+        }
+
+ROOTDIR = os.path.dirname(__file__).replace("\\", "/")+"/"
+
+if (ROOTDIR == '/'):
+    ROOTDIR = ''
+
+if (system() == "Windows"):
+    USERDIR = os.environ["LOCALAPPDATA"]+"\\"+APPNAME+"\\".replace("\\", "/")
+elif (system() == "Darwin"):
+    USERDIR = os.path.expanduser("~/Library/%s/"%APPNAME)
+else:
+    USERDIR = os.path.expanduser("~/.%s/"%APPNAME.lower())
+
+CONFIG_FILE = USERDIR+"config.cfg"
+
+# Audio formats speech can be saved as, by file extension
+EXPORT_FORMATS = ("mp3", "wav", "ogg", "flac", "aac", "m4a", "wma", "aiff")
+
+# Every setting in config.cfg, in the order it is written: key -> (default, kind, options)
+# The kind names the check in CONFIG_CHECKS that parses a value, options are what that check compares against
+CONFIG_SCHEMA = {
+        "WindowWidth": ("1024", "int", None),
+        "WindowHeight": ("576", "int", None),
+        "WindowX": ("50", "int", None),
+        "WindowY": ("50", "int", None),
+        "WindowMaximized": ("0", "bool", None),
+
+        "TextboxFG": ("black", "color", None),
+        "TextboxBG": ("white", "color", None),
+
+        "LastSavedInDirectory": (os.path.expanduser('~'), "dir", None),
+
+        "FontSize": ("20", "int", None),
+
+        "AudioVolume": ("67", "int", None),
+        "LoopAudio": ("1", "bool", None),
+
+        "UILanguage": ("English (US)", "language", None),
+
+        "Pyttsx3Speed": ("150", "int", (50, 300)),
+        "Pyttsx3Volume": ("67", "int", (0, 100)),
+        "Pyttsx3VoiceID": ("0", "int", (0, None)),
+        "Pyttsx3Workers": ("1", "int", (1, 64)),
+
+        # Texts synthesized side by side by the other offline backends, and by the batch and service modes; 0 follows Pyttsx3Workers
+        "SynthesisWorkers": ("0", "int", (0, 64)),
+
+        "APIInUse": ("Pyttsx3", "backend", None),
+        "PiperModel": ("", "file", None),
+        "GTTSConcurrency": ("4", "int", (1, 16)),
+        "GTTSRequestsPerSecond": ("8", "int", (1, 100)),
+        "GTTSRetries": ("3", "int", (0, 10)),
+
+        "CacheSizeMB": ("256", "int", (0, None)),
+        "StreamingSynthesis": ("1", "bool", None),
+        "MemoryBudgetMB": ("64", "int", (4, 4096)),
+
+        "ExtraExportFormats": ("", "formats", EXPORT_FORMATS)
+        }
+
+DEFAULT_CONFIG = {key: default for key, (default, kind, options) in CONFIG_SCHEMA.items()}
+
+# Hexadecimal #rgb forms or a color name, the same spellings Tk accepts
+COLOR_PATTERN = re.compile(r"#(?:[0-9a-fA-F]{3}){1,4}|[A-Za-z][A-Za-z0-9 ]*")
+
+SUCCESS = 0
+FAILURE = 1
+
+
+def parse_settings(lines):
+    settings = {}
+    for line in lines:
+        if (not (line.startswith('//') or line.startswith('#')) and line.find('=') != -1):
+            key = line[:line.index('=')].strip()
+            value = line[line.index('=')+1::].strip()
+            settings[key] = value
+    return settings
+
+
+def check_int(value, limits):
+    # Integers only, "1.0" is rejected by int() itself
+    number = int(value)
+    minimum, maximum = limits or (None, None)
+    if ((minimum is not None and number < minimum) or (maximum is not None and number > maximum)):
+        raise ValueError
+    return str(number)
+
+
+def check_bool(value, options):
+    return check_int(value, (0, 1))
+
+
+def check_choice(value, choices):
+    if (value not in choices):
+        raise ValueError
+    return value
+
+
+def check_dir(value, options):
+    if (not os.path.isdir(value)):
+        raise ValueError
+    return value
+
+
+def check_file(value, options):
+    # An existing file, or nothing
+    if (value != '' and not os.path.isfile(value)):
+        raise ValueError
+    return value
+
+
+def check_backend(value, options):
+    # Any backend in ttsengine's registry, plugins included; imported here since ttsengine reads DIRS_IN_USERDIR from this module
+    from ttsengine import get_backends
+    if (value not in get_backends()):
+        raise ValueError
+    return value
+
+
+def check_formats(value, formats):
+    # Comma separated file extensions, possibly none
+    chosen = [_format.strip().lstrip('.').lower() for _format in value.split(',') if _format.strip() != '']
+    for _format in chosen:
+        if (_format not in formats):
+            raise ValueError
+    return ",".join(chosen)
+
+
+def check_color(value, options):
+    if (not COLOR_PATTERN.fullmatch(value)):
+        raise ValueError
+    return value
+
+
+def check_text(value, options):
+    if (value == ''):
+        raise ValueError
+    return value
+
+
+CONFIG_CHECKS = {
+        "int": check_int,
+        "bool": check_bool,
+        "choice": check_choice,
+        "dir": check_dir,
+        "file": check_file,
+        "backend": check_backend,
+        "formats": check_formats,
+        "color": check_color,
+        "language": check_text
+        }
+
+
+def get_synthesis_workers(config):
+    # SynthesisWorkers, or Pyttsx3Workers for configs that predate it or leave it at 0
+    workers = int(config.get("SynthesisWorkers", "0"))
+    if (workers == 0):
+        workers = int(config.get("Pyttsx3Workers", "1"))
+    return max(workers, 1)
+
+
+def check_setting(key, value, checks=CONFIG_CHECKS):
+    # The normalized value of one setting, ValueError or TypeError when the schema does not allow it
+    default, kind, options = CONFIG_SCHEMA[key]
+    return checks[kind](value, options)
+
+
+def describe_setting(key):
+    # What the schema allows for a setting, for error messages
+    default, kind, options = CONFIG_SCHEMA[key]
+    if (kind == "int" and options is not None):
+        minimum, maximum = options
+        if (maximum is None):
+            return "an integer of at least %d"%minimum
+        return "an integer from %d to %d"%(minimum, maximum)
+    if (kind == "backend"):
+        from ttsengine import get_backends
+        return "one of %s"%", ".join(get_backends())
+    return "a valid %s"%kind
+
+
+def validate_config(config, checks=CONFIG_CHECKS):
+    # Returns the config with every schema key set to a valid value, and the (key, problem) pairs found on the way
+    validated = {}
+    problems = []
+    for key, (default, kind, options) in CONFIG_SCHEMA.items():
+        if (key not in config):
+            problems.append((key, "missing"))
+            validated[key] = default
+            continue
+        try:
+            validated[key] = check_setting(key, config[key], checks)
+        except (ValueError, TypeError):
+            problems.append((key, "invalid"))
+            validated[key] = default
+    for key in config:
+        if (key not in CONFIG_SCHEMA):
+            problems.append((key, "unknown"))
+    return (validated, problems)
+
+
+class ConfigFile:
+
+    # config.cfg as it was last read or written, so that it is only rewritten when a setting actually changed
+
+    def __init__(self, path):
+
+        self.path = path
+        self.saved = {}
+
+
+    def read(self):
+        try:
+            with open(self.path) as configfile:
+                self.saved = parse_settings(configfile.readlines())
+        except OSError:
+            self.saved = {}
+        return self.saved.copy()
+
+
+    def dirty_keys(self, config):
+        return [key for key in config if self.saved.get(key) != config[key]]+[key for key in self.saved if key not in config]
+
+
+    def write(self, config):
+        # A temporary file renamed over the old one, so that being killed mid-write never leaves a truncated config behind
+        if (len(self.dirty_keys(config)) == 0):
+            return False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_file = self.path+".tmp"
+        with open(temp_file, 'w') as configfile:
+            for key, value in config.items():
+                configfile.write(key+" = "+value+"\n")
+            configfile.flush()
+            os.fsync(configfile.fileno())
+        os.replace(temp_file, self.path)
+        self.saved = config.copy()
+        return True
+
+
+def read_config():
+    # The user configuration with every missing or invalid setting replaced by its default
+    config, problems = validate_config(ConfigFile(CONFIG_FILE).read())
+    return config
+
+
+# Keys accepted by the headless modes for per-request settings, and the settings they override
+SETTING_OVERRIDES = {
+        "api": "APIInUse",
+        "rate": "Pyttsx3Speed",
+        "volume": "Pyttsx3Volume",
+        "voice": "Pyttsx3VoiceID"
+        }
+
+
+def override_settings(config, overrides):
+    # Checked against CONFIG_SCHEMA like config.cfg is, and stored the way the config loader stores them
+    config = config.copy()
+    for key, setting in SETTING_OVERRIDES.items():
+        if (key not in overrides):
+            continue
+        try:
+            config[setting] = check_setting(setting, str(overrides[key]))
+        except (ValueError, TypeError):
+            raise ValueError("%s must be %s, not %r"%(key, describe_setting(setting), overrides[key]))
+    return config
@@ -0,0 +1,251 @@
+# -*- coding: utf8 -*-
+
+# Local synthesis service: python toice.py --serve [--host 127.0.0.1] [--port 8765] [--workers 2] [--queue-size 32]
+#
+# POST /synthesize with a JSON body {"text": ..., "api": ..., "rate": ..., "volume": ..., "voice": ...}
+# answers with the audio (audio/wav or audio/mpeg, depending on the backend). GET /health reports the queue state.
+# Requests are rejected with 503 when the queue is full, identical concurrent requests share one synthesis.
+
+import sys
+import json
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import ttshandler as ttsh
+
+from toiceconfig import USERDIR, DIRS_IN_USERDIR, get_synthesis_workers, read_config, override_settings
+from ttsworker import CachedSynthesizer
+from ttscache import TTSCache
+from ttsengine import get_available_backends
+
+MAX_BODY_BYTES = 1024*1024
+
+CONTENT_TYPES = {
+        "wav": "audio/wav",
+        "mp3": "audio/mpeg"
+        }
+
+REASONS = {
+        200: "OK",
+        400: "Bad Request",
+        404: "Not Found",
+        405: "Method Not Allowed",
+        413: "Payload Too Large",
+        500: "Internal Server Error",
+        502: "Bad Gateway",
+        503: "Service Unavailable"
+        }
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=""):
+        super().__init__(message)
+        self.status = status
+
+
+def read_file(path):
+    with open(path, 'rb') as audiofile:
+        return audiofile.read()
+
+
+class ToiceServer:
+
+    def __init__(self, config, workers, queue_size, logging=True):
+
+        # Command line backends run as many programs at once as there are workers
+        self.config = dict(config, SynthesisWorkers=str(workers))
+        self.workers = workers
+        self.logging = logging
+
+        self.cache = TTSCache(USERDIR+DIRS_IN_USERDIR["CACHE"], int(config["CacheSizeMB"])*1024*1024)
+        # Each request's backend comes from the registry, with engines for as many syntheses at once as there are workers
+        self.synthesizer = CachedSynthesizer(self.cache, workers)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+        # cache key -> future of the synthesis in progress, shared by identical requests
+        self.inflight = {}
+        self.worker_tasks = []
+
+
+    def log(self, string):
+        if (self.logging):
+            print (string, file=sys.stderr)
+
+
+    def read_audio(self, ttspath):
+        # (content type, audio) of a pinned cache file, which is released once read
+        try:
+            return CONTENT_TYPES[ttspath.rsplit(".", 1)[1]], read_file(ttspath)
+        finally:
+            self.cache.release(ttspath)
+
+
+    def synthesize_audio(self, text, config, cache_key):
+        # The audio is read inside the job, while its cache entry is pinned, so that another request's synthesis can not evict it first
+        ttspath, cache_hit = self.synthesizer.synthesize(text, config, cache_key, pin=True)
+        return self.read_audio(ttspath)
+
+
+    async def run_worker(self):
+        loop = asyncio.get_running_loop()
+        while (True):
+            text, config, cache_key, future = await self.queue.get()
+            try:
+                result = await loop.run_in_executor(self.executor, self.synthesize_audio, text, config, cache_key)
+                if (not future.done()):
+                    future.set_result(result)
+            except Exception as e:
+                if (not future.done()):
+                    future.set_exception(e)
+            finally:
+                self.inflight.pop(cache_key, None)
+                self.queue.task_done()
+
+
+    async def synthesize(self, text, config):
+        # (content type, audio) of the speech of text
+        cache_key = self.cache.make_key(text, config)
+        ttspath = self.cache.lookup(cache_key, pin=True)
+        if (ttspath is not None):
+            return await asyncio.get_running_loop().run_in_executor(None, self.read_audio, ttspath)
+
+        future = self.inflight.get(cache_key)
+        if (future is None):
+            future = asyncio.get_running_loop().create_future()
+            try:
+                self.queue.put_nowait((text, config, cache_key, future))
+            except asyncio.QueueFull:
+                raise HTTPError(503, "synthesis queue is full, retry later")
+            self.inflight[cache_key] = future
+        # shield() keeps one client disconnecting from cancelling the synthesis shared with others
+        return await asyncio.shield(future)
+
+
+    async def handle_synthesize(self, body):
+        try:
+            request = json.loads(body)
+            text = str(request["text"]).strip()
+            config = override_settings(self.config, request)
+        except (ValueError, KeyError, TypeError) as e:
+            raise HTTPError(400, "invalid request: %s"%e)
+        if (text == ""):
+            raise HTTPError(400, "invalid request: empty text")
+
+        try:
+            return await self.synthesize(text, config)
+        except ttsh.ttsexceptions.GTTSConnectionError as e:
+            raise HTTPError(502, str(e))
+
+
+    def handle_health(self):
+        health = {
+                    "workers": self.workers,
+                    "queued": self.queue.qsize(),
+                    "queue_size": self.queue.maxsize,
+                    "inflight": len(self.inflight)
+                 }
+        return "application/json", json.dumps(health).encode("UTF-8")
+
+
+    async def read_request(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if (len(request_line) != 3):
+            raise HTTPError(400, "malformed request line")
+        method, path = request_line[0], request_line[1]
+        headers = {}
+        while (True):
+            line = (await reader.readline()).decode("latin-1").strip()
+            if (line == ""):
+                break
+            if (line.find(":") != -1):
+                headers[line[:line.index(":")].strip().lower()] = line[line.index(":")+1::].strip()
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise HTTPError(400, "invalid Content-Length: %s"%headers["content-length"])
+        if (length < 0):
+            raise HTTPError(400, "invalid Content-Length: %d"%length)
+        if (length > MAX_BODY_BYTES):
+            raise HTTPError(413, "request body is larger than %d bytes"%MAX_BODY_BYTES)
+        body = await reader.readexactly(length)
+        return method, path, body
+
+
+    async def write_response(self, writer, status, content_type, body):
+        header = "HTTP/1.1 %d %s\r\nContent-Type: %s\r\nContent-Length: %d\r\nConnection: close\r\n"%(status, REASONS[status], content_type, len(body))
+        if (status == 503):
+            header += "Retry-After: 1\r\n"
+        writer.write((header+"\r\n").encode("latin-1")+body)
+        await writer.drain()
+
+
+    async def handle_connection(self, reader, writer):
+        status = 200
+        try:
+            method, path, body = await self.read_request(reader)
+            if (path == "/health"):
+                content_type, response = self.handle_health()
+            elif (path == "/synthesize"):
+                if (method != "POST"):
+                    raise HTTPError(405, "use POST")
+                content_type, response = await self.handle_synthesize(body)
+            else:
+                raise HTTPError(404, "unknown path: %s"%path)
+        except HTTPError as e:
+            status, content_type, response = e.status, "application/json", json.dumps({"error": str(e)}).encode("UTF-8")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        except Exception as e:
+            status, content_type, response = 500, "application/json", json.dumps({"error": repr(e)}).encode("UTF-8")
+        try:
+            await self.write_response(writer, status, content_type, response)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+    async def serve(self, host, port):
+        for i in range(self.workers):
+            self.worker_tasks.append(asyncio.create_task(self.run_worker()))
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        self.log ("Toice synthesis service listening on http://%s:%d (workers: %d, queue size: %d)"%(host, port, self.workers, self.queue.maxsize))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in self.worker_tasks:
+                task.cancel()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.cache.close()
+            self.synthesizer.shutdown()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="toice.py", description="Run Toice as a local HTTP text to speech service.")
+    parser.add_argument("--serve", action="store_true", required=True, help="run the synthesis service")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    parser.add_argument("--workers", type=int, default=None, help="concurrent syntheses (default: SynthesisWorkers from config.cfg)")
+    parser.add_argument("--queue-size", type=int, default=32, help="requests waiting for a worker before new ones get 503 (default: 32)")
+    args = parser.parse_args(argv)
+
+    config = read_config()
+    if (config["APIInUse"] not in get_available_backends()):
+        print ("The %s backend set in config.cfg is not available"%config["APIInUse"], file=sys.stderr)
+        return 2
+    workers = max(args.workers if args.workers is not None else get_synthesis_workers(config), 1)
+
+    async def run():
+        server = ToiceServer(config, workers, max(args.queue_size, 1))
+        await server.serve(args.host, args.port)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
@@ -0,0 +1,259 @@
+# -*- coding: utf8 -*-
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+from ttsengine import get_backends
+
+# Settings that change the synthesized audio, in the order they are hashed
+CACHE_KEY_SETTINGS = ("APIInUse", "Pyttsx3Speed", "Pyttsx3Volume", "Pyttsx3VoiceID")
+
+AUDIO_EXTENSIONS = (".wav", ".mp3")
+
+# Files derived from a cache entry's audio, named after it, that live and die with the entry
+SIDECAR_EXTENSIONS = (".peaks", ".seek")
+
+# The GUI, --batch and --serve share the cache directory. Files younger than this may still be written or
+# used by another of them, so they are neither removed as orphans nor evicted on that process's behalf
+IN_USE_SECONDS = 600
+
+
+class IndexLock:
+
+    # Held while the index is read and written, so that processes sharing the cache take turns
+
+    def __init__(self, path):
+
+        self.path = path
+        self.fd = None
+
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        if (fcntl is not None):
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(self.fd, msvcrt.LK_LOCK, 1)
+        return self
+
+
+    def __exit__(self, *exc_info):
+        if (fcntl is not None):
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        os.close(self.fd)
+        self.fd = None
+
+
+class TTSCache:
+
+    def __init__(self, cachedir, max_bytes):
+
+        self.cachedir = cachedir
+        self.index_file = os.path.join(cachedir, "index.json")
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.index_lock = IndexLock(os.path.join(cachedir, "index.lock"))
+
+        # key -> {"file": <name in cachedir>, "size": <bytes>, "last_used": <epoch seconds>, "duration": <milliseconds>}
+        self.entries = {}
+
+        # key -> file of the entries this process removed since the index was last written, so that merging does not bring them back
+        self.removed = {}
+
+        # Files this process added or looked up; every other file may be in use by another process
+        self.local_files = set()
+
+        # File -> number of callers still using it, see release(). Pinned files are never evicted or replaced
+        self.pins = {}
+
+        os.makedirs(self.cachedir, exist_ok=True)
+        with self.index_lock:
+            self.entries = self.read_index()
+            self.remove_orphans()
+
+
+    @staticmethod
+    def make_key(text, config):
+        data = [text]+[str(config.get(setting, "")) for setting in CACHE_KEY_SETTINGS]
+        # Settings only some backends use are hashed only for them, so that the keys of the others stay the same
+        backend_class = get_backends().get(config.get("APIInUse"))
+        if (backend_class is not None and len(backend_class.cache_settings) != 0):
+            data += [str(config.get(setting, "")) for setting in backend_class.cache_settings]
+        return hashlib.sha256(json.dumps(data).encode("UTF-8")).hexdigest()
+
+
+    def read_index(self):
+        # The entries on disk whose audio still exists
+        try:
+            with open(self.index_file, encoding="UTF-8") as indexfile:
+                entries = json.load(indexfile)
+            return {key: entry for key, entry in entries.items() if os.path.isfile(os.path.join(self.cachedir, entry["file"]))}
+        except (OSError, ValueError, KeyError, AttributeError, TypeError):
+            return {}
+
+
+    def merge_index(self):
+        # Takes in what other processes added and used since this one last read the index
+        for key, entry in self.read_index().items():
+            if (self.removed.get(key) == entry["file"]):
+                continue
+            current = self.entries.get(key)
+            if (current is None or (current["file"] != entry["file"] and entry["last_used"] > current["last_used"])):
+                self.entries[key] = entry
+            elif (current["file"] == entry["file"]):
+                current["last_used"] = max(current["last_used"], entry["last_used"])
+        self.removed = {}
+
+
+    def save_index(self, keep=None):
+        # Merged with the index on disk and evicted while holding the index lock, then written to a temporary
+        # file first so that a crash never leaves a truncated index behind
+        with self.index_lock:
+            self.merge_index()
+            self.evict(keep)
+            temp_file = self.index_file+".tmp"
+            with open(temp_file, 'w', encoding="UTF-8") as indexfile:
+                json.dump(self.entries, indexfile)
+            os.replace(temp_file, self.index_file)
+
+
+    def is_recent(self, filename):
+        try:
+            return (time.time()-os.path.getmtime(os.path.join(self.cachedir, filename)) < IN_USE_SECONDS)
+        except OSError:
+            return False
+
+
+    def remove_orphans(self):
+        # Audio no process has indexed, and sidecars of audio that is gone; recent files may be another process's work in progress
+        indexed_files = set(entry["file"] for entry in self.entries.values())
+        indexed_roots = set(os.path.splitext(_file)[0] for _file in indexed_files)
+        for _file in os.listdir(self.cachedir):
+            if ((_file.endswith(AUDIO_EXTENSIONS) and _file not in indexed_files) or
+                (_file.endswith(SIDECAR_EXTENSIONS) and os.path.splitext(_file)[0] not in indexed_roots)):
+                if (self.is_recent(_file)):
+                    continue
+                try:
+                    os.remove(os.path.join(self.cachedir, _file))
+                except OSError:
+                    pass
+
+
+    def new_path(self, key, extension):
+        # A unique name per generation, so a cancelled job can never clobber a newer one for the same key
+        return os.path.join(self.cachedir, "%s_%d%s"%(key, time.time_ns(), extension))
+
+
+    def lookup(self, key, pin=False):
+        # With pin, the file stays until release() is called for it
+        with self.lock:
+            entry = self.entries.get(key)
+            if (entry is None):
+                return None
+            path = os.path.join(self.cachedir, entry["file"])
+            if (not os.path.isfile(path)):
+                self.removed[key] = self.entries.pop(key)["file"]
+                return None
+            entry["last_used"] = time.time()
+            self.local_files.add(entry["file"])
+            if (pin):
+                self.pins[entry["file"]] = self.pins.get(entry["file"], 0)+1
+            try:
+                # Tells other processes the file is in use until this one writes the index again
+                os.utime(path)
+            except OSError:
+                pass
+            return path
+
+
+    def add(self, key, path, duration=None, pin=False):
+        with self.lock:
+            old_entry = self.entries.get(key)
+            if (old_entry is not None and old_entry["file"] != os.path.basename(path)):
+                self.removed[key] = old_entry["file"]
+                if (old_entry["file"] not in self.pins):
+                    self.remove_file(old_entry["file"])
+            self.local_files.add(os.path.basename(path))
+            if (pin):
+                self.pins[os.path.basename(path)] = self.pins.get(os.path.basename(path), 0)+1
+            self.entries[key] = {
+                                    "file": os.path.basename(path),
+                                    "size": os.path.getsize(path),
+                                    "last_used": time.time(),
+                                    "duration": duration
+                                }
+            self.save_index(keep=key)
+
+
+    def release(self, path):
+        # Unpins a file from lookup() or add(); one replaced while it was pinned is removed now
+        filename = os.path.basename(path)
+        with self.lock:
+            count = self.pins.pop(filename, 0)-1
+            if (count > 0):
+                self.pins[filename] = count
+            elif (all(entry["file"] != filename for entry in self.entries.values())):
+                self.remove_file(filename)
+
+
+    def get_duration(self, path):
+        # Duration recorded when the file was added, None if unknown
+        filename = os.path.basename(path)
+        with self.lock:
+            for entry in self.entries.values():
+                if (entry["file"] == filename):
+                    return entry.get("duration")
+        return None
+
+
+    def set_max_bytes(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self.save_index()
+
+
+    def total_bytes(self):
+        return sum(entry["size"] for entry in self.entries.values())
+
+
+    def remove_file(self, filename):
+        root = os.path.splitext(filename)[0]
+        for _file in (filename,)+tuple(root+extension for extension in SIDECAR_EXTENSIONS):
+            try:
+                os.remove(os.path.join(self.cachedir, _file))
+            except OSError:
+                pass
+
+
+    def evict(self, keep=None):
+        # Drop least recently used entries until the cache fits in its budget. Another process's recent entries are
+        # left for that process to evict, since it may be reading them right now
+        total = self.total_bytes()
+        for key in sorted(self.entries, key=lambda k: self.entries[k]["last_used"]):
+            if (total <= self.max_bytes):
+                break
+            filename = self.entries[key]["file"]
+            if (key == keep or filename in self.pins or (filename not in self.local_files and self.is_recent(filename))):
+                continue
+            entry = self.entries.pop(key)
+            self.removed[key] = filename
+            self.local_files.discard(filename)
+            self.remove_file(filename)
+            total -= entry["size"]
+
+
+    def close(self):
+        with self.lock:
+            self.save_index()
@@ -0,0 +1,518 @@
+# -*- coding: utf8 -*-
+
+import os
+import queue
+import threading
+import subprocess
+import multiprocessing
+import importlib.util
+from shutil import which
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from platform import system
+
+
+class Pyttsx3Engine:
+
+    def __init__(self, driver_name=None):
+
+        self.driver_name = driver_name
+        self.engine = None
+        self.voices = None
+
+        # Properties currently applied to the engine, so that only changes are sent to the driver
+        self.properties = {}
+
+        # All driver calls are made from one long-lived thread, since drivers like SAPI5 are bound to the thread that created them
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.thread_lock = threading.Lock()
+
+
+    def start(self):
+        with self.thread_lock:
+            if (self.thread is None):
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+
+    def run(self):
+        if (system() == "Windows"):
+            try:
+                import comtypes
+                comtypes.CoInitialize()
+            except ImportError:
+                pass
+
+        while (True):
+            job = self.jobs.get()
+            if (job is None):
+                break
+            function, args, future = job
+            if (not future.set_running_or_notify_cancel()):
+                continue
+            try:
+                future.set_result(function(*args))
+            except BaseException as e:
+                future.set_exception(e)
+        self.reset_engine()
+
+
+    def submit(self, function, *args):
+        self.start()
+        future = Future()
+        self.jobs.put((function, args, future))
+        return future
+
+
+    def get_engine(self):
+        if (self.engine is None):
+            import pyttsx3
+            import ttshandler as ttsh
+            try:
+                self.engine = pyttsx3.init(self.driver_name)
+            except Exception as e:
+                raise ttsh.ttsexceptions.Pyttsx3InitializationError(f"Unable to initialize TTS engine for pyttsx3: {e}")
+            self.voices = list(self.engine.getProperty('voices'))
+            self.properties = {}
+        return self.engine
+
+
+    def reset_engine(self):
+        if (self.engine is not None):
+            try:
+                self.engine.stop()
+            except Exception:
+                pass
+        self.engine = None
+        self.properties = {}
+
+
+    def apply_properties(self, rate, volume, voice):
+        import ttshandler as ttsh
+        engine = self.get_engine()
+        if (not -len(self.voices) <= voice < len(self.voices)):
+            raise ttsh.ttsexceptions.TTSPropertyError(f"Invalid value for property -voice: '{voice}', only {len(self.voices)} voices are installed")
+        properties = {
+                        "rate": rate,
+                        "volume": volume,
+                        "voice": self.voices[voice].id
+                     }
+        for name, value in properties.items():
+            if (self.properties.get(name) != value):
+                engine.setProperty(name, value)
+                self.properties[name] = value
+
+
+    def save_to_file(self, text, output_path, rate, volume, voice):
+        import ttshandler as ttsh
+        for attempt in range(2):
+            try:
+                self.apply_properties(rate, volume, voice)
+                self.engine.save_to_file(text, output_path)
+                self.engine.runAndWait()
+                return output_path
+            except (ttsh.ttsexceptions.Pyttsx3InitializationError, ttsh.ttsexceptions.TTSPropertyError):
+                raise
+            except Exception:
+                # The driver died, retry once with a freshly created engine
+                self.reset_engine()
+                if (attempt == 1):
+                    raise
+
+
+    def load_voices(self):
+        self.get_engine()
+        return list(self.voices)
+
+
+    def warm_up(self):
+        return self.submit(self.get_engine)
+
+
+    def synthesize(self, text, output_path, rate, volume, voice):
+        return self.submit(self.save_to_file, text, output_path, rate, volume, voice).result()
+
+
+    def get_voices(self):
+        if (self.voices is not None):
+            return list(self.voices)
+        try:
+            return self.submit(self.load_voices).result()
+        except Exception:
+            return []
+
+
+    def shutdown(self):
+        with self.thread_lock:
+            if (self.thread is not None):
+                self.jobs.put(None)
+                self.thread = None
+
+
+# Engine of the current synthesis pool process, created by init_pool_process()
+pool_process_engine = None
+
+
+def init_pool_process(driver_name):
+    global pool_process_engine
+    pool_process_engine = Pyttsx3Engine(driver_name)
+    pool_process_engine.warm_up()
+
+
+def synthesize_in_pool_process(text, output_path, rate, volume, voice):
+    return pool_process_engine.synthesize(text, output_path, rate, volume, voice)
+
+
+class Pyttsx3ProcessPool:
+
+    def __init__(self, workers, driver_name=None):
+
+        self.workers = workers
+        self.driver_name = driver_name
+        self.executor = None
+        self.lock = threading.Lock()
+
+
+    def get_executor(self):
+        with self.lock:
+            if (self.executor is None):
+                # Spawned (not forked) processes, so that no Tk or audio state leaks into the workers
+                self.executor = ProcessPoolExecutor(
+                                                    max_workers=self.workers,
+                                                    mp_context=multiprocessing.get_context("spawn"),
+                                                    initializer=init_pool_process,
+                                                    initargs=(self.driver_name,)
+                                                   )
+            return self.executor
+
+
+    def submit(self, text, output_path, rate, volume, voice):
+        return self.get_executor().submit(synthesize_in_pool_process, text, output_path, rate, volume, voice)
+
+
+    def synthesize(self, text, output_path, rate, volume, voice):
+        return self.submit(text, output_path, rate, volume, voice).result()
+
+
+    def resize(self, workers):
+        if (workers != self.workers):
+            self.shutdown()
+            self.workers = workers
+
+
+    def shutdown(self):
+        with self.lock:
+            if (self.executor is not None):
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+
+# Backends by the name APIInUse holds, in the order they are offered in the settings
+BACKENDS = {}
+
+# Backend plugins that failed to load: (path, error)
+PLUGIN_ERRORS = []
+
+plugins_loaded = False
+
+
+def register_backend(backend_class):
+    # Usable as a class decorator, also by plugins dropped in the user's backends directory
+    BACKENDS[backend_class.name] = backend_class
+    return backend_class
+
+
+def load_backend_plugins(directory=None):
+    # Every .py file in the directory is run once, so that it can register its own backends
+    global plugins_loaded
+    if (plugins_loaded):
+        return
+    plugins_loaded = True
+    if (directory is None):
+        from toiceconfig import USERDIR, DIRS_IN_USERDIR
+        directory = USERDIR+DIRS_IN_USERDIR["BACKENDS"]
+    try:
+        filenames = sorted(_file for _file in os.listdir(directory) if _file.endswith(".py"))
+    except OSError:
+        return
+    for filename in filenames:
+        path = os.path.join(directory, filename)
+        try:
+            spec = importlib.util.spec_from_file_location("toice_backend_"+filename[:-3], path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        except Exception as e:
+            PLUGIN_ERRORS.append((path, e))
+
+
+def get_backends():
+    load_backend_plugins()
+    return BACKENDS
+
+
+def get_available_backends():
+    return [name for name, backend_class in get_backends().items() if backend_class.is_available()]
+
+
+def create_backend(name, pyttsx3_engine=None, pyttsx3_pool=None):
+    # None for a name no backend is registered under
+    backend_class = get_backends().get(name)
+    if (backend_class is None):
+        return None
+    return backend_class(pyttsx3_engine, pyttsx3_pool)
+
+
+def create_standalone_backend(name, workers):
+    # A backend with engines of its own for up to workers texts at once, for the batch and service modes; None for an unknown name
+    backend_class = get_backends().get(name)
+    if (backend_class is None):
+        return None
+    return backend_class.create_standalone(workers)
+
+
+def get_audio_format(name):
+    backend_class = get_backends().get(name)
+    return backend_class.audio_format if backend_class is not None else "wav"
+
+
+class TTSBackend:
+
+    # What a backend writes and how it can be driven. Subclasses set the class attributes and implement synthesize()
+
+    name = None
+    audio_format = "wav"
+
+    # Chunks of a text can be synthesized one after another and played as they arrive
+    streaming = True
+
+    # Instances can run side by side, see get_workers()
+    parallel = False
+
+    # Settings besides ttscache.CACHE_KEY_SETTINGS that change the audio
+    cache_settings = ()
+
+    def __init__(self, pyttsx3_engine=None, pyttsx3_pool=None):
+
+        self.pyttsx3_engine = pyttsx3_engine
+        self.pyttsx3_pool = pyttsx3_pool
+
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+
+    @classmethod
+    def create_standalone(cls, workers):
+        # Backends that need no engine from the GUI are created as they are
+        return cls()
+
+
+    def get_workers(self, config):
+        return 1
+
+
+    def warm_up(self):
+        pass
+
+
+    def synthesize(self, text, output_path, config):
+        # Writes the speech of text to output_path
+        raise NotImplementedError
+
+
+    def submit(self, text, output_path, config):
+        # A future of synthesize(), run right away unless the backend has somewhere to run it in parallel
+        future = Future()
+        try:
+            future.set_result(self.synthesize(text, output_path, config))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+    def shutdown(self):
+        # Stops engines the backend was created with by create_standalone()
+        pass
+
+
+@register_backend
+class Pyttsx3Backend(TTSBackend):
+
+    name = "Pyttsx3"
+    audio_format = "wav"
+    parallel = True
+
+    @classmethod
+    def create_standalone(cls, workers):
+        # With several workers a process pool stands in for the engine: each text is synthesized whole by one of its processes
+        return cls(Pyttsx3ProcessPool(workers) if workers > 1 else Pyttsx3Engine())
+
+
+    def get_properties(self, config):
+        return {
+                    "rate": int(config["Pyttsx3Speed"]),
+                    "volume": float(config["Pyttsx3Volume"])/100,
+                    "voice": int(config["Pyttsx3VoiceID"])
+               }
+
+
+    def get_workers(self, config):
+        return self.pyttsx3_pool.workers if self.pyttsx3_pool is not None else 1
+
+
+    def warm_up(self):
+        if (self.pyttsx3_engine is not None):
+            self.pyttsx3_engine.warm_up()
+
+
+    def synthesize(self, text, output_path, config):
+        # The pyttsx3 drivers can only write to files
+        return self.pyttsx3_engine.synthesize(text, output_path, **self.get_properties(config))
+
+
+    def submit(self, text, output_path, config):
+        if (self.pyttsx3_pool is None):
+            return super().submit(text, output_path, config)
+        return self.pyttsx3_pool.submit(text, output_path, **self.get_properties(config))
+
+
+    def shutdown(self):
+        if (self.pyttsx3_engine is not None):
+            self.pyttsx3_engine.shutdown()
+        if (self.pyttsx3_pool is not None):
+            self.pyttsx3_pool.shutdown()
+
+
+@register_backend
+class GTTSBackend(TTSBackend):
+
+    name = "GTTS"
+    audio_format = "mp3"
+
+    # One client for every synthesis, so that its connections and rate limit are shared; replaced when its settings change
+    client = None
+    client_settings = None
+    client_lock = threading.Lock()
+
+    def get_client(self, config):
+        # gtts and requests are slow to import, so they are loaded here in the worker thread
+        from gttsclient import GTTSClient
+        settings = (int(config.get("GTTSConcurrency", "4")), int(config.get("GTTSRequestsPerSecond", "8")), int(config.get("GTTSRetries", "3")))
+        with GTTSBackend.client_lock:
+            if (GTTSBackend.client_settings != settings):
+                if (GTTSBackend.client is not None):
+                    GTTSBackend.client.close()
+                GTTSBackend.client = GTTSClient(*settings)
+                GTTSBackend.client_settings = settings
+            return GTTSBackend.client
+
+
+    def synthesize(self, text, output_path, config):
+        from gttsclient import GTTSClientError
+        try:
+            return self.get_client(config).write(text, output_path)
+        except GTTSClientError as e:
+            import ttshandler as ttsh
+            raise ttsh.ttsexceptions.GTTSConnectionError(f"Failed to connect to GTTS. Message from API: \"{e}\"")
+
+
+class CommandBackend(TTSBackend):
+
+    # An offline engine run as a separate program for every text; those programs can run side by side
+
+    parallel = True
+
+    # Program looked up on PATH
+    program = None
+
+    # One pool for every command backend, so that SynthesisWorkers bounds the programs running at once; replaced when it changes
+    executor = None
+    executor_workers = None
+    executor_lock = threading.Lock()
+
+    @classmethod
+    def is_available(cls):
+        return (which(cls.program) is not None)
+
+
+    def get_workers(self, config):
+        from toiceconfig import get_synthesis_workers
+        return get_synthesis_workers(config)
+
+
+    def get_command(self, text, output_path, config):
+        raise NotImplementedError
+
+
+    def get_input(self, text):
+        # Text handed to the program on stdin, None when get_command() passes it as an argument
+        return None
+
+
+    def synthesize(self, text, output_path, config):
+        command = self.get_command(text, output_path, config)
+        stdin = self.get_input(text)
+        try:
+            result = subprocess.run(command, input=(stdin.encode("UTF-8") if stdin is not None else None),
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except OSError as e:
+            import ttshandler as ttsh
+            raise ttsh.ttsexceptions.TTSNotGeneratedError(f"Unable to run {self.program}: {e}")
+        if (result.returncode != 0):
+            import ttshandler as ttsh
+            raise ttsh.ttsexceptions.TTSNotGeneratedError(f"{self.program} failed: {result.stderr.decode('UTF-8', 'replace').strip()}")
+        return output_path
+
+
+    def get_executor(self, config):
+        # The programs do the work, a thread only has to wait for each of them
+        workers = self.get_workers(config)
+        with CommandBackend.executor_lock:
+            if (CommandBackend.executor_workers != workers):
+                if (CommandBackend.executor is not None):
+                    # Texts already handed to the old pool are still synthesized by it
+                    CommandBackend.executor.shutdown(wait=False)
+                CommandBackend.executor = ThreadPoolExecutor(max_workers=workers)
+                CommandBackend.executor_workers = workers
+            return CommandBackend.executor
+
+
+    def submit(self, text, output_path, config):
+        return self.get_executor(config).submit(self.synthesize, text, output_path, config)
+
+
+@register_backend
+class EspeakNGBackend(CommandBackend):
+
+    name = "espeak-ng"
+    audio_format = "wav"
+    program = "espeak-ng"
+
+    def get_command(self, text, output_path, config):
+        # Same rate and volume settings as pyttsx3, whose Linux driver is espeak itself; amplitude goes from 0 to 200
+        return [which(self.program) or self.program, "-w", output_path, "-s", config["Pyttsx3Speed"],
+                "-a", str(int(config["Pyttsx3Volume"])*2), "--stdin"]
+
+
+    def get_input(self, text):
+        return text
+
+
+@register_backend
+class PiperBackend(CommandBackend):
+
+    name = "Piper"
+    audio_format = "wav"
+    program = "piper"
+    cache_settings = ("PiperModel",)
+
+    def get_command(self, text, output_path, config):
+        import ttshandler as ttsh
+        if (config.get("PiperModel", "") == ""):
+            raise ttsh.ttsexceptions.TTSNotGeneratedError("No voice model set for Piper, see PiperModel in config.cfg")
+        return [which(self.program) or self.program, "--model", config["PiperModel"], "--output_file", output_path]
+
+
+    def get_input(self, text):
+        return text
@@ -0,0 +1,324 @@
+# -*- coding: utf8 -*-
+
+import os
+import re
+import threading
+from concurrent.futures import wait
+
+from ttsengine import create_backend, create_standalone_backend, get_audio_format
+from audioutils import get_block_frames, get_duration, get_format, join_audio, join_audio_file, write_audio
+from uischeduler import UIWorker
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?।॥])\s+|\s*\n\s*")
+CLAUSE_BOUNDARY = re.compile(r"(?<=[,;:])\s+")
+
+# The first chunk is kept short so that playback can start quickly however long the text is
+FIRST_CHUNK_CHARS = 150
+MAX_CHUNK_CHARS = 1000
+
+# Texts longer than this are always synthesized in chunks, so that no single segment outgrows the memory budget
+LONG_TEXT_CHARS = 20000
+
+
+def pack_pieces(pieces, limit):
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if (current != "" and len(current)+1+len(piece) > limit):
+            chunks.append(current)
+            current = piece
+        else:
+            current = (current+" "+piece).strip()
+    if (current != ""):
+        chunks.append(current)
+    return chunks
+
+
+def split_long_sentence(sentence, limit):
+    if (len(sentence) <= limit):
+        return [sentence]
+    pieces = []
+    for clause in CLAUSE_BOUNDARY.split(sentence):
+        if (len(clause) <= limit):
+            pieces.append(clause)
+        else:
+            pieces.extend(pack_pieces(clause.split(), limit))
+    return pack_pieces(pieces, limit)
+
+
+def split_text(text, first_chunk_chars=FIRST_CHUNK_CHARS, max_chunk_chars=MAX_CHUNK_CHARS):
+    pieces = []
+    for sentence in SENTENCE_BOUNDARY.split(text):
+        sentence = sentence.strip()
+        if (sentence != ""):
+            pieces.extend(split_long_sentence(sentence, max_chunk_chars))
+    if (len(pieces) == 0):
+        return []
+
+    first_chunk_pieces = split_long_sentence(pieces[0], first_chunk_chars)
+    chunks = [first_chunk_pieces[0]]
+    chunks.extend(pack_pieces(first_chunk_pieces[1:]+pieces[1:], max_chunk_chars))
+    return chunks
+
+
+class TTSWorker(UIWorker):
+
+    def __init__(self, text, config, output_path, pyttsx3_engine, pyttsx3_pool=None, cache=None, cache_key=None, pin_output=False, backend=None):
+
+        super().__init__()
+
+        self.text = text
+        self.config = config.copy()
+        self.output_path = output_path
+        self.audio_format = get_format(output_path)
+        self.pyttsx3_engine = pyttsx3_engine
+        self.pyttsx3_pool = pyttsx3_pool
+        self.backend = backend if backend is not None else create_backend(self.config["APIInUse"], pyttsx3_engine, pyttsx3_pool)
+        self.cache = cache
+        self.cache_key = cache_key
+
+        # The cache entry is added pinned, for callers that use the file afterwards and release it themselves
+        self.pin_output = pin_output
+
+        # Synthesized segments stay in memory up to this many bytes, past it they are moved to files and joined on disk
+        self.memory_budget = int(self.config.get("MemoryBudgetMB", "64"))*1024*1024
+
+        # Files the backends write to before their audio is read back into memory, and segments moved out of memory
+        self.temp_paths = []
+
+        # Moved out segments that were posted to the UI as files; the UI removes them once it is done playing them
+        self.posted_paths = []
+
+
+    def remove_temp_files(self):
+        for path in self.temp_paths:
+            if (path in self.posted_paths):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+    def get_temp_path(self, index):
+        # Keeps the extension, the backends append their own otherwise
+        root, extension = os.path.splitext(self.output_path)
+        return "%s.part%d.tmp%s"%(root, index, extension)
+
+
+    def spill_segment(self, audio, index):
+        root, extension = os.path.splitext(self.output_path)
+        path = "%s.segment%d.tmp%s"%(root, index, extension)
+        self.temp_paths.append(path)
+        write_audio(audio, path)
+        return path
+
+
+    def read_output(self, temp_path):
+        # Backends return only once the file is written
+        try:
+            with open(temp_path, 'rb') as audiofile:
+                audio = audiofile.read()
+        except OSError:
+            audio = b""
+        if (len(audio) == 0):
+            import ttshandler as ttsh
+            raise ttsh.ttsexceptions.TTSNotGeneratedError("No audio was written to %s"%temp_path)
+        os.remove(temp_path)
+        return audio
+
+
+    def get_backend(self):
+        if (self.backend is None):
+            import ttshandler as ttsh
+            raise ttsh.ttsexceptions.UnknownAPIError(f"Unknown TTS API: '{self.config['APIInUse']}'")
+        return self.backend
+
+
+    def synthesize(self, text, index):
+        # Returns the encoded audio of text. Every backend writes to a file, which is read back into memory
+        backend = self.get_backend()
+        temp_path = self.get_temp_path(index)
+        self.temp_paths.append(temp_path)
+        backend.synthesize(text, temp_path, self.config)
+        return self.read_output(temp_path)
+
+
+    def synthesize_serially(self, chunks):
+        for i in range(len(chunks)):
+            if (self.is_cancelled()):
+                return
+            yield self.synthesize(chunks[i], i)
+
+
+    def synthesize_in_parallel(self, chunks):
+        # Every chunk is submitted to the backend at once, results are handed out in text order
+        backend = self.get_backend()
+        futures = []
+        for i in range(len(chunks)):
+            temp_path = self.get_temp_path(i)
+            self.temp_paths.append(temp_path)
+            futures.append(backend.submit(chunks[i], temp_path, self.config))
+        try:
+            for i in range(len(futures)):
+                while (not futures[i].done()):
+                    if (self.is_cancelled()):
+                        return
+                    wait([futures[i]], timeout=0.1)
+                yield self.read_output(futures[i].result())
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+    def save_output(self, audio, duration):
+        # Off the playback path: the audio is already playing from memory by the time it reaches the disk
+        if (audio != self.output_path):
+            write_audio(audio, self.output_path)
+        self.save_sidecars(audio)
+        if (self.cache is not None):
+            self.cache.add(self.cache_key, self.output_path, duration, self.pin_output)
+
+
+    def save_sidecars(self, audio):
+        # The waveform's peaks and the seek index are computed here once, so that the UI only ever reads them from their files
+        try:
+            import waveform
+            waveform.save_peaks(waveform.compute_peaks(audio, self.audio_format), waveform.get_peak_path(self.output_path))
+        except Exception:
+            pass
+        try:
+            import seekindex
+            seekindex.save_seek_index(seekindex.build_seek_index(audio, self.audio_format), seekindex.get_seek_path(self.output_path))
+        except Exception:
+            pass
+
+
+    def run(self):
+        # The backend's capabilities pick the route: chunks played as they arrive, synthesized side by side, or neither
+        streaming = (self.config.get("StreamingSynthesis", "0") == "1" and (self.backend is None or self.backend.streaming))
+        parallel = (self.backend is not None and self.backend.parallel and self.backend.get_workers(self.config) > 1)
+
+        chunks = []
+        if (streaming or parallel or len(self.text) > LONG_TEXT_CHARS):
+            chunks = split_text(self.text)
+        if (len(chunks) == 0):
+            chunks = [self.text]
+
+        self.post("progress", 0, len(chunks))
+        segments = []
+        held_bytes = 0
+        spilled = False
+        try:
+            if (parallel and len(chunks) > 1):
+                segment_audio = self.synthesize_in_parallel(chunks)
+            else:
+                segment_audio = self.synthesize_serially(chunks)
+            for audio in segment_audio:
+                index = len(segments)
+                if (streaming):
+                    # Probed here, off the UI thread, so that playback never has to decode the audio for its length
+                    segment_duration = get_duration(audio, self.audio_format)
+                if (spilled or held_bytes+len(audio) > self.memory_budget):
+                    # Over budget: everything held so far goes to disk, and so does every later segment
+                    if (not spilled):
+                        spilled = True
+                        for i in range(index):
+                            segments[i] = self.spill_segment(segments[i], i)
+                    segments.append(self.spill_segment(audio, index))
+                else:
+                    held_bytes += len(audio)
+                    segments.append(audio)
+                if (streaming):
+                    # Past the budget the UI gets the segment's file, so that it holds no more of the speech in memory than this worker
+                    if (spilled):
+                        self.posted_paths.append(segments[index])
+                    self.post("segment", index, segments[index], segment_duration)
+                audio = None
+                self.post("progress", len(segments), len(chunks))
+            audio = None
+            duration = None
+            if (not self.is_cancelled()):
+                if (spilled):
+                    audio = join_audio_file(segments, self.audio_format, self.output_path, get_block_frames(self.memory_budget))
+                else:
+                    audio = segments[0] if len(segments) == 1 else join_audio(segments, self.audio_format)
+                duration = get_duration(audio, self.audio_format)
+        except Exception as e:
+            # The UI drops the speech on an error, the segment files it was sent go with it
+            self.posted_paths = []
+            self.post("error", e)
+            return
+        finally:
+            if (self.is_cancelled()):
+                self.posted_paths = []
+            self.remove_temp_files()
+
+        if (self.is_cancelled()):
+            return
+
+        if (not streaming):
+            self.post("segment", 0, audio, duration)
+        self.post("done", audio, duration)
+
+        try:
+            self.save_output(audio, duration)
+            self.post("saved", self.output_path)
+        except Exception as e:
+            self.post("error", e)
+
+
+class CachedSynthesizer:
+
+    # Blocking synthesis through the cache, for callers without a UI thread (batch and service modes)
+
+    def __init__(self, cache, workers=1, backends=None):
+
+        self.cache = cache
+        self.workers = workers
+
+        # Backends by name, each created from the registry with engines of its own when a text first asks for it
+        self.backends = dict(backends) if backends is not None else {}
+        self.backends_lock = threading.Lock()
+
+
+    def get_backend(self, name):
+        with self.backends_lock:
+            if (name not in self.backends):
+                self.backends[name] = create_standalone_backend(name, self.workers)
+            return self.backends[name]
+
+
+    def get_output_path(self, cache_key, config):
+        return self.cache.new_path(cache_key, "."+get_audio_format(config["APIInUse"]))
+
+
+    def synthesize(self, text, config, cache_key=None, pin=False):
+        # Returns the path of the synthesized audio and whether it came from the cache. With pin, the file
+        # cannot be evicted until it is passed to release(), however many other syntheses add to the cache meanwhile
+        if (cache_key is None):
+            cache_key = self.cache.make_key(text, config)
+        ttspath = self.cache.lookup(cache_key, pin)
+        if (ttspath is not None):
+            return ttspath, True
+
+        config = config.copy()
+        config["StreamingSynthesis"] = "0"
+        worker = TTSWorker(text, config, self.get_output_path(cache_key, config), None, cache=self.cache, cache_key=cache_key, pin_output=pin,
+                           backend=self.get_backend(config["APIInUse"]))
+        worker.run()
+        for message in worker.poll():
+            if (message[0] == "error"):
+                raise message[1]
+        return worker.output_path, False
+
+
+    def release(self, path):
+        self.cache.release(path)
+
+
+    def shutdown(self):
+        with self.backends_lock:
+            for backend in self.backends.values():
+                if (backend is not None):
+                    backend.shutdown()
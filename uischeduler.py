@@ -0,0 +1,103 @@
+# -*- coding: utf8 -*-
+
+import time
+import queue
+import threading
+
+
+class UIScheduler:
+
+    # Every deferred UI callback goes through one named job table, so that nothing runs unless an event asked for it
+
+    def __init__(self, widget):
+
+        self.widget = widget
+
+        # name -> Tk after() id of the pending job
+        self.jobs = {}
+
+        # name -> [calls, total seconds, longest seconds]
+        self.stats = {}
+
+
+    def run(self, name, callback, args):
+        self.jobs.pop(name, None)
+        start_time = time.perf_counter()
+        try:
+            callback(*args)
+        finally:
+            elapsed = time.perf_counter()-start_time
+            stats = self.stats.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+
+
+    def request(self, name, callback, *args):
+        # Runs callback once the event loop is idle; requests made before then are merged into that one run
+        if (name not in self.jobs):
+            self.jobs[name] = self.widget.after_idle(self.run, name, callback, args)
+
+
+    def call_later(self, name, delay, callback, *args):
+        # Replaces any pending job of the same name
+        self.cancel(name)
+        self.jobs[name] = self.widget.after(delay, self.run, name, callback, args)
+
+
+    def cancel(self, name):
+        job = self.jobs.pop(name, None)
+        if (job is not None):
+            self.widget.after_cancel(job)
+
+
+    def pending(self, name):
+        return (name in self.jobs)
+
+
+    def cancel_all(self):
+        for name in list(self.jobs):
+            self.cancel(name)
+
+
+    def report(self):
+        lines = []
+        for name, (calls, total, longest) in sorted(self.stats.items(), key=lambda item: item[1][1], reverse=True):
+            lines.append("%s: %d calls, %.1f ms total, %.2f ms average, %.2f ms longest"%(name, calls, total*1000, total*1000/calls, longest*1000))
+        return lines
+
+
+class UIWorker(threading.Thread):
+
+    # A job run off the UI thread, which reports back through messages drained with poll() from a scheduler callback.
+    # Once cancelled, nothing more is posted, so that the UI never acts on a job it has given up on
+
+    def __init__(self):
+
+        super().__init__(daemon=True)
+
+        self.messages = queue.Queue()
+        self.cancelled = threading.Event()
+
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+    def is_cancelled(self):
+        return self.cancelled.is_set()
+
+
+    def post(self, *message):
+        if (not self.is_cancelled()):
+            self.messages.put(message)
+
+
+    def poll(self):
+        messages = []
+        while (True):
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                break
+        return messages
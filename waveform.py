@@ -0,0 +1,188 @@
+# -*- coding: utf8 -*-
+
+import os
+import wave
+import struct
+import threading
+import subprocess
+
+import numpy as np
+
+from audioutils import feed_pipe, get_ffmpeg, get_format, open_audio
+
+# Source samples reduced into each min/max pair of a peak file
+SAMPLES_PER_PEAK = 256
+
+# Peaks computed per NumPy reduction while reading the audio
+PEAKS_PER_BLOCK = 1024
+
+# MP3 is decoded by ffmpeg to mono at this rate for its peaks, the waveform has no use for more
+MP3_PEAK_SAMPLE_RATE = 11025
+
+PEAK_EXTENSION = ".peaks"
+
+# Magic, sample rate of the source, samples per peak and number of peaks, followed by one (min, max) int8 pair per peak
+PEAK_FILE_HEADER = struct.Struct("<4sIII")
+PEAK_FILE_MAGIC = b"TPK1"
+
+
+class Peaks:
+
+    # Minimum and maximum of every SAMPLES_PER_PEAK samples, scaled to int8
+
+    def __init__(self, mins, maxs, sample_rate, samples_per_peak=SAMPLES_PER_PEAK):
+
+        self.mins = mins
+        self.maxs = maxs
+        self.sample_rate = sample_rate
+        self.samples_per_peak = samples_per_peak
+
+
+    def __len__(self):
+        return len(self.mins)
+
+
+    def get_duration(self):
+        return len(self.mins)*self.samples_per_peak*1000//max(self.sample_rate, 1)
+
+
+    def rebucket(self, columns):
+        # Merges the peaks into at most columns buckets, so that a resize never needs the audio again
+        count = len(self.mins)
+        if (count == 0 or columns <= 0):
+            return (np.zeros(0, np.int8), np.zeros(0, np.int8))
+        if (columns >= count):
+            return (self.mins, self.maxs)
+        starts = np.linspace(0, count, columns, endpoint=False).astype(np.intp)
+        return (np.minimum.reduceat(self.mins, starts), np.maximum.reduceat(self.maxs, starts))
+
+
+def get_peak_path(audio_path):
+    return os.path.splitext(audio_path)[0]+PEAK_EXTENSION
+
+
+def to_int16(data, sample_width):
+    if (sample_width == 1):
+        return ((np.frombuffer(data, np.uint8).astype(np.int16)-128) << 8)
+    elif (sample_width == 2):
+        return np.frombuffer(data, "<i2")
+    elif (sample_width == 3):
+        # The two most significant bytes of every little endian 24 bit sample
+        return np.frombuffer(data, np.uint8).reshape(-1, 3)[:, 1:].copy().view("<i2").reshape(-1)
+    return (np.frombuffer(data, "<i4") >> 16).astype(np.int16)
+
+
+def read_wav_blocks(source, block_frames):
+    # Yields (channels, interleaved int16 samples) a block of frames at a time
+    with wave.open(open_audio(source), 'rb') as wavfile:
+        channels = wavfile.getnchannels()
+        sample_width = wavfile.getsampwidth()
+        while (True):
+            frames = wavfile.readframes(block_frames)
+            if (not frames):
+                break
+            yield (channels, to_int16(frames, sample_width))
+
+
+def read_decoded_blocks(source, audio_format, block_frames):
+    # Anything other than WAV is decoded by ffmpeg to mono 16 bit PCM, read from its stdout a block at a time
+    command = [get_ffmpeg(), "-hide_banner", "-loglevel", "error", "-f", audio_format,
+               "-i", source if isinstance(source, str) else "pipe:0",
+               "-vn", "-ac", "1", "-ar", str(MP3_PEAK_SAMPLE_RATE), "-f", "s16le", "pipe:1"]
+    process = subprocess.Popen(command, stdin=(subprocess.DEVNULL if isinstance(source, str) else subprocess.PIPE),
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if (process.stdin is not None):
+        threading.Thread(target=feed_pipe, args=(source, process.stdin), daemon=True).start()
+    try:
+        while (True):
+            data = process.stdout.read(block_frames*2)
+            if (not data):
+                break
+            yield (1, np.frombuffer(data[:len(data)//2*2], "<i2"))
+    finally:
+        process.stdout.close()
+        if (process.wait() != 0):
+            raise RuntimeError("ffmpeg could not decode the audio for its waveform")
+
+
+def get_sample_rate(source, audio_format):
+    if (audio_format == "wav"):
+        with wave.open(open_audio(source), 'rb') as wavfile:
+            return wavfile.getframerate()
+    return MP3_PEAK_SAMPLE_RATE
+
+
+def compute_peaks(source, audio_format=None):
+    # Reads the audio once, reducing whole blocks of frames to their min/max pairs with NumPy
+    if (audio_format is None):
+        audio_format = get_format(source)
+    block_frames = SAMPLES_PER_PEAK*PEAKS_PER_BLOCK
+    if (audio_format == "wav"):
+        blocks = read_wav_blocks(source, block_frames)
+    else:
+        blocks = read_decoded_blocks(source, audio_format, block_frames)
+
+    mins = []
+    maxs = []
+    pending = np.zeros(0, np.int16)
+    channels = 1
+    for channels, samples in blocks:
+        if (len(pending) != 0):
+            samples = np.concatenate((pending, samples))
+        # Interleaved frames are contiguous, so one row per peak covers every channel
+        row_size = SAMPLES_PER_PEAK*channels
+        usable = len(samples)//row_size*row_size
+        rows = samples[:usable].reshape(-1, row_size)
+        mins.append(rows.min(axis=1))
+        maxs.append(rows.max(axis=1))
+        pending = samples[usable:]
+    if (len(pending) != 0):
+        mins.append(pending.min(keepdims=True))
+        maxs.append(pending.max(keepdims=True))
+    if (len(mins) == 0):
+        return Peaks(np.zeros(0, np.int8), np.zeros(0, np.int8), get_sample_rate(source, audio_format))
+    return Peaks((np.concatenate(mins) >> 8).astype(np.int8), (np.concatenate(maxs) >> 8).astype(np.int8), get_sample_rate(source, audio_format))
+
+
+def save_peaks(peaks, path):
+    pairs = np.empty(len(peaks)*2, np.int8)
+    pairs[0::2] = peaks.mins
+    pairs[1::2] = peaks.maxs
+    temp_file = path+".tmp"
+    with open(temp_file, 'wb') as peakfile:
+        peakfile.write(PEAK_FILE_HEADER.pack(PEAK_FILE_MAGIC, peaks.sample_rate, peaks.samples_per_peak, len(peaks)))
+        peakfile.write(pairs.tobytes())
+    os.replace(temp_file, path)
+    return path
+
+
+def load_peaks(path):
+    # None when there is no usable peak file
+    try:
+        with open(path, 'rb') as peakfile:
+            magic, sample_rate, samples_per_peak, count = PEAK_FILE_HEADER.unpack(peakfile.read(PEAK_FILE_HEADER.size))
+            pairs = np.frombuffer(peakfile.read(count*2), np.int8)
+    except (OSError, struct.error):
+        return None
+    if (magic != PEAK_FILE_MAGIC or len(pairs) != count*2):
+        return None
+    return Peaks(pairs[0::2], pairs[1::2], sample_rate, samples_per_peak)
+
+
+def get_waveform_polygon(peaks, width, height):
+    # Canvas coordinates outlining the waveform: the maxima left to right, then the minima right to left
+    mins, maxs = peaks.rebucket(width)
+    columns = len(mins)
+    if (columns == 0):
+        return []
+    middle = height/2
+    scale = (height/2-2)/128
+    x = np.linspace(0, width-1, columns) if columns > 1 else np.zeros(1)
+    top = middle-(maxs.astype(np.float32)+1)*scale
+    bottom = middle-(mins.astype(np.float32)-1)*scale
+    coords = np.empty((columns*2, 2), np.float32)
+    coords[:columns, 0] = x
+    coords[:columns, 1] = top
+    coords[columns:, 0] = x[::-1]
+    coords[columns:, 1] = bottom[::-1]
+    return coords.round(1).reshape(-1).tolist()